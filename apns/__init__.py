@@ -3,8 +3,21 @@
 
 from .client import Client, APNS_SANDBOX_HOST, APNS_PRODUCTION_HOST, \
     DEFAULT_PORT, ALTERNATE_PORT  # flake8: noqa
-from .message import Message, Alert, HIGH_PRIORITY, LOW_PRIORITY, \
-    EXPIRE_IMMEDIATELY  # flake8: noqa
+from .message import Message, FrozenMessage, RawMessage, Alert, \
+    HIGH_PRIORITY, LOW_PRIORITY, EXPIRE_IMMEDIATELY  # flake8: noqa
+from .catalog import AlertCatalog  # flake8: noqa
+from .scheduler import SendQueue  # flake8: noqa
+from .throttle import BackgroundThrottler  # flake8: noqa
+from .partition import HashRing  # flake8: noqa
+from .reader import TokenReader  # flake8: noqa
+from .ring import RingBuffer  # flake8: noqa
+from .router import Router  # flake8: noqa
+from .sender import Sender  # flake8: noqa
+from .tokens import DeviceToken, TokenArray, TokenSet, validate_tokens, \
+    filter_tokens  # flake8: noqa
 from .ssl_context import make_ssl_context, make_ossl_context  # flake8: noqa
 
-__all__ = ('Client', 'Message', 'Alert')
+__all__ = ('Client', 'Message', 'FrozenMessage', 'RawMessage', 'Alert',
+           'AlertCatalog', 'SendQueue', 'BackgroundThrottler', 'Router',
+           'DeviceToken', 'TokenArray', 'TokenSet', 'TokenReader', 'Sender',
+           'RingBuffer', 'HashRing')
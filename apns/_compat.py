@@ -7,12 +7,16 @@ PY2 = sys.version_info[0] == 2
 
 
 if PY2:
+    import Queue as queue  # noqa
+    import SocketServer as socketserver  # noqa
     iterkeys = lambda x: x.iterkeys()
     itervalues = lambda x: x.itervalues()
     iteritems = lambda x: x.iteritems()
     binary_type = str
     text_type = unicode  # noqa
 else:
+    import queue  # noqa
+    import socketserver  # noqa
     iterkeys = lambda x: x.keys()
     itervalues = lambda x: x.value()
     iteritems = lambda x: x.items()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Pre-encoded alerts for campaigns sent in many locales."""
+
+from .message import Alert, FrozenMessage, RawMessage, _LRUCache, _dumps
+
+__all__ = ('AlertCatalog',)
+
+# The number of frozen base messages whose encoded parts are kept
+_BASE_CACHE_SIZE = 64
+
+
+class AlertCatalog(object):
+    """A collection of alerts by locale and template, encoded once.
+
+    Building the ``alert`` dictionary of an :class:`.Alert` and encoding it
+    for every message is wasted work when a campaign sends the same few
+    texts to millions of devices. The catalog encodes each alert when it is
+    added. :meth:`message` then looks up the encoded alert of a locale and
+    splices it into the encoded ``aps`` dictionary and other payload keys of
+    a base message, which are encoded once per :class:`.FrozenMessage`,
+    giving a :class:`.RawMessage`::
+
+        catalog = AlertCatalog(default_locale='en')
+        catalog.add('en', Alert('Sale', 'Ends tonight'), template='sale')
+        catalog.add('fr', Alert('Soldes', 'Dernier jour'), template='sale')
+
+        base = FrozenMessage(topic='com.example.app', sound='default')
+        for token, locale in audience:
+            client.push(catalog.message(base, locale, 'sale'), token)
+
+    A locale without an alert falls back to its language (``fr`` for
+    ``fr-CA`` or ``fr_CA``), and then to ``default_locale``.
+
+    :param default_locale: (optional) The locale used when no alert exists
+        for the requested locale or its language.
+    """
+    def __init__(self, default_locale=None):
+        self.default_locale = default_locale
+        self._fragments = {}
+        # (locale, template) -> fragment found for it by falling back
+        self._fallbacks = {}
+        # FrozenMessage -> encoded parts of its payload
+        self._bases = _LRUCache(_BASE_CACHE_SIZE)
+
+    def __len__(self):
+        return len(self._fragments)
+
+    def __contains__(self, key):
+        return key in self._fragments
+
+    def add(self, locale, alert, template=None):
+        """Add the alert of a template in a locale, replacing any previous
+        one.
+
+        :param locale: The locale, such as ``'en'`` or ``'pt-BR'``.
+        :param alert: An :class:`.Alert`, or a string for a simple alert.
+        :param template: (optional) The name of the template.
+        """
+        if isinstance(alert, Alert):
+            alert = alert.payload
+        self._fragments[(locale, template)] = _dumps(alert)
+        self._fallbacks.clear()
+
+    def fragment(self, locale, template=None):
+        """The encoded ``alert`` value of a template for a locale.
+
+        :raises: :class:`KeyError` if there is no alert for the locale, its
+            language or the default locale.
+        """
+        key = (locale, template)
+        fragment = self._fragments.get(key) or self._fallbacks.get(key)
+        if fragment is not None:
+            return fragment
+        for fallback in (_language(locale), self.default_locale):
+            fragment = self._fragments.get((fallback, template))
+            if fragment is not None:
+                self._fallbacks[key] = fragment
+                return fragment
+        raise KeyError(key)
+
+    def message(self, base, locale, template=None):
+        """Create the message of a template for a locale.
+
+        :param base: A :class:`.Message` without an alert, providing the rest
+            of the payload and the headers. The payload of a
+            :class:`.FrozenMessage` is encoded only once, so one should be
+            used for all the messages of a campaign.
+        :param locale: The locale of the device.
+        :param template: (optional) The name of the template.
+        :return: A :class:`.RawMessage`.
+        :raises: :class:`KeyError` if there is no alert for the locale.
+        """
+        assert base.alert is None, 'The base message already has an alert'
+        fragment = self.fragment(locale, template)
+        aps, extra = self._base_parts(base)
+        payload = b''.join((
+            b'{"aps":{"alert":', fragment, b',' if aps else b'', aps, b'}',
+            b',' if extra else b'', extra, b'}',
+        ))
+        return RawMessage(
+            payload,
+            id=base.id,
+            topic=base.topic,
+            expiration=base._expiration,
+            priority=base.priority,
+            collapse_id=base.collapse_id,
+        )
+
+    def _base_parts(self, base):
+        """The encoded members of the ``aps`` dictionary of a base message
+        and its other payload members, each without the enclosing braces.
+        """
+        frozen = isinstance(base, FrozenMessage)
+        if frozen:
+            parts = self._bases.get(base)
+            if parts is not None:
+                return parts
+        payload = base.payload
+        aps = payload.pop('aps', None) or {}
+        parts = (_dumps(aps)[1:-1], _dumps(payload)[1:-1])
+        if frozen:
+            self._bases.put(base, parts)
+        return parts
+
+
+def _language(locale):
+    return locale.replace('_', '-').split('-', 1)[0]
@@ -0,0 +1,307 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Command line bulk sender.
+
+Run ``python -m apns --help`` for usage.
+"""
+
+import argparse
+import json
+import logging
+import sys
+import threading
+import time
+
+from ._compat import queue
+from .client import Client, DEFAULT_PORT, DEFAULT_WINDOW
+from .exceptions import Unregistered
+from .message import RawMessage, HIGH_PRIORITY, LOW_PRIORITY
+from .reader import TokenReader, DEFAULT_CHUNK_SIZE
+from .ssl_context import make_ssl_context
+
+__all__ = ('main',)
+
+log = logging.getLogger(__name__)
+
+# The reason written for tokens which are not valid, as APNs reports them
+_INVALID_REASON = 'BadDeviceToken'
+
+_PRIORITIES = {
+    'high': HIGH_PRIORITY,
+    'low': LOW_PRIORITY,
+}
+
+
+class RateLimiter(object):
+    """A token bucket limiting the number of messages sent per second,
+    shared by all connections.
+
+    :param rate: The maximum number of messages per second, or ``0`` for no
+        limit.
+    """
+    def __init__(self, rate, clock=time.time, sleep=time.sleep):
+        self.rate = rate
+        self.clock = clock
+        self.sleep = sleep
+        self._allowance = rate
+        self._last = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Wait until another message may be sent."""
+        if not self.rate:
+            return
+        with self._lock:
+            now = self.clock()
+            self._allowance = min(
+                self.rate,
+                self._allowance + (now - self._last) * self.rate
+            )
+            self._last = now
+            self._allowance -= 1
+            wait = -self._allowance / self.rate
+        if wait > 0:
+            self.sleep(wait)
+
+
+class Stats(object):
+    """Thread safe counters of the results of a bulk send."""
+
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self.started = clock()
+        self.sent = 0
+        self.failed = 0
+        self.unregistered = 0
+        self._lock = threading.Lock()
+
+    def record(self, sent, failed, unregistered):
+        with self._lock:
+            self.sent += sent
+            self.failed += failed
+            self.unregistered += unregistered
+
+    def summary(self):
+        with self._lock:
+            sent, failed = self.sent, self.failed
+            unregistered = self.unregistered
+        elapsed = max(self.clock() - self.started, 1e-6)
+        error_rate = 100.0 * failed / sent if sent else 0.0
+        return (
+            'sent %d (%.0f/s), failed %d (%.2f%%), unregistered %d' %
+            (sent, sent / elapsed, failed, error_rate, unregistered)
+        )
+
+
+class BulkSender(object):
+    """Sends one message to many tokens over several connections.
+
+    Chunks of tokens are put on a bounded queue and taken by one worker
+    thread per connection, which sends them with :meth:`.Client.push_many`.
+
+    :param clients: The :class:`.Client` objects to send with.
+    :param message: The :class:`.Message` to send.
+    :param window: The number of requests in flight per connection.
+    :param rate: The maximum total number of messages per second, or ``0``.
+    :param failed: (optional) A text file to which failed tokens are written,
+        with the reason of the failure, including the invalid tokens passed
+        to :meth:`record_invalid`.
+    :param unregistered: (optional) A text file to which unregistered tokens
+        are written, with the time since which they are unregistered.
+    """
+    def __init__(self, clients, message, window=DEFAULT_WINDOW, rate=0,
+                 failed=None, unregistered=None):
+        self.clients = clients
+        self.message = message
+        self.window = window
+        self.limiter = RateLimiter(rate)
+        self.stats = Stats()
+        self.failed = failed
+        self.unregistered = unregistered
+
+        self._chunks = queue.Queue(maxsize=2 * len(clients))
+        self._output_lock = threading.Lock()
+
+    def run(self, chunks):
+        """Send the message to every token in an iterable of token chunks,
+        and wait until all sends are done.
+        """
+        workers = [
+            threading.Thread(target=self._work, args=(client,))
+            for client in self.clients
+        ]
+        for worker in workers:
+            worker.daemon = True
+            worker.start()
+        for chunk in chunks:
+            self._chunks.put(chunk)
+        for _ in workers:
+            self._chunks.put(None)
+        for worker in workers:
+            worker.join()
+
+    def record_invalid(self, tokens):
+        """Write tokens which were not sent because they are not valid to
+        the ``failed`` file.
+        """
+        if self.failed is None:
+            return
+        with self._output_lock:
+            for token in tokens:
+                self.failed.write('%s\t%s\n' % (token, _INVALID_REASON))
+
+    def _notifications(self, chunk):
+        for token in chunk:
+            self.limiter.acquire()
+            yield self.message, token
+
+    def _work(self, client):
+        while True:
+            chunk = self._chunks.get()
+            if chunk is None:
+                return
+            try:
+                results = client.push_many(self._notifications(chunk),
+                                           window=self.window)
+            except Exception as e:
+                log.exception('Sending a chunk of %d tokens failed',
+                              len(chunk))
+                results = [(token, e) for token in chunk]
+            self._record(results)
+
+    def _record(self, results):
+        failed = []
+        unregistered = []
+        for token, result in results:
+            if isinstance(result, Unregistered):
+                unregistered.append((token, result.unavailable_since))
+            elif isinstance(result, Exception):
+                failed.append((token, type(result).__name__))
+
+        self.stats.record(len(results), len(failed), len(unregistered))
+        with self._output_lock:
+            if self.failed is not None:
+                for token, reason in failed:
+                    self.failed.write('%s\t%s\n' % (token, reason))
+            if self.unregistered is not None:
+                for token, since in unregistered:
+                    self.unregistered.write(
+                        '%s\t%s\n' % (token, since.isoformat())
+                    )
+
+
+def _report(stats, interval, done, out):
+    while not done.wait(interval):
+        out.write('\r' + stats.summary())
+        out.flush()
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog='python -m apns',
+        description='Send a push notification to many devices.',
+    )
+    parser.add_argument('--cert', required=True,
+                        help='Path to the certificate file (PEM).')
+    parser.add_argument('--key', help='Path to the private key file (PEM).')
+    parser.add_argument('--password', help='Password of the private key.')
+    parser.add_argument('--payload', required=True,
+                        help='Path to a JSON file with the APNs payload.')
+    parser.add_argument('--tokens', default='-',
+                        help='Path to the token file, or - for stdin.')
+    parser.add_argument('--delimiter',
+                        help='Column delimiter of the token file.')
+    parser.add_argument('--column', type=int, default=0,
+                        help='Column of the token file holding the token.')
+    parser.add_argument('--topic', help='The apns-topic of the message.')
+    parser.add_argument('--priority', choices=sorted(_PRIORITIES),
+                        default='high')
+    parser.add_argument('--expiration', type=int, default=0,
+                        help='Expiration time as a UNIX timestamp.')
+    parser.add_argument('--collapse-id', help='The apns-collapse-id.')
+    parser.add_argument('--production', action='store_true',
+                        help='Use the production gateway instead of the '
+                             'sandbox.')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--connections', type=int, default=1,
+                        help='Number of connections to the gateway.')
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_WINDOW,
+                        help='Requests in flight per connection.')
+    parser.add_argument('--rate', type=float, default=0,
+                        help='Maximum messages per second (0: no limit).')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument('--dedupe', action='store_true',
+                        help='Skip duplicate tokens.')
+    parser.add_argument('--failed',
+                        help='File to write failed tokens to.')
+    parser.add_argument('--unregistered',
+                        help='File to write unregistered tokens to.')
+    parser.add_argument('--stats-interval', type=float, default=1.0,
+                        help='Seconds between progress reports.')
+    return parser
+
+
+def main(argv=None, stdin=None, stderr=None):
+    """Run the bulk sender with command line arguments ``argv``."""
+    args = build_parser().parse_args(argv)
+    stdin = stdin or getattr(sys.stdin, 'buffer', sys.stdin)
+    stderr = stderr or sys.stderr
+
+    with open(args.payload, 'rb') as f:
+        payload = f.read()
+    # Fail early on invalid JSON, but send the payload as it is
+    json.loads(payload.decode('utf-8'))
+    message = RawMessage(
+        payload,
+        topic=args.topic,
+        priority=_PRIORITIES[args.priority],
+        expiration=args.expiration,
+        collapse_id=args.collapse_id,
+    )
+
+    ssl_context = make_ssl_context(args.cert, args.key,
+                                   password=args.password)
+    clients = [
+        Client(ssl_context, sandbox=not args.production, port=args.port)
+        for _ in range(args.connections)
+    ]
+
+    outputs = []
+    failed = unregistered = None
+    if args.failed:
+        failed = open(args.failed, 'w')
+        outputs.append(failed)
+    if args.unregistered:
+        unregistered = open(args.unregistered, 'w')
+        outputs.append(unregistered)
+
+    sender = BulkSender(clients, message, window=args.concurrency,
+                        rate=args.rate, failed=failed,
+                        unregistered=unregistered)
+    source = stdin if args.tokens == '-' else args.tokens
+    reader = TokenReader(source, chunk_size=args.chunk_size,
+                         delimiter=args.delimiter, column=args.column,
+                         validate=True, dedupe=args.dedupe,
+                         on_invalid=sender.record_invalid)
+
+    done = threading.Event()
+    reporter = threading.Thread(
+        target=_report,
+        args=(sender.stats, args.stats_interval, done, stderr)
+    )
+    reporter.daemon = True
+    reporter.start()
+    try:
+        sender.run(reader)
+    finally:
+        done.set()
+        reporter.join()
+        for output in outputs:
+            output.close()
+        for client in clients:
+            client.close()
+
+    stderr.write('\r%s, invalid %d, duplicates %d\n' % (
+        sender.stats.summary(), reader.invalid, reader.duplicates))
+    return 0
@@ -3,12 +3,15 @@
 
 import json
 import logging
+import socket
+import time
+from collections import deque
 from uuid import UUID
 
-from hyper import HTTP20Connection
-
 from ._compat import binary_type
-from .exceptions import _map
+from .exceptions import _map, PushTimeout
+from .tokens import DeviceToken
+from .transport import DEFAULT_TRANSPORT
 
 log = logging.getLogger(__name__)
 log.setLevel(logging.DEBUG)
@@ -28,6 +31,9 @@ DEFAULT_PORT = 443
 #: port is blocked for some reason.
 ALTERNATE_PORT = 2197
 
+#: The default number of requests :meth:`Client.push_many` keeps in flight.
+DEFAULT_WINDOW = 100
+
 
 class Client(object):
     """Object representing a connection to an APNS gateway server.
@@ -40,18 +46,26 @@ class Client(object):
     :param port: (optional) The port to use when connecting to the gateway.
         Defaults to :data:`.DEFAULT_PORT` (443), but may also be
         :data:`.ALTERNATE_PORT` (2197).
+    :param transport: (optional) The :class:`.Transport` class used for the
+        HTTP/2 connection. Defaults to :data:`.DEFAULT_TRANSPORT`.
+    :param transport_options: (optional) A dictionary of additional keyword
+        arguments for the transport, such as the flow control windows of
+        :class:`.H2Transport`::
+
+            Client(ssl_context, transport_options={
+                'initial_window_size': 4 * 1024 * 1024,
+            })
     """
-    def __init__(self, ssl_context, sandbox=True, port=DEFAULT_PORT):
+    def __init__(self, ssl_context, sandbox=True, port=DEFAULT_PORT,
+                 transport=None, transport_options=None):
         self.sandbox = sandbox
 
         assert port in (DEFAULT_PORT, ALTERNATE_PORT), 'Invalid port number'
         self._port = port
 
-        self._connection = HTTP20Connection(
-            self.host,
-            port=self.port,
-            ssl_context=ssl_context
-        )
+        transport = transport or DEFAULT_TRANSPORT
+        self._connection = transport(self.host, self.port, ssl_context,
+                                     **(transport_options or {}))
 
     @property
     def port(self):
@@ -63,12 +77,17 @@ class Client(object):
         """The APNS gateway server hostname."""
         return [APNS_PRODUCTION_HOST, APNS_SANDBOX_HOST][self.sandbox]
 
-    def push(self, message, token):
+    def push(self, message, token, timeout=None):
         """Send a message to a device.
 
 
         :param message: A :class:`.Message` object.
-        :param token: Device token to push the message to.
+        :param token: Device token to push the message to, as a hex string or
+            a :class:`.DeviceToken`.
+        :param timeout: (optional) The maximum number of seconds to wait for
+            the response. When it expires, the request is cancelled with an
+            HTTP/2 ``RST_STREAM`` frame and :class:`.PushTimeout` is raised.
+            The connection stays open for other requests.
         :return: A :class:`~uuid.UUID` that identifies the notification. This
             will be the same as :attr:`.Message.id` if you provided and ID for
             the message. If no ID was provided, the APNs server will create one
@@ -76,19 +95,156 @@ class Client(object):
         :raises: :class:`.APNSException` if the push was not
             successful.
         """
+        deadline = None if timeout is None else time.time() + timeout
+        stream_id = self._send(message, token)
+        result = self._get_result(token, stream_id, deadline)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def push_many(self, notifications, window=DEFAULT_WINDOW, timeout=None):
+        """Send many messages, keeping up to ``window`` requests in flight on
+        the connection at once instead of waiting for each response before
+        sending the next request.
+
+        Errors returned by APNs for individual messages do not stop the
+        batch; they are returned in place of the notification ID::
+
+            results = client.push_many((message, token) for token in tokens)
+            for token, result in results:
+                if isinstance(result, Unregistered):
+                    forget(token)
+
+        :param notifications: An iterable of ``(message, token)`` pairs, such
+            as a :class:`.SendQueue`. It is consumed lazily.
+        :param window: (optional) The maximum number of requests in flight.
+        :param timeout: (optional) The maximum number of seconds for the whole
+            batch. Requests still waiting for a response when it expires are
+            cancelled, and the remaining notifications are not sent. Both get
+            a :class:`.PushTimeout` result.
+        :return: A list of ``(token, result)`` pairs in the order the
+            notifications were sent, where ``result`` is the notification
+            :class:`~uuid.UUID` or the exception raised for that message.
+        """
+        assert window > 0, 'Invalid window'
+        deadline = None if timeout is None else time.time() + timeout
+        results = []
+        in_flight = deque()
+        for message, token in notifications:
+            if len(in_flight) >= window:
+                token_, stream_id = in_flight.popleft()
+                results.append(
+                    (token_, self._get_result(token_, stream_id, deadline))
+                )
+            if deadline is not None and time.time() >= deadline:
+                results.append((token, PushTimeout(None, token)))
+                continue
+            in_flight.append((token, self._send(message, token)))
+        while in_flight:
+            token, stream_id = in_flight.popleft()
+            results.append(
+                (token, self._get_result(token, stream_id, deadline))
+            )
+        return results
+
+    def push_stream(self, notifications, window=DEFAULT_WINDOW,
+                    timeout=None):
+        """Send many messages like :meth:`push_many`, but yield each result
+        as soon as it is available instead of collecting them all.
+
+        Notifications are pulled from the iterable only when there is room in
+        the window of in flight requests, so a long or endless iterable is
+        processed in constant memory::
+
+            for token, result in client.push_stream(notifications):
+                if isinstance(result, Unregistered):
+                    forget(token)
+
+        :param notifications: An iterable of ``(message, token)`` pairs.
+        :param window: (optional) The maximum number of requests in flight.
+        :param timeout: (optional) The maximum number of seconds to wait for
+            the response to each request, counted from when it was sent.
+            Requests which time out are cancelled and get a
+            :class:`.PushTimeout` result.
+        :return: A generator of ``(token, result)`` pairs in the order the
+            responses complete, where ``result`` is the notification
+            :class:`~uuid.UUID` or the exception raised for that message.
+        """
+        assert window > 0, 'Invalid window'
+        in_flight = deque()
+        for message, token in notifications:
+            if len(in_flight) >= window:
+                yield self._next_result(in_flight)
+            deadline = None if timeout is None else time.time() + timeout
+            in_flight.append((token, self._send(message, token), deadline))
+        while in_flight:
+            yield self._next_result(in_flight)
+
+    def close(self):
+        """Close the connection to the APNS gateway server. The connection is
+        reopened by the next push.
+        """
+        self._connection.close()
+
+    def _send(self, message, token):
         assert token, 'Token cannot be empty or null'
 
-        path = '/3/device/' + token
-        stream_id = self._connection.request(
+        if isinstance(token, DeviceToken):
+            path = token.path
+        else:
+            path = '/3/device/' + token
+        return self._connection.request(
             'POST',
             path,
             body=message.encoded,
-            headers=message.headers
+            headers=message.header_items
         )
 
-        response = self._connection.get_response(stream_id)
+    def _next_result(self, in_flight):
+        """Remove the first completed request from ``in_flight`` and return
+        its token and result. Waits for the oldest request (which has the
+        earliest deadline) if none of the responses have arrived yet.
+        """
+        self._connection.poll()
+        index = 0
+        for i, (_, stream_id, _) in enumerate(in_flight):
+            if self._connection.is_complete(stream_id):
+                index = i
+                break
+        token, stream_id, deadline = in_flight[index]
+        del in_flight[index]
+        return token, self._get_result(token, stream_id, deadline)
+
+    def _get_response(self, stream_id, deadline):
+        """Wait for the response to a request, until ``deadline`` at most.
+
+        :raises: :class:`socket.timeout` if the deadline passes first.
+        """
+        if deadline is None:
+            return self._connection.get_response(stream_id)
+        remaining = deadline - time.time()
+        if remaining <= 0 and not self._connection.is_complete(stream_id):
+            raise socket.timeout()
+        return self._connection.get_response(stream_id,
+                                             timeout=max(remaining, 0))
+
+    def _get_result(self, token, stream_id, deadline=None):
+        """Wait for the response to a request. Returns the notification ID, or
+        the exception describing why the push was not successful.
+        """
+        try:
+            response = self._get_response(stream_id, deadline)
+        except socket.timeout:
+            log.debug('Push to %s timed out, cancelling stream %s',
+                      token, stream_id)
+            self._connection.reset(stream_id)
+            return PushTimeout(None, token)
+
         if response.status != 200:
-            self.handle_error(token, response)
+            try:
+                self.handle_error(token, response)
+            except Exception as e:
+                return e
 
         apns_id = response.headers['apns-id'][0]
         if isinstance(apns_id, binary_type):
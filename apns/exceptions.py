@@ -29,6 +29,7 @@ Exception hierarchy::
      |    +-- IdleTimeout
      |    +-- InternalServerError
      |    +-- Forbidden
+     +-- PushTimeout
 
 These exceptions (excluding the base class exceptions) map to values of the
 `reason field <https://developer.apple.com/library/ios/documentation/Networking
@@ -36,6 +37,8 @@ Internet/Conceptual/RemoteNotificationsPG/Chapters/APNsProviderAPI.html#//apple
 _ref/doc/uid/TP40008194-CH101-SW5>`_ that is returned by the APNs gateway in
 event of an error. Some values of the ``reason`` key do not have an associated
 exception because this library includes checks to prevent these errors.
+:class:`PushTimeout` is raised by the client itself when APNs does not respond
+in time.
  """
 
 import sys
@@ -250,6 +253,20 @@ class InternalServerError(HTTPError):
     description = 'An internal server error occurred.'
 
 
+class PushTimeout(APNSException):
+    """Raised if no response to a push was received before its deadline. The
+    request is cancelled, but the rest of the connection is left intact.
+    """
+
+    description = 'No response was received before the push deadline.'
+
+    def __init__(self, code, token, *args):
+        APNSException.__init__(self, code)
+
+        #: The token of the device the message was sent to
+        self.token = token
+
+
 __classes = dict(inspect.getmembers(sys.modules[__name__], inspect.isclass))
 _map = {k: v for k, v in iteritems(__classes) if v.__module__ == __name__}
 del __classes
@@ -0,0 +1,467 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""A local push gateway daemon.
+
+Services on a host submit notifications to the gateway over a Unix domain
+socket or a local TCP port, and the gateway sends them on a few shared
+connections to APNs. Run ``python -m apns.gateway --help`` for usage.
+
+Protocol
+--------
+
+A connection carries either newline delimited JSON or binary frames; the
+mode is detected from its first byte.
+
+In JSON mode every line is a notification object, or an array of them::
+
+    {"token": "a1b2...", "payload": {"aps": {"alert": "Hello"}},
+     "topic": "com.example.app", "priority": 10, "expiration": 0,
+     "collapse_id": "news", "id": "...", "ref": 42}
+
+Only ``token`` and ``payload`` are required. ``payload`` is the APNs payload
+as an object, or as a string holding its JSON encoding. ``ref`` is any value,
+returned with the result.
+
+In binary mode every frame is a 4 byte big endian length, followed by the
+raw 32 byte device token and a message serialized with
+:meth:`.Message.to_bytes`. Since frames are shorter than 16 MB, a binary
+connection always starts with a zero byte, which a JSON line never does.
+
+Results are written back as the responses arrive, one JSON object per
+notification, as lines in JSON mode and as length prefixed frames in binary
+mode::
+
+    {"token": "a1b2...", "ref": 42, "id": "<apns-id>"}
+    {"token": "c3d4...", "error": "Unregistered", "status": 410,
+     "unregistered_since": "2016-06-01T12:00:00"}
+"""
+
+import argparse
+import json
+import logging
+import os
+import struct
+import sys
+import threading
+from collections import deque
+
+from ._compat import queue, socketserver, text_type
+from .client import Client, DEFAULT_PORT, DEFAULT_WINDOW
+from .exceptions import Unregistered
+from .message import Message, RawMessage, HIGH_PRIORITY, _dumps
+from .ssl_context import make_ssl_context
+from .tokens import DeviceToken, TOKEN_SIZE
+
+__all__ = ('Gateway', 'DEFAULT_MAX_PENDING', 'main')
+
+log = logging.getLogger(__name__)
+
+#: The default maximum number of notifications read from a connection but
+#: not yet sent.
+DEFAULT_MAX_PENDING = 10000
+
+_FRAME = struct.Struct('!I')
+
+# How often a reader waiting for pending results checks whether the
+# connection was closed, in seconds
+_WAIT_INTERVAL = 0.1
+
+
+def message_from_json(obj):
+    """Create a :class:`.RawMessage` and a token from a notification
+    object of the JSON protocol.
+
+    :return: A tuple of the message and the token.
+    :raises: :class:`KeyError`, :class:`ValueError` or
+        :class:`AssertionError` if the object is not valid.
+    """
+    payload = obj['payload']
+    token = obj['token']
+    # Raises ValueError for invalid tokens, including ones which are not
+    # strings
+    DeviceToken(token)
+    if not isinstance(payload, (text_type, bytes)):
+        payload = _dumps(payload)
+    message = RawMessage(
+        payload,
+        id=obj.get('id'),
+        topic=obj.get('topic'),
+        expiration=obj.get('expiration', 0),
+        priority=str(obj.get('priority', HIGH_PRIORITY)),
+        collapse_id=obj.get('collapse_id'),
+    )
+    return message, token
+
+
+def result_to_json(token, result, ref=None):
+    """Describe the result of a notification as a JSON compatible dictionary.
+    """
+    obj = {'token': str(token)}
+    if ref is not None:
+        obj['ref'] = ref
+    if not isinstance(result, Exception):
+        obj['id'] = str(result)
+        return obj
+
+    obj['error'] = type(result).__name__
+    code = getattr(result, 'code', None)
+    if code is not None:
+        obj['status'] = code
+    if isinstance(result, Unregistered) and result.unavailable_since:
+        obj['unregistered_since'] = result.unavailable_since.isoformat()
+    return obj
+
+
+class Gateway(object):
+    """Sends the notifications submitted by many local connections through a
+    pool of shared :class:`.Client` objects.
+
+    Notifications of all connections go into one queue. Each client has a
+    sending thread which feeds the queue to :meth:`.Client.push_stream`, so
+    notifications of different connections are multiplexed on the same
+    HTTP/2 connection and up to ``window`` requests per client stay in
+    flight. Results are written back to each connection as they arrive. See
+    the module documentation for the protocol::
+
+        gateway = Gateway([Client(ssl_context) for _ in range(4)])
+        server = gateway.make_server('/run/apns.sock')
+        server.serve_forever()
+
+    :param clients: The :class:`.Client` objects to send with.
+    :param window: (optional) The maximum number of requests in flight on
+        each client.
+    :param max_pending: (optional) The maximum number of notifications read
+        from a connection and not yet answered. Reading stops when it is
+        reached, so fast submitters are slowed down to the sending rate.
+    """
+    def __init__(self, clients, window=DEFAULT_WINDOW,
+                 max_pending=DEFAULT_MAX_PENDING):
+        assert clients, 'At least one client is required'
+        assert window > 0, 'Invalid window'
+        assert max_pending > 0, 'Invalid max_pending'
+        self.clients = list(clients)
+        self.window = window
+        self.max_pending = max_pending
+
+        self._queue = deque()
+        self._closed = False
+        self._lock = threading.Condition()
+
+        self._threads = []
+        for client in self.clients:
+            thread = threading.Thread(target=self._run, args=(client,))
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, message, token, callback):
+        """Queue a notification for sending on the first available client.
+
+        :param message: A :class:`.Message` object.
+        :param token: Device token to push the message to.
+        :param callback: A function called from a sending thread with the
+            token and the result of the notification, as returned by
+            :meth:`.Client.push_stream`.
+        """
+        with self._lock:
+            assert not self._closed, 'Gateway is closed'
+            self._queue.append((message, token, callback))
+            self._lock.notify()
+
+    def make_server(self, address):
+        """Create a server accepting connections for this gateway.
+
+        :param address: The path of a Unix domain socket, or a ``(host,
+            port)`` tuple for TCP.
+        :return: A :class:`socketserver.BaseServer`. Call its
+            ``serve_forever`` method to run it.
+        """
+        if isinstance(address, (text_type, str)):
+            server = _UnixServer(address, _Handler)
+        else:
+            server = _TCPServer(address, _Handler)
+        server.gateway = self
+        return server
+
+    def close(self):
+        """Send the queued notifications, then close the connections of all
+        clients.
+        """
+        with self._lock:
+            self._closed = True
+            self._lock.notify_all()
+        for thread in self._threads:
+            thread.join()
+        for client in self.clients:
+            client.close()
+
+    def _take(self, pending):
+        """Yield queued notifications, waiting for more while none are in
+        flight. The iteration stops when the queue is empty and notifications
+        are in flight, so their results are not held back, or when the
+        gateway is closed and drained.
+
+        ``pending`` maps the id of the key passed to the client for each
+        notification in flight to the key, the token and the callback.
+        """
+        while True:
+            with self._lock:
+                while not self._queue and not self._closed and not pending:
+                    self._lock.wait()
+                if not self._queue:
+                    return
+                message, token, callback = self._queue.popleft()
+            # A new object for each notification, so results are matched to
+            # their notification even when the same token is in flight twice
+            if isinstance(token, DeviceToken):
+                key = DeviceToken(memoryview(token))
+            else:
+                key = DeviceToken(token)
+            pending[id(key)] = (key, token, callback)
+            yield message, key
+
+    def _run(self, client):
+        while True:
+            pending = {}
+            try:
+                results = client.push_stream(self._take(pending),
+                                             window=self.window)
+                for key, result in results:
+                    _, token, callback = pending.pop(id(key))
+                    _call(callback, token, result)
+            except Exception as e:
+                log.exception('Sending %d messages failed', len(pending))
+                for _, token, callback in pending.values():
+                    _call(callback, token, e)
+            with self._lock:
+                if self._closed and not self._queue:
+                    return
+
+
+def _call(callback, token, result):
+    try:
+        callback(token, result)
+    except Exception:
+        log.exception('Result callback failed')
+
+
+class _TCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+if hasattr(socketserver, 'UnixStreamServer'):
+    class _UnixServer(socketserver.ThreadingMixIn,
+                      socketserver.UnixStreamServer):
+        daemon_threads = True
+else:  # pragma: no cover
+    _UnixServer = None
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    """Serves one connection: a thread reads notifications and submits them
+    to the gateway, and this thread writes the results as they arrive.
+    """
+    binary = False
+    closed = False
+
+    def handle(self):
+        gateway = self.server.gateway
+        # Results to write, and None once the input was read
+        self._results = queue.Queue()
+        self._count = 0
+        self._lock = threading.Condition()
+        reader = threading.Thread(target=self._read, args=(gateway,))
+        reader.daemon = True
+        reader.start()
+
+        try:
+            done = False
+            while not done or self._count:
+                items = [self._results.get()]
+                while True:
+                    try:
+                        items.append(self._results.get_nowait())
+                    except queue.Empty:
+                        break
+                chunks = []
+                for item in items:
+                    if item is None:
+                        done = True
+                    else:
+                        chunks.append(self._format(result_to_json(*item)))
+                if chunks:
+                    self.wfile.write(b''.join(chunks))
+                    self.wfile.flush()
+                with self._lock:
+                    self._count -= len(chunks)
+                    self._lock.notify_all()
+        finally:
+            # Let the reader stop if it waits for pending results
+            with self._lock:
+                self.closed = True
+                self._lock.notify_all()
+
+    def _format(self, obj):
+        data = json.dumps(obj).encode('utf-8')
+        if self.binary:
+            return _FRAME.pack(len(data)) + data
+        return data + b'\n'
+
+    def _read(self, gateway):
+        try:
+            first = self.rfile.read(1)
+            if first == b'\x00':
+                self.binary = True
+                self._read_frames(gateway, first)
+            elif first:
+                self._read_lines(gateway, first)
+        except _Closed:
+            return
+        except Exception:
+            log.exception('Reading from %s failed', self.client_address)
+        self._results.put(None)
+
+    def _submit(self, gateway, item):
+        """Submit a parsed notification, or queue its error as the result,
+        waiting while ``max_pending`` results are pending.
+
+        :raises: :class:`_Closed` if the connection was closed meanwhile.
+        """
+        message, token, ref, error = item
+        with self._lock:
+            while self._count >= gateway.max_pending and not self.closed:
+                self._lock.wait(_WAIT_INTERVAL)
+            if self.closed:
+                raise _Closed()
+            self._count += 1
+        if error is not None:
+            self._results.put((token, error, ref))
+            return
+
+        def reply(token, result):
+            self._results.put((token, result, ref))
+        gateway.submit(message, token, reply)
+
+    def _read_lines(self, gateway, first):
+        line = first + self.rfile.readline()
+        while line:
+            if line.strip():
+                for item in _parse_line(line):
+                    self._submit(gateway, item)
+            line = self.rfile.readline()
+
+    def _read_frames(self, gateway, first):
+        header = first + self.rfile.read(_FRAME.size - 1)
+        while len(header) == _FRAME.size:
+            size, = _FRAME.unpack(header)
+            data = self.rfile.read(size)
+            if len(data) < size:
+                break
+            self._submit(gateway, _parse_frame(data))
+            header = self.rfile.read(_FRAME.size)
+
+
+class _Closed(Exception):
+    """The connection was closed while reading from it."""
+
+
+def _parse_line(line):
+    try:
+        objs = json.loads(line.decode('utf-8'))
+    except ValueError as e:
+        # Not JSONDecodeError, which only exists on some Python versions
+        return [(None, None, None, ValueError(str(e)))]
+    if not isinstance(objs, list):
+        objs = [objs]
+
+    items = []
+    for obj in objs:
+        ref = token = None
+        try:
+            ref = obj.get('ref')
+            token = obj.get('token')
+            message, token = message_from_json(obj)
+            items.append((message, token, ref, None))
+        except (AttributeError, AssertionError, KeyError, TypeError,
+                ValueError) as e:
+            items.append((None, token, ref, e))
+    return items
+
+
+def _parse_frame(data):
+    view = memoryview(data)
+    token = None
+    try:
+        token = DeviceToken(view[:TOKEN_SIZE])
+        message = Message.from_bytes(view[TOKEN_SIZE:])
+    except (AssertionError, ValueError) as e:
+        return None, token, None, e
+    return message, token, None, None
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog='python -m apns.gateway',
+        description='Run a local push gateway sending notifications '
+                    'submitted by local services.',
+    )
+    listen = parser.add_mutually_exclusive_group(required=True)
+    listen.add_argument('--unix', metavar='PATH',
+                        help='Listen on a Unix domain socket.')
+    listen.add_argument('--tcp', metavar='HOST:PORT',
+                        help='Listen on a TCP address, e.g. 127.0.0.1:2195.')
+    parser.add_argument('--cert', required=True,
+                        help='Path to the certificate file (PEM).')
+    parser.add_argument('--key', help='Path to the private key file (PEM).')
+    parser.add_argument('--password', help='Password of the private key.')
+    parser.add_argument('--production', action='store_true',
+                        help='Use the production gateway instead of the '
+                             'sandbox.')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--connections', type=int, default=1,
+                        help='Number of connections to APNs.')
+    parser.add_argument('--window', type=int, default=DEFAULT_WINDOW,
+                        help='Requests in flight per connection to APNs.')
+    parser.add_argument('--max-pending', type=int,
+                        default=DEFAULT_MAX_PENDING,
+                        help='Notifications buffered per local connection.')
+    return parser
+
+
+def main(argv=None):
+    """Run the gateway with command line arguments ``argv``."""
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    ssl_context = make_ssl_context(args.cert, args.key,
+                                   password=args.password)
+    clients = [
+        Client(ssl_context, sandbox=not args.production, port=args.port)
+        for _ in range(args.connections)
+    ]
+    gateway = Gateway(clients, window=args.window,
+                      max_pending=args.max_pending)
+
+    if args.unix:
+        address = args.unix
+    else:
+        host, _, port = args.tcp.rpartition(':')
+        address = (host or '127.0.0.1', int(port))
+    server = gateway.make_server(address)
+    log.info('Listening on %s', address)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        gateway.close()
+        if args.unix and os.path.exists(args.unix):
+            os.unlink(args.unix)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -2,13 +2,17 @@
 # -*- coding: utf-8 -*-
 
 import json
+import struct
+import threading
 import uuid
+from collections import OrderedDict
 from datetime import datetime
 
-from ._compat import iteritems, binary_type, cached_property
+from ._compat import iteritems, binary_type, text_type
 
-__all__ = ('Alert', 'Message', 'HIGH_PRIORITY', 'LOW_PRIORITY',
-           'EXPIRE_IMMEDIATELY')
+__all__ = ('Alert', 'Message', 'FrozenMessage', 'RawMessage',
+           'HIGH_PRIORITY', 'LOW_PRIORITY', 'EXPIRE_IMMEDIATELY',
+           'MAX_COLLAPSE_ID_SIZE', 'MAX_PAYLOAD_SIZE', 'ENCODED_CACHE_SIZE')
 
 _EPOCH = datetime(1970, 1, 1)
 
@@ -29,6 +33,60 @@ LOW_PRIORITY = '5'
 #: redeliver it.
 EXPIRE_IMMEDIATELY = 0
 
+#: The maximum size in bytes of :attr:`.Message.collapse_id`.
+MAX_COLLAPSE_ID_SIZE = 64
+
+#: The maximum size in bytes of a notification payload accepted by APNs.
+MAX_PAYLOAD_SIZE = 4096
+
+# Encoded request headers shared by all messages with the same topic,
+# priority, expiration and collapse ID. See Message.header_items.
+_HEADER_CACHE = {}
+_HEADER_CACHE_SIZE = 256
+
+#: The number of distinct encoded payloads shared by :class:`FrozenMessage`
+#: objects.
+ENCODED_CACHE_SIZE = 1024
+
+# Binary format of Message.to_bytes: version, flags, priority, and the
+# lengths of the topic, collapse ID and payload. The ID and the expiration
+# follow when flagged, then the topic, collapse ID and payload.
+_FORMAT_VERSION = 1
+_HEADER = struct.Struct('!BBBHBI')
+_EXPIRATION = struct.Struct('!d')
+_HAS_ID = 1
+_HAS_EXPIRATION = 2
+_UUID_SIZE = 16
+
+# Binary format of Alert.to_bytes: version, then the JSON alert payload
+_ALERT_HEADER = struct.Struct('!B')
+
+# Alert payload keys -> Alert arguments
+_ALERT_ARGUMENTS = {
+    'title': 'title',
+    'body': 'body',
+    'title-loc-key': 'title_loc_key',
+    'title-loc-args': 'title_loc_args',
+    'action-loc-key': 'action_loc_key',
+    'loc-key': 'loc_key',
+    'loc-args': 'loc_args',
+    'launch-image': 'launch_image',
+}
+
+
+def _dumps(value):
+    """Encode a value as JSON the way APNs expects it."""
+    jsondata = json.dumps(
+        value,
+        # Apple does not support \U notation
+        ensure_ascii=False,
+        # More compact than the default separators
+        separators=(',', ':')
+    )
+    if not isinstance(jsondata, binary_type):  # pragma: no cover
+        jsondata = jsondata.encode('utf-8')
+    return jsondata
+
 
 class Message(object):
     """
@@ -82,6 +140,9 @@ class Message(object):
         means that when your app is launched in the background or resumed,
         ``application:didReceiveRemoteNotification:fetchCompletionHandler:``
         is called.
+    :param collapse_id: Multiple notifications with the same collapse
+        identifier are displayed to the user as a single notification. The
+        value must not exceed 64 bytes.
     :param extra: Extra information to bundle with the notification payload.
 
     .. _Registering Your Actionable Notification Types: https://developer.apple
@@ -92,10 +153,14 @@ class Message(object):
         documentation/NetworkingInternet/Conceptual/RemoteNotificationsPG/Chapt
         ers/IPhoneOSClientImp.html#//apple_ref/doc/uid/TP40008194-CH103-SW6
     """
+    __slots__ = ('_id', '_priority', '_expiration', 'alert', 'badge', 'topic',
+                 'category', 'sound', '_content_available', '_collapse_id',
+                 'extra', '_headers', '_header_items', '_encoded')
+
     def __init__(self, id=None, topic=None, alert=None, badge=None,
                  sound=None, category=None, content_available=None,
                  expiration=EXPIRE_IMMEDIATELY, priority=HIGH_PRIORITY,
-                 **extra):
+                 collapse_id=None, **extra):
         #: A canonical :class:`~uuid.UUID` that identifies the notification.
         self.id = id
 
@@ -124,9 +189,119 @@ class Message(object):
         #: Indicates that new content is available.
         self.content_available = content_available
 
+        #: The identifier used to collapse notifications on the device.
+        self.collapse_id = collapse_id
+
         #: Extra information to bundle with the notification payload.
         self.extra = extra
 
+        self._headers = None
+        self._header_items = None
+        self._encoded = None
+
+    def replace(self, **changes):
+        """Create a copy of the message with some arguments changed::
+
+            urgent = message.replace(priority=HIGH_PRIORITY)
+
+        Keys which are not arguments of :class:`Message` replace or add
+        :attr:`extra` data.
+
+        :param changes: The arguments to change.
+        :return: A new message of the same class.
+        """
+        kwargs = self._arguments()
+        kwargs.update(changes)
+        return type(self)(**kwargs)
+
+    def freeze(self):
+        """Create a :class:`FrozenMessage` with the same content."""
+        return FrozenMessage(**self._arguments())
+
+    def to_bytes(self):
+        """Serialize the message to a compact binary form, for sending it
+        to another process. Only the encoded payload and the header fields
+        are kept; use :meth:`from_bytes` to read it back.
+        """
+        flags = 0
+        parts = [None]
+        if self._id is not None:
+            flags |= _HAS_ID
+            parts.append(self._id.bytes)
+        if self._expiration:
+            flags |= _HAS_EXPIRATION
+            parts.append(_EXPIRATION.pack(self._expiration))
+        topic = (self.topic or '').encode('utf-8')
+        collapse_id = (self._collapse_id or '').encode('utf-8')
+        body = self.encoded
+        parts.extend((topic, collapse_id, body))
+        parts[0] = _HEADER.pack(_FORMAT_VERSION, flags, int(self._priority),
+                                len(topic), len(collapse_id), len(body))
+        return b''.join(parts)
+
+    @classmethod
+    def from_bytes(cls, data):
+        """Read a message serialized with :meth:`to_bytes`.
+
+        The payload is not decoded: the message is a :class:`RawMessage`
+        whose payload is a :class:`memoryview` of ``data``, which must not be
+        changed while the message is in use.
+
+        :param data: The serialized message, as bytes, a :class:`bytearray`
+            or a :class:`memoryview`.
+        :return: A :class:`RawMessage`.
+        :raises: :class:`ValueError` if ``data`` is not a serialized message.
+        """
+        view = memoryview(data)
+        try:
+            version, flags, priority, topic_size, collapse_id_size, \
+                body_size = _HEADER.unpack_from(view)
+        except struct.error:
+            raise ValueError('Truncated message')
+        if version != _FORMAT_VERSION:
+            raise ValueError('Unsupported format version %d' % version)
+
+        offset = _HEADER.size
+        id = expiration = None
+        if flags & _HAS_ID:
+            id = uuid.UUID(bytes=view[offset:offset + _UUID_SIZE].tobytes())
+            offset += _UUID_SIZE
+        if flags & _HAS_EXPIRATION:
+            expiration, = _EXPIRATION.unpack_from(view, offset)
+            offset += _EXPIRATION.size
+        end = offset + topic_size + collapse_id_size + body_size
+        if len(view) != end:
+            raise ValueError('Invalid message size')
+
+        topic = view[offset:offset + topic_size].tobytes().decode('utf-8')
+        offset += topic_size
+        collapse_id = view[offset:offset + collapse_id_size].tobytes()
+        offset += collapse_id_size
+        return RawMessage(
+            view[offset:end],
+            id=id,
+            topic=topic or None,
+            expiration=expiration,
+            priority=str(priority),
+            collapse_id=collapse_id.decode('utf-8') or None,
+        )
+
+    def _arguments(self):
+        kwargs = dict(self.extra)
+        kwargs.update(
+            id=self._id,
+            topic=self.topic,
+            alert=self.alert,
+            badge=self.badge,
+            sound=self.sound,
+            category=self.category,
+            content_available=self._content_available,
+            expiration=self._expiration,
+            priority=self._priority,
+            collapse_id=self._collapse_id,
+        )
+        return kwargs
+
     @property
     def aps(self):
         """The content of the ``aps`` dictionary."""
@@ -156,8 +331,17 @@ class Message(object):
         if value:
             self._content_available = 1
 
-    @cached_property
+    @property
     def headers(self):
+        """The request headers as a dictionary.
+
+        This property is cached once computed.
+        """
+        if self._headers is None:
+            self._headers = self._build_headers()
+        return self._headers
+
+    def _build_headers(self):
         _id = None
         if self.id:
             _id = str(self.id)
@@ -171,9 +355,53 @@ class Message(object):
             'apns-topic': self.topic,
             'apns-priority': self.priority,
             'apns-expiration': str(_exp),
+            'apns-collapse-id': self.collapse_id,
         }
         return {k: v for k, v in iteritems(hdrs) if v is not None}
 
+    @property
+    def header_items(self):
+        """The request headers as a tuple of ``(name, value)`` byte string
+        pairs, ready to be sent by a :class:`.Transport`.
+
+        All headers except ``apns-id`` depend only on the topic, priority,
+        expiration and collapse ID of the message, and most notifications
+        share a handful of combinations of those. The encoded headers of each
+        combination are built once and shared by all messages using it.
+
+        This property is cached once computed.
+        """
+        if self._header_items is None:
+            self._header_items = self._build_header_items()
+        return self._header_items
+
+    def _build_header_items(self):
+        key = (self.topic, self.priority, self._expiration, self.collapse_id)
+        items = _HEADER_CACHE.get(key)
+        if items is None:
+            items = tuple(
+                (name.encode('ascii'), value.encode('utf-8'))
+                for name, value in sorted(iteritems(self.headers))
+                if name != 'apns-id'
+            )
+            if len(_HEADER_CACHE) >= _HEADER_CACHE_SIZE:
+                _HEADER_CACHE.clear()
+            _HEADER_CACHE[key] = items
+        if self.id:
+            items += ((b'apns-id', str(self.id).encode('ascii')),)
+        return items
+
+    @property
+    def collapse_id(self):
+        return self._collapse_id
+
+    @collapse_id.setter
+    def collapse_id(self, value):
+        if value is not None:
+            assert len(value.encode('utf-8')) <= MAX_COLLAPSE_ID_SIZE, \
+                'Collapse ID is too long'
+        self._collapse_id = value
+
     @property
     def id(self):
         return self._id
@@ -209,15 +437,15 @@ class Message(object):
             assert value >= 0, 'Invalid expiration'
         self._expiration = value
 
-    @cached_property
+    @property
     def payload(self):
         """The payload data of the message. See `the Remote Notification
         Payload <https://developer.apple.com/library/ios/documentation/Networki
         ngInternet/Conceptual/RemoteNotificationsPG/Chapters/TheNotificationPay
         load.html>`_ for details.
 
-        This property is cached once computed, so it is best to not reuse
-        message objects.
+        The payload is built on each access, and is not kept once
+        :attr:`encoded` has been computed.
         """
         payload = {
             'aps': self.aps,
@@ -228,22 +456,228 @@ class Message(object):
 
         return payload
 
-    @cached_property
+    @property
     def encoded(self):
         """The message payload encoded as a JSON string.
 
-        This property is cached once computed.
+        This property is cached once computed, so it is best to not reuse
+        message objects. Use :class:`FrozenMessage` for messages which are
+        reused.
+        """
+        if self._encoded is None:
+            self._encoded = self._encode()
+        return self._encoded
+
+    def _encode(self):
+        return _dumps(self.payload)
+
+
+class FrozenMessage(Message):
+    """An immutable :class:`Message`.
+
+    Frozen messages are compared and hashed by content, so they can be used
+    as dictionary keys or deduplicated with a :class:`set`. Setting an
+    attribute raises :class:`AttributeError`; use :meth:`~Message.replace`
+    to derive a changed copy.
+
+    The payload is copied when the message is created, so changing the
+    :class:`.Alert` or the extra data passed in does not affect it. Encoded
+    payloads are kept in a cache of :data:`ENCODED_CACHE_SIZE` entries
+    shared by all frozen messages, so a payload sent to many devices, even as
+    separate message objects, is encoded only once::
+
+        message = FrozenMessage(alert='Sale ends tonight', topic='com.example')
+
+    It takes the same arguments as :class:`Message`.
+    """
+    __slots__ = ('_content', '_hash')
+
+    # Attributes which may still be set after the message is frozen
+    _CACHES = frozenset(('_headers', '_header_items', '_encoded'))
+
+    def __init__(self, *args, **kwargs):
+        Message.__init__(self, *args, **kwargs)
+        content = (
+            self._id, self.topic, self._priority, self._expiration,
+            self._collapse_id, _freeze(Message.payload.fget(self)),
+        )
+        object.__setattr__(self, '_hash', hash(content))
+        object.__setattr__(self, '_content', content)
+
+    def __setattr__(self, name, value):
+        if name not in self._CACHES and hasattr(self, '_content'):
+            raise AttributeError('FrozenMessage is immutable')
+        object.__setattr__(self, name, value)
+
+    def __delattr__(self, name):
+        raise AttributeError('FrozenMessage is immutable')
+
+    def __reduce__(self):
+        # Restoring the slots would go through __setattr__, and the hash of
+        # the content is not the same in another process
+        return _rebuild, (type(self), self._arguments())
+
+    def __eq__(self, other):
+        if not isinstance(other, FrozenMessage):
+            return NotImplemented
+        return self._hash == other._hash and self._content == other._content
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+    def __hash__(self):
+        return self._hash
+
+    def freeze(self):
+        return self
+
+    @property
+    def payload(self):
+        """The payload data of the message. Returns a new copy on each
+        access.
+        """
+        return _thaw(self._content[-1])
+
+    def _encode(self):
+        key = self._content[-1]
+        encoded = _ENCODED_CACHE.get(key)
+        if encoded is None:
+            encoded = Message._encode(self)
+            _ENCODED_CACHE.put(key, encoded)
+        return encoded
+
+
+class RawMessage(Message):
+    """A message with a payload which is already encoded as JSON, for
+    example by another service::
+
+        message = RawMessage(b'{"aps":{"alert":"Hello"}}', topic='com.example')
+
+    The payload is sent as it is, without being decoded and encoded again,
+    and a :class:`memoryview` is passed to the transport without being
+    copied. Only its size is checked. The payload must not be changed until
+    the message is sent.
+
+    :param payload: The encoded payload, as bytes, a :class:`bytearray` or a
+        :class:`memoryview`. A text string is encoded as UTF-8.
+    :param id: See :class:`Message`.
+    :param topic: See :class:`Message`.
+    :param expiration: See :class:`Message`.
+    :param priority: See :class:`Message`.
+    :param collapse_id: See :class:`Message`.
+    """
+    __slots__ = ()
+
+    def __init__(self, payload, id=None, topic=None,
+                 expiration=EXPIRE_IMMEDIATELY, priority=HIGH_PRIORITY,
+                 collapse_id=None):
+        Message.__init__(self, id=id, topic=topic, expiration=expiration,
+                         priority=priority, collapse_id=collapse_id)
+        if isinstance(payload, text_type):
+            payload = payload.encode('utf-8')
+        assert len(payload) <= MAX_PAYLOAD_SIZE, 'Payload is too large'
+        self._encoded = payload
+
+    @property
+    def aps(self):
+        """The content of the ``aps`` dictionary, decoded from the payload.
+        """
+        return self.payload.get('aps', {})
+
+    @property
+    def payload(self):
+        """The payload data, decoded from the encoded payload on each access.
         """
-        jsondata = json.dumps(
-            self.payload,
-            # Apple does not support \U notation
-            ensure_ascii=False,
-            # More compact than the default separators
-            separators=(',', ':')
+        data = self._encoded
+        if isinstance(data, memoryview):
+            data = data.tobytes()
+        return json.loads(bytes(data).decode('utf-8'))
+
+    def freeze(self):
+        raise TypeError('RawMessage cannot be frozen')
+
+    def _arguments(self):
+        return dict(
+            payload=self._encoded,
+            id=self._id,
+            topic=self.topic,
+            expiration=self._expiration,
+            priority=self._priority,
+            collapse_id=self._collapse_id,
         )
-        if not isinstance(jsondata, binary_type):  # pragma: no cover
-            jsondata = jsondata.encode('utf-8')
-        return jsondata
+
+
+def _rebuild(cls, kwargs):
+    """Create a message from its arguments, for unpickling."""
+    return cls(**kwargs)
+
+
+def _freeze(value):
+    """Convert a JSON compatible value to a hashable one.
+
+    Every value is tagged with its type, so values which are equal in Python
+    but encoded differently, such as ``True``, ``1`` and ``1.0``, or a
+    dictionary and the list of its items, stay apart.
+    """
+    if isinstance(value, dict):
+        items = [(_freeze(k), _freeze(v)) for k, v in iteritems(value)]
+        items.sort(key=_item_order)
+        return (dict, tuple(items))
+    if isinstance(value, (list, tuple)):
+        return (list, tuple(_freeze(v) for v in value))
+    return (type(value), value)
+
+
+def _item_order(item):
+    # Keys of different types are not comparable on Python 3
+    (key_type, key), _ = item
+    return key_type.__name__, key
+
+
+def _thaw(value):
+    """Convert a value created by :func:`_freeze` back."""
+    kind, data = value
+    if kind is dict:
+        return dict((_thaw(k), _thaw(v)) for k, v in data)
+    if kind is list:
+        return [_thaw(v) for v in data]
+    return data
+
+
+class _LRUCache(object):
+    """A thread safe mapping keeping the ``size`` most recently used keys."""
+
+    def __init__(self, size):
+        self.size = size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, key):
+        with self._lock:
+            value = self._items.pop(key, None)
+            if value is not None:
+                self._items[key] = value
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._items.pop(key, None)
+            self._items[key] = value
+            while len(self._items) > self.size:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+_ENCODED_CACHE = _LRUCache(ENCODED_CACHE_SIZE)
 
 
 class Alert(object):
@@ -292,6 +726,9 @@ class Alert(object):
         os/documentation/NetworkingInternet/Conceptual/RemoteNotificationsPG/Ch
         apters/TheNotificationPayload.html
     """
+    __slots__ = ('title', 'body', 'title_loc_key', 'title_loc_args',
+                 'action_loc_key', 'loc_key', 'loc_args', 'launch_image')
+
     def __init__(self, title, body, title_loc_key=None, title_loc_args=None,
                  action_loc_key=None, loc_key=None, loc_args=None,
                  launch_image=None):
@@ -304,7 +741,7 @@ class Alert(object):
         self.loc_args = loc_args
         self.launch_image = launch_image
 
-    @cached_property
+    @property
     def payload(self):
         """The payload data that will be used for the ``alert`` section of the
         ``aps`` payload.
@@ -320,3 +757,37 @@ class Alert(object):
             'launch-image': self.launch_image,
         }
         return {k: v for k, v in iteritems(p) if v is not None}
+
+    def to_bytes(self):
+        """Serialize the alert to a compact binary form. Use
+        :meth:`from_bytes` to read it back.
+        """
+        return _ALERT_HEADER.pack(_FORMAT_VERSION) + _dumps(self.payload)
+
+    @classmethod
+    def from_bytes(cls, data):
+        """Read an alert serialized with :meth:`to_bytes`.
+
+        :param data: The serialized alert.
+        :raises: :class:`ValueError` if ``data`` is not a serialized alert.
+        """
+        view = memoryview(data)
+        try:
+            version, = _ALERT_HEADER.unpack_from(view)
+        except struct.error:
+            raise ValueError('Truncated alert')
+        if version != _FORMAT_VERSION:
+            raise ValueError('Unsupported format version %d' % version)
+        payload = json.loads(
+            view[_ALERT_HEADER.size:].tobytes().decode('utf-8')
+        )
+        if not isinstance(payload, dict):
+            raise ValueError('Alert payload is not an object')
+        unknown = set(payload) - set(_ALERT_ARGUMENTS)
+        if unknown:
+            raise ValueError('Unknown alert keys: %s'
+                             % ', '.join(sorted(unknown)))
+        kwargs = dict((_ALERT_ARGUMENTS[k], v) for k, v in iteritems(payload))
+        kwargs.setdefault('title', None)
+        kwargs.setdefault('body', None)
+        return cls(**kwargs)
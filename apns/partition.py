@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Consistent hashing of device tokens onto sender nodes."""
+
+import bisect
+import hashlib
+import struct
+
+from ._compat import text_type
+from .tokens import TokenArray, TokenSet, _to_raw
+
+__all__ = ('HashRing', 'DEFAULT_REPLICAS')
+
+#: The default number of virtual nodes per node of a :class:`HashRing`.
+DEFAULT_REPLICAS = 128
+
+_POINT = struct.Struct('!I')
+
+
+def _hash(data):
+    return _POINT.unpack_from(hashlib.md5(data).digest())[0]
+
+
+class HashRing(object):
+    """Maps device tokens onto nodes, such as sender hosts, so that every
+    token always lands on the same node.
+
+    Each node is placed on a hash ring at ``replicas`` pseudo random points
+    (virtual nodes), and a token belongs to the node of the first point
+    following the hash of the token. When a node is added or removed, only
+    the tokens between its points and the preceding ones move, about
+    ``1 / len(ring)`` of all tokens, and the rest keep their node::
+
+        ring = HashRing(['sender-1', 'sender-2', 'sender-3'])
+        ring.node_for(token)  # 'sender-2'
+
+        for node, tokens in ring.split(tokens).items():
+            submit(node, tokens)
+
+    Tokens may be given as hex strings or as raw bytes, such as
+    :class:`.DeviceToken`; both forms of a token map to the same node.
+
+    :param nodes: (optional) The initial nodes. Nodes are identified by their
+        string form.
+    :param replicas: (optional) The number of virtual nodes per node. More
+        virtual nodes spread the tokens more evenly.
+    """
+    def __init__(self, nodes=(), replicas=DEFAULT_REPLICAS):
+        assert replicas > 0, 'Invalid number of replicas'
+        self.replicas = replicas
+        self._weights = {}
+        self._points = []
+        self._owners = []
+        for node in nodes:
+            self.add(node)
+
+    def __len__(self):
+        return len(self._weights)
+
+    def __contains__(self, node):
+        return node in self._weights
+
+    @property
+    def nodes(self):
+        """The nodes of the ring."""
+        return list(self._weights)
+
+    def add(self, node, weight=1):
+        """Add a node to the ring, or change its weight.
+
+        :param node: The node.
+        :param weight: (optional) The relative share of the tokens the node
+            receives.
+        """
+        assert weight > 0, 'Invalid weight'
+        self._weights[node] = weight
+        self._build()
+
+    def remove(self, node):
+        """Remove a node from the ring. Its tokens are spread over the other
+        nodes.
+
+        :raises: :class:`KeyError` if the node is not in the ring.
+        """
+        del self._weights[node]
+        self._build()
+
+    def node_for(self, token):
+        """The node a token belongs to.
+
+        :param token: A hex token string or a raw token.
+        :raises: :class:`ValueError` if the token is not valid.
+        """
+        assert self._points, 'The ring has no nodes'
+        return self._owners[self._index(_hash(_to_raw(token)))]
+
+    def split(self, tokens):
+        """Group tokens by node in a single pass.
+
+        :param tokens: An iterable of tokens. A :class:`.TokenArray` or
+            :class:`.TokenSet` is split into one :class:`.TokenArray` per
+            node without converting the tokens.
+        :return: A dictionary mapping nodes to the list of their tokens, in
+            the original order. Nodes without tokens are left out.
+        """
+        assert self._points, 'The ring has no nodes'
+        owners = self._owners
+        index = self._index
+        groups = {}
+        if isinstance(tokens, (TokenArray, TokenSet)):
+            for view in tokens.views():
+                raw = view.tobytes()
+                node = owners[index(_hash(raw))]
+                group = groups.get(node)
+                if group is None:
+                    group = groups[node] = TokenArray()
+                group.append(raw)
+            return groups
+
+        for token in tokens:
+            node = owners[index(_hash(_to_raw(token)))]
+            group = groups.get(node)
+            if group is None:
+                group = groups[node] = []
+            group.append(token)
+        return groups
+
+    def split_notifications(self, notifications):
+        """Group ``(message, token)`` pairs by the node of their token in a
+        single pass, e.g. to send a :class:`.SendQueue` or the batch of
+        :meth:`.Client.push_many` from the node owning each token.
+
+        :return: A dictionary mapping nodes to lists of pairs.
+        """
+        assert self._points, 'The ring has no nodes'
+        owners = self._owners
+        index = self._index
+        groups = {}
+        for message, token in notifications:
+            node = owners[index(_hash(_to_raw(token)))]
+            group = groups.get(node)
+            if group is None:
+                group = groups[node] = []
+            group.append((message, token))
+        return groups
+
+    def _index(self, point):
+        i = bisect.bisect(self._points, point)
+        return i if i < len(self._points) else 0
+
+    def _build(self):
+        ring = []
+        for node, weight in self._weights.items():
+            name = node if isinstance(node, text_type) else str(node)
+            name = name.encode('utf-8')
+            for i in range(max(1, int(self.replicas * weight))):
+                ring.append((_hash(name + b'#' + str(i).encode('ascii')),
+                             name, node))
+        # Ties between nodes are broken by name, so the ring does not depend
+        # on the order the nodes were added in
+        ring.sort(key=lambda entry: entry[:2])
+        self._points = [point for point, _, _ in ring]
+        self._owners = [node for _, _, node in ring]
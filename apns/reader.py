@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Streaming of device tokens from large files."""
+
+import io
+import mmap
+from itertools import compress
+
+from ._compat import binary_type, text_type
+from .tokens import TokenSet, validate_tokens
+
+__all__ = ('TokenReader', 'DEFAULT_CHUNK_SIZE')
+
+#: The default number of tokens in each chunk yielded by
+#: :class:`TokenReader`.
+DEFAULT_CHUNK_SIZE = 10000
+
+
+class TokenReader(object):
+    """Reads device tokens from a file with one token per line, or from a
+    column of a delimited (e.g. CSV) file.
+
+    Regular files are memory mapped, so the file is paged in by the operating
+    system as it is read rather than loaded into memory. Other streams, such
+    as pipes or :data:`sys.stdin`, are read line by line. Iterating over the
+    reader yields lists of at most ``chunk_size`` hex token strings, which can
+    be handed to :meth:`.Client.push_many` one at a time so memory use stays
+    constant however large the file is::
+
+        for chunk in TokenReader('audience.csv', delimiter=',', validate=True):
+            client.push_many((message, token) for token in chunk)
+
+    Blank lines are skipped, and surrounding whitespace and quotes are
+    stripped from the tokens.
+
+    :param source: A path or a file object. Text mode streams such as
+        :data:`sys.stdin` are read through their binary ``buffer``.
+    :param chunk_size: (optional) The maximum number of tokens per chunk.
+    :param delimiter: (optional) The column delimiter. By default each line
+        holds a single token.
+    :param column: (optional) The index of the column holding the token when
+        a ``delimiter`` is given.
+    :param validate: (optional) Drop tokens which are not valid hex tokens,
+        using :func:`.validate_tokens`. The number of dropped tokens is kept in
+        :attr:`invalid`.
+    :param dedupe: (optional) Drop tokens which were already read. Seen tokens
+        are kept in a :class:`.TokenSet`, at about 40 bytes per token. Implies
+        ``validate``. The number of dropped tokens is kept in
+        :attr:`duplicates`.
+    :param on_invalid: (optional) A function called with the list of tokens
+        of each chunk dropped because they were not valid, e.g. to report
+        them.
+    """
+    def __init__(self, source, chunk_size=DEFAULT_CHUNK_SIZE, delimiter=None,
+                 column=0, validate=False, dedupe=False, on_invalid=None):
+        assert chunk_size > 0, 'Invalid chunk_size'
+        self.source = source
+        self.chunk_size = chunk_size
+        if delimiter is not None and not isinstance(delimiter, binary_type):
+            delimiter = delimiter.encode('ascii')
+        self.delimiter = delimiter
+        self.column = column
+        self.validate = validate or dedupe
+        self.dedupe = dedupe
+        self.on_invalid = on_invalid
+
+        #: The number of tokens dropped because they were not valid.
+        self.invalid = 0
+
+        #: The number of tokens dropped because they were duplicates.
+        self.duplicates = 0
+
+    def __iter__(self):
+        seen = TokenSet() if self.dedupe else None
+        for chunk in self._read_chunks():
+            if self.validate:
+                mask = validate_tokens(chunk)
+                valid = list(compress(chunk, mask))
+                if len(valid) < len(chunk):
+                    self.invalid += len(chunk) - len(valid)
+                    if self.on_invalid is not None:
+                        self.on_invalid([token for token, ok
+                                         in zip(chunk, mask) if not ok])
+                chunk = valid
+            if seen is not None:
+                unique = [token for token in chunk if seen.add(token)]
+                self.duplicates += len(chunk) - len(unique)
+                chunk = unique
+            if chunk:
+                yield chunk
+
+    def _read_chunks(self):
+        if isinstance(self.source, (binary_type, text_type)):
+            with open(self.source, 'rb') as f:
+                for chunk in self._read_file(f):
+                    yield chunk
+        else:
+            for chunk in self._read_file(self.source):
+                yield chunk
+
+    def _read_file(self, f):
+        f = getattr(f, 'buffer', f)
+        if isinstance(f, io.TextIOBase):
+            # A text stream without a binary buffer, e.g. io.StringIO
+            for chunk in self._chunk(line.encode('utf-8') for line in f):
+                yield chunk
+            return
+        try:
+            lines = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (AttributeError, io.UnsupportedOperation, ValueError,
+                EnvironmentError):
+            # Not a regular file, or an empty one
+            for chunk in self._chunk(iter(f.readline, b'')):
+                yield chunk
+            return
+
+        try:
+            for chunk in self._chunk(iter(lines.readline, b'')):
+                yield chunk
+        finally:
+            lines.close()
+
+    def _chunk(self, lines):
+        delimiter = self.delimiter
+        column = self.column
+        chunk_size = self.chunk_size
+        chunk = []
+        for line in lines:
+            if delimiter is not None:
+                fields = line.split(delimiter)
+                if len(fields) <= column:
+                    continue
+                line = fields[column]
+            token = line.strip().strip(b'"\'')
+            if not token:
+                continue
+            chunk.append(token.decode('ascii', 'replace'))
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""A shared memory queue of messages between processes."""
+
+import ctypes
+import multiprocessing
+import struct
+
+from ._compat import queue
+from .client import DEFAULT_WINDOW
+from .message import Message
+from .tokens import DeviceToken, TOKEN_SIZE
+
+__all__ = ('RingBuffer', 'DEFAULT_SLOTS', 'DEFAULT_SLOT_SIZE')
+
+#: The default number of slots of a :class:`RingBuffer`.
+DEFAULT_SLOTS = 1024
+
+#: The default maximum size in bytes of a serialized message in a
+#: :class:`RingBuffer` slot, enough for any message with a payload of up to
+#: 4096 bytes and a topic of up to 400 bytes.
+DEFAULT_SLOT_SIZE = 4608
+
+# Each slot holds the size of the serialized message, the raw device token
+# and the message serialized with Message.to_bytes
+_SLOT_HEADER = struct.Struct('!I')
+_HEAD = 0
+_TAIL = 1
+
+
+class RingBuffer(object):
+    """A bounded queue of messages in shared memory, for handing
+    notifications from producer processes to a sender process.
+
+    Messages are stored in a fixed number of slots of a fixed size, in a
+    single shared memory block created with :func:`multiprocessing.RawArray`.
+    :meth:`put` serializes a message with :meth:`.Message.to_bytes` directly
+    into the next free slot, and the consumer reads a batch of slots at once
+    with :meth:`get_many`. Nothing is pickled or written to a pipe. When the
+    ring wraps around, slots are reused once the consumer has read them.
+
+    Any number of processes may put messages concurrently. The ring must be
+    created before the processes are started and passed to them::
+
+        ring = RingBuffer()
+        for _ in range(4):
+            multiprocessing.Process(target=produce, args=(ring,)).start()
+
+        client = Client(ssl_context)
+        while True:
+            for token, result in ring.drain(client):
+                ...
+
+    :param slots: (optional) The number of slots.
+    :param slot_size: (optional) The maximum size of a serialized message.
+    :param context: (optional) The :mod:`multiprocessing` context to create
+        the shared memory and locks with.
+    """
+    def __init__(self, slots=DEFAULT_SLOTS, slot_size=DEFAULT_SLOT_SIZE,
+                 context=None):
+        assert slots > 0, 'Invalid number of slots'
+        assert slot_size > 0, 'Invalid slot size'
+        context = context or multiprocessing
+        self.slots = slots
+        self.slot_size = slot_size
+        self._stride = _SLOT_HEADER.size + TOKEN_SIZE + slot_size
+
+        self._data = context.RawArray(ctypes.c_char, slots * self._stride)
+        # The indexes of the next slot to read and to write
+        self._positions = context.RawArray(ctypes.c_long, 2)
+        self._put_lock = context.Lock()
+        self._get_lock = context.Lock()
+        self._free = context.Semaphore(slots)
+        self._used = context.Semaphore(0)
+
+    def put(self, message, token, block=True, timeout=None):
+        """Add a message to the ring.
+
+        :param message: A :class:`.Message` object.
+        :param token: Device token to push the message to, as a hex string or
+            a :class:`.DeviceToken`.
+        :param block: (optional) Wait for a free slot when the ring is full.
+        :param timeout: (optional) The maximum number of seconds to wait.
+        :raises: :class:`queue.Full` if the ring is full and ``block`` is
+            false, or no slot was freed before the timeout expired.
+        """
+        raw_token = DeviceToken(token)
+        data = message.to_bytes()
+        assert len(data) <= self.slot_size, 'Message is too large for a slot'
+
+        if not self._free.acquire(block, timeout):
+            raise queue.Full()
+        with self._put_lock:
+            index = self._positions[_TAIL]
+            self._positions[_TAIL] = (index + 1) % self.slots
+            offset = index * self._stride
+            self._write(offset, _SLOT_HEADER.pack(len(data)))
+            self._write(offset + _SLOT_HEADER.size, raw_token)
+            self._write(offset + _SLOT_HEADER.size + TOKEN_SIZE, data)
+        self._used.release()
+
+    def get_many(self, count=DEFAULT_WINDOW, timeout=None):
+        """Remove and return up to ``count`` messages, waiting for the first
+        one if the ring is empty.
+
+        :param count: (optional) The maximum number of messages to return.
+        :param timeout: (optional) The maximum number of seconds to wait for
+            the first message.
+        :return: A list of ``(message, token)`` pairs, where each message is
+            a :class:`.RawMessage` and each token a :class:`.DeviceToken`.
+            The list is empty if the timeout expired.
+        """
+        assert count > 0, 'Invalid count'
+        if not self._used.acquire(True, timeout):
+            return []
+        taken = 1
+        while taken < count and self._used.acquire(False):
+            taken += 1
+
+        notifications = []
+        with self._get_lock:
+            index = self._positions[_HEAD]
+            for _ in range(taken):
+                offset = index * self._stride
+                size, = _SLOT_HEADER.unpack(
+                    self._read(offset, _SLOT_HEADER.size)
+                )
+                offset += _SLOT_HEADER.size
+                token = DeviceToken(self._read(offset, TOKEN_SIZE))
+                offset += TOKEN_SIZE
+                message = Message.from_bytes(self._read(offset, size))
+                notifications.append((message, token))
+                index = (index + 1) % self.slots
+            self._positions[_HEAD] = index
+        for _ in range(taken):
+            self._free.release()
+        return notifications
+
+    def drain(self, client, count=DEFAULT_WINDOW, timeout=None):
+        """Send a batch of up to ``count`` messages from the ring with
+        :meth:`.Client.push_many`.
+
+        :param client: The :class:`.Client` to send with.
+        :param count: (optional) The maximum number of messages to send, also
+            used as the window of requests in flight.
+        :param timeout: (optional) The maximum number of seconds to wait for
+            the first message.
+        :return: The results of :meth:`.Client.push_many`, or an empty list
+            if the timeout expired.
+        """
+        notifications = self.get_many(count, timeout)
+        if not notifications:
+            return []
+        return client.push_many(notifications, window=count)
+
+    def _write(self, offset, data):
+        ctypes.memmove(ctypes.addressof(self._data) + offset, data, len(data))
+
+    def _read(self, offset, size):
+        return ctypes.string_at(ctypes.addressof(self._data) + offset, size)
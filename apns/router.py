@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Routing of messages for many apps to clients using per-app certificates."""
+
+import threading
+from collections import OrderedDict
+
+from .client import Client, DEFAULT_PORT
+from .ssl_context import make_ssl_context
+
+__all__ = ('Router',)
+
+
+class Router(object):
+    """Routes messages to a :class:`.Client` chosen by
+    :attr:`.Message.topic`, for providers that send for many apps with a
+    certificate per app.
+
+    Clients are created the first time a topic is used, with an SSL context
+    made by ``ssl_context_factory`` from the certificate settings of that
+    topic. At most ``max_connections`` clients are kept; when another one is
+    needed, the least recently used idle client is closed and discarded.
+
+    A client is in use between :meth:`acquire` and :meth:`release`, and
+    during :meth:`push`. A client in use is never closed under a thread
+    sending with it: if all clients are in use, the least recently used one
+    is discarded but only closed once it is released::
+
+        client = router.acquire('com.example.app')
+        try:
+            client.push_many(notifications)
+        finally:
+            router.release(client)
+
+    :param certificates: A mapping of topic to a dictionary of keyword
+        arguments for ``ssl_context_factory``, e.g.
+        ``{'com.example.app': {'certfile': 'app.pem', 'keyfile': 'app.key'}}``.
+    :param sandbox: (optional) Whether or not to use the APNS sandbox as the
+        gateway server. Defaults to the sandbox server.
+    :param port: (optional) The port to use when connecting to the gateway.
+    :param max_connections: (optional) The maximum number of open clients.
+    :param ssl_context_factory: (optional) The function used to create SSL
+        contexts. Defaults to :func:`make_ssl_context`.
+    """
+    def __init__(self, certificates, sandbox=True, port=DEFAULT_PORT,
+                 max_connections=10, ssl_context_factory=None):
+        assert max_connections > 0, 'Invalid max_connections'
+        self.certificates = dict(certificates)
+        self.sandbox = sandbox
+        self.port = port
+        self.max_connections = max_connections
+        self.ssl_context_factory = ssl_context_factory or make_ssl_context
+
+        self._clients = OrderedDict()
+        # Client -> the number of threads using it
+        self._users = {}
+        # Discarded clients to close once they are released
+        self._retired = set()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._clients)
+
+    def client_for(self, topic):
+        """Get the client for a topic, creating it if needed. The client is
+        not marked as in use; use :meth:`acquire` to send with it while other
+        threads use the router.
+
+        :param topic: A topic listed in ``certificates``.
+        :return: A :class:`.Client`.
+        :raises: :class:`KeyError` if there is no certificate for the topic.
+        """
+        return self._get(topic, False)
+
+    def acquire(self, topic):
+        """Get the client for a topic like :meth:`client_for`, and mark it
+        as in use until :meth:`release` is called.
+        """
+        return self._get(topic, True)
+
+    def release(self, client):
+        """Mark a client returned by :meth:`acquire` as no longer used by
+        this thread. A client discarded meanwhile is closed.
+        """
+        with self._lock:
+            users = self._users.get(client, 0) - 1
+            if users > 0:
+                self._users[client] = users
+                return
+            self._users.pop(client, None)
+            if client not in self._retired:
+                return
+            self._retired.discard(client)
+        client.close()
+
+    def push(self, message, token):
+        """Send a message to a device using the client for the message topic.
+        See :meth:`.Client.push`.
+        """
+        assert message.topic, 'Message topic is required for routing'
+        client = self.acquire(message.topic)
+        try:
+            return client.push(message, token)
+        finally:
+            self.release(client)
+
+    def close(self):
+        """Close all clients, including those in use."""
+        with self._lock:
+            clients = list(self._clients.values()) + list(self._retired)
+            self._clients.clear()
+            self._retired.clear()
+        for client in clients:
+            client.close()
+
+    def _get(self, topic, use):
+        evicted = None
+        with self._lock:
+            client = self._clients.pop(topic, None)
+            if client is None:
+                client = self._make_client(topic)
+                if len(self._clients) >= self.max_connections:
+                    evicted = self._evict()
+            # The most recently used client is last
+            self._clients[topic] = client
+            if use:
+                self._users[client] = self._users.get(client, 0) + 1
+
+        if evicted is not None:
+            evicted.close()
+        return client
+
+    def _evict(self):
+        """Discard the least recently used idle client, or the least
+        recently used client if all are in use.
+
+        :return: The discarded client if it can be closed now.
+        """
+        for topic, client in self._clients.items():
+            if not self._users.get(client):
+                break
+        else:
+            topic, client = next(iter(self._clients.items()))
+        del self._clients[topic]
+        if self._users.get(client):
+            self._retired.add(client)
+            return None
+        return client
+
+    def _make_client(self, topic):
+        options = self.certificates[topic]
+        ssl_context = self.ssl_context_factory(**options)
+        return Client(ssl_context, sandbox=self.sandbox, port=self.port)
@@ -0,0 +1,244 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Local scheduling of pending notifications before they are pushed."""
+
+import heapq
+import itertools
+import logging
+import time
+from collections import deque
+from datetime import datetime
+
+from .message import HIGH_PRIORITY, LOW_PRIORITY
+
+log = logging.getLogger(__name__)
+
+_EPOCH = datetime(1970, 1, 1)
+
+__all__ = ('SendQueue', 'DEFAULT_WEIGHTS')
+
+#: The default share of dequeues given to each priority. With these weights,
+#: four :data:`.HIGH_PRIORITY` messages are sent for every
+#: :data:`.LOW_PRIORITY` message while both queues have pending messages.
+DEFAULT_WEIGHTS = {
+    HIGH_PRIORITY: 4,
+    LOW_PRIORITY: 1,
+}
+
+
+class _Entry(object):
+    __slots__ = ('message', 'token', 'priority', 'deadline', 'dead')
+
+    def __init__(self, message, token, deadline):
+        self.message = message
+        self.token = token
+        self.priority = message.priority
+        self.deadline = deadline
+        self.dead = False
+
+
+class SendQueue(object):
+    """A queue of pending notifications with one FIFO queue per priority.
+
+    Messages are dequeued with smooth weighted round-robin scheduling, so
+    :data:`.HIGH_PRIORITY` messages jump ahead of a large backlog of
+    :data:`.LOW_PRIORITY` messages, while the low priority traffic is still
+    guaranteed its share of the sends. A queue with no pending messages does
+    not accumulate credit, so it cannot burst ahead once it refills.
+
+    Iterating over the queue removes and yields ``(message, token)`` pairs
+    until it is empty::
+
+        for message, token in queue:
+            client.push(message, token)
+
+    :param weights: (optional) A mapping of priority to relative weight.
+        Defaults to :data:`DEFAULT_WEIGHTS`.
+    :param stale_after: (optional) Number of seconds after which a message
+        without an expiration (:data:`.EXPIRE_IMMEDIATELY`) is considered
+        stale and dropped. By default these messages never go stale.
+    :param clock: (optional) A function returning the current UNIX time.
+        Defaults to :func:`time.time`.
+    """
+    def __init__(self, weights=None, stale_after=None, clock=time.time):
+        if weights is None:
+            weights = DEFAULT_WEIGHTS
+        for weight in weights.values():
+            assert weight > 0, 'Invalid weight'
+        self.weights = dict(weights)
+
+        # Ties go to the priority with the highest weight
+        self._order = sorted(self.weights, key=lambda p: -self.weights[p])
+        self._queues = dict((p, deque()) for p in self._order)
+        self._credit = dict((p, 0) for p in self._order)
+        self._counts = dict((p, 0) for p in self._order)
+
+        assert stale_after is None or stale_after >= 0, 'Invalid stale_after'
+        self.stale_after = stale_after
+        self.clock = clock
+        self._deadlines = []
+        # The number of pending messages with a deadline. The heap also
+        # holds the outdated deadlines of sent and replaced messages.
+        self._timed = 0
+        self._seq = itertools.count()
+        self._collapsible = {}
+
+        #: The total number of messages dropped because they expired before
+        #: they could be sent.
+        self.expired = 0
+
+        #: The total number of pending messages that were replaced by a newer
+        #: message with the same token and collapse ID.
+        self.coalesced = 0
+
+    def __len__(self):
+        return sum(self._counts.values())
+
+    def __bool__(self):
+        return any(self._counts.values())
+
+    __nonzero__ = __bool__
+
+    def __iter__(self):
+        while self:
+            yield self.get()
+
+    def pending(self, priority):
+        """The number of pending messages with the given priority."""
+        return self._counts[priority]
+
+    def put(self, message, token):
+        """Add a message to the queue, replacing any pending message with the
+        same token and collapse ID.
+
+        :param message: A :class:`.Message` object.
+        :param token: Device token to push the message to.
+        """
+        assert token, 'Token cannot be empty or null'
+        try:
+            queue = self._queues[message.priority]
+        except KeyError:
+            raise AssertionError('No weight for priority %r' %
+                                 message.priority)
+
+        key = None
+        if message.collapse_id is not None:
+            key = (token, message.collapse_id)
+            pending = self._collapsible.get(key)
+            if pending is not None:
+                self.coalesced += 1
+                if pending.priority == message.priority:
+                    pending.message = message
+                    self._set_deadline(pending, self._deadline(message))
+                    self._compact()
+                    return
+                # The replacement belongs in another priority queue
+                self._discard(pending)
+
+        entry = _Entry(message, token, None)
+        queue.append(entry)
+        self._counts[entry.priority] += 1
+        self._set_deadline(entry, self._deadline(message))
+        if key is not None:
+            self._collapsible[key] = entry
+        self._compact()
+
+    def get(self):
+        """Remove and return the next ``(message, token)`` pair to send.
+        Expired messages are pruned first.
+
+        :raises: :class:`IndexError` if the queue is empty.
+        """
+        self.prune()
+        priority = self._next_priority()
+        if priority is None:
+            raise IndexError('get from an empty queue')
+        queue = self._queues[priority]
+        entry = queue.popleft()
+        while entry.dead:
+            entry = queue.popleft()
+        message, token = entry.message, entry.token
+        self._discard(entry)
+        self._compact()
+        return message, token
+
+    def prune(self):
+        """Drop all pending messages that have expired.
+
+        Only the expired messages are visited. They are removed from their
+        priority queue lazily, when :meth:`get` reaches them.
+
+        :return: The number of messages that were dropped.
+        """
+        now = self.clock()
+        heap = self._deadlines
+        dropped = 0
+        while heap and heap[0][0] <= now:
+            entry = heapq.heappop(heap)[2]
+            # Skip entries already sent, or replaced with a later deadline
+            if entry.dead or entry.deadline is None or entry.deadline > now:
+                continue
+            self._discard(entry)
+            dropped += 1
+        if dropped:
+            self.expired += dropped
+            log.debug('Dropped %d expired messages', dropped)
+        return dropped
+
+    def _discard(self, entry):
+        entry.dead = True
+        self._counts[entry.priority] -= 1
+        if entry.deadline is not None:
+            self._timed -= 1
+        collapse_id = entry.message.collapse_id
+        if collapse_id is not None:
+            key = (entry.token, collapse_id)
+            if self._collapsible.get(key) is entry:
+                del self._collapsible[key]
+        # The entry may stay in the heap or its priority queue for a while,
+        # do not keep the message alive with it
+        entry.message = entry.token = None
+
+    def _set_deadline(self, entry, deadline):
+        if entry.deadline is not None:
+            self._timed -= 1
+        entry.deadline = deadline
+        if deadline is not None:
+            self._timed += 1
+            heapq.heappush(self._deadlines,
+                           (deadline, next(self._seq), entry))
+
+    def _compact(self):
+        """Remove the outdated deadlines from the heap once they outnumber
+        the deadlines of pending messages.
+        """
+        if len(self._deadlines) <= 2 * self._timed:
+            return
+        self._deadlines = [
+            item for item in self._deadlines
+            if not item[2].dead and item[2].deadline == item[0]
+        ]
+        heapq.heapify(self._deadlines)
+
+    def _deadline(self, message):
+        if message.expiration:
+            return (message.expiration - _EPOCH).total_seconds()
+        if self.stale_after is not None:
+            return self.clock() + self.stale_after
+        return None
+
+    def _next_priority(self):
+        best = None
+        total = 0
+        for priority in self._order:
+            if not self._counts[priority]:
+                self._credit[priority] = 0
+                continue
+            self._credit[priority] += self.weights[priority]
+            total += self.weights[priority]
+            if best is None or self._credit[priority] > self._credit[best]:
+                best = priority
+        if best is not None:
+            self._credit[best] -= total
+        return best
@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Background sending with a bounded queue for backpressure."""
+
+import logging
+import threading
+import time
+from collections import deque
+
+from ._compat import queue
+from .client import DEFAULT_WINDOW
+
+__all__ = ('Sender', 'DEFAULT_MAX_MESSAGES', 'DEFAULT_MAX_BYTES')
+
+log = logging.getLogger(__name__)
+
+#: The default maximum number of messages queued by a :class:`Sender`.
+DEFAULT_MAX_MESSAGES = 10000
+
+#: The default maximum total size in bytes of the payloads queued by a
+#: :class:`Sender`.
+DEFAULT_MAX_BYTES = 16 * 1024 * 1024
+
+
+class Sender(object):
+    """Sends messages submitted by producers from a background thread.
+
+    Submitted messages wait in a queue bounded both in number of messages and
+    in total payload size. :meth:`submit` returns immediately while there is
+    room in the queue and blocks when it is full, so producers that generate
+    notifications faster than APNs accepts them are slowed down to the rate of
+    the connection instead of growing an unbounded backlog. asyncio producers
+    can use :meth:`submit_async` instead.
+
+    The sending thread feeds the queue to :meth:`.Client.push_stream`, so up
+    to ``window`` requests stay in flight while messages are waiting. Results
+    are passed to ``callback``::
+
+        def on_result(token, result):
+            if isinstance(result, Unregistered):
+                forget(token)
+
+        sender = Sender(client, callback=on_result)
+        for message, token in notifications:
+            sender.submit(message, token)
+        sender.close()
+
+    :param client: The :class:`.Client` to send with.
+    :param max_messages: (optional) The maximum number of queued messages.
+    :param max_bytes: (optional) The maximum total size of the queued message
+        payloads. A single message larger than this is accepted when the queue
+        is empty.
+    :param window: (optional) The maximum number of requests in flight.
+    :param callback: (optional) A function called from the sending thread
+        with the token and result of every message, as returned by
+        :meth:`.Client.push_stream`.
+    """
+    def __init__(self, client, max_messages=DEFAULT_MAX_MESSAGES,
+                 max_bytes=DEFAULT_MAX_BYTES, window=DEFAULT_WINDOW,
+                 callback=None):
+        assert max_messages > 0, 'Invalid max_messages'
+        assert max_bytes > 0, 'Invalid max_bytes'
+        self.client = client
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self.window = window
+        self.callback = callback
+
+        self._queue = deque()
+        self._bytes = 0
+        self._closed = False
+        self._lock = threading.Condition()
+
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def __len__(self):
+        return len(self._queue)
+
+    @property
+    def queued_bytes(self):
+        """The total size of the queued message payloads."""
+        return self._bytes
+
+    def submit(self, message, token, timeout=None):
+        """Queue a message for sending, waiting for room in the queue if it is
+        full.
+
+        :param message: A :class:`.Message` object.
+        :param token: Device token to push the message to.
+        :param timeout: (optional) The maximum number of seconds to wait.
+        :raises: :class:`queue.Full` if there was no room in the queue before
+            the timeout expired.
+        """
+        assert token, 'Token cannot be empty or null'
+        size = len(message.encoded)
+        deadline = None if timeout is None else time.time() + timeout
+        with self._lock:
+            while not self._has_room(size):
+                remaining = None
+                if deadline is not None:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        raise queue.Full()
+                self._lock.wait(remaining)
+            self._put(message, token, size)
+
+    def submit_async(self, message, token, loop=None):
+        """Queue a message for sending from an asyncio coroutine::
+
+            await sender.submit_async(message, token)
+
+        The returned future completes immediately if there is room in the
+        queue. Otherwise the wait happens in the default executor of the event
+        loop, so the loop is not blocked.
+
+        :param loop: (optional) The event loop. Defaults to the running loop.
+        :return: An :class:`asyncio.Future`.
+        """
+        import asyncio
+        if loop is None:
+            loop = asyncio.get_event_loop()
+        assert token, 'Token cannot be empty or null'
+        size = len(message.encoded)
+        with self._lock:
+            if self._has_room(size):
+                self._put(message, token, size)
+                future = loop.create_future()
+                future.set_result(None)
+                return future
+        return loop.run_in_executor(None, self.submit, message, token)
+
+    def close(self, wait=True):
+        """Stop accepting messages. Messages already queued are still sent.
+
+        :param wait: (optional) Wait until all queued messages are sent.
+        """
+        with self._lock:
+            self._closed = True
+            self._lock.notify_all()
+        if wait:
+            self._thread.join()
+
+    def _has_room(self, size):
+        assert not self._closed, 'Sender is closed'
+        if not self._queue:
+            return True
+        return len(self._queue) < self.max_messages and \
+            self._bytes + size <= self.max_bytes
+
+    def _put(self, message, token, size):
+        self._queue.append((message, token, size))
+        self._bytes += size
+        self._lock.notify_all()
+
+    def _take(self, pending):
+        """Yield queued messages, waiting for more while none are in flight.
+
+        The tokens of the yielded messages are appended to ``pending``. The
+        iteration stops when the queue is empty and messages are in flight,
+        so their results are not held back waiting for new messages, or when
+        the sender is closed and drained.
+        """
+        while True:
+            with self._lock:
+                while not self._queue and not self._closed and not pending:
+                    self._lock.wait()
+                if not self._queue:
+                    return
+                message, token, size = self._queue.popleft()
+                self._bytes -= size
+                self._lock.notify_all()
+            pending.append(token)
+            yield message, token
+
+    def _run(self):
+        while True:
+            pending = []
+            try:
+                results = self.client.push_stream(self._take(pending),
+                                                  window=self.window)
+                for token, result in results:
+                    pending.remove(token)
+                    self._report(token, result)
+            except Exception as e:
+                log.exception('Sending %d messages failed', len(pending))
+                for token in pending:
+                    self._report(token, e)
+            with self._lock:
+                if self._closed and not self._queue:
+                    return
+
+    def _report(self, token, result):
+        if self.callback is None:
+            return
+        try:
+            self.callback(token, result)
+        except Exception:
+            log.exception('Result callback failed')
@@ -1,13 +1,292 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-# Wrapper for OpenSSL context that includes the wrap_socket method:
-from hyper.ssl_compat import SSLContext
-from hyper.tls import H2_NPN_PROTOCOLS
+import re
+import select
+import socket
+import ssl
+
 from OpenSSL import SSL
-from OpenSSL.crypto import load_certificate, load_privatekey, FILETYPE_PEM
+from OpenSSL.crypto import load_certificate, load_privatekey, \
+    dump_certificate, FILETYPE_ASN1, FILETYPE_PEM
+
+try:
+    import service_identity
+    from service_identity.pyopenssl import verify_hostname, \
+        verify_ip_address
+except ImportError:
+    service_identity = None
+
+from ..transport.base import ALPN_PROTOCOLS
+
+__all__ = ('make_ossl_context', 'SSLContext', 'SSLSocket')
+
+# The largest chunk of data written with one SSL_write call
+_WRITE_SIZE = 16 * 1024
+
+# ssl verify modes -> OpenSSL verify modes
+_VERIFY_MODES = {
+    ssl.CERT_NONE: SSL.VERIFY_NONE,
+    ssl.CERT_OPTIONAL: SSL.VERIFY_PEER,
+    ssl.CERT_REQUIRED: SSL.VERIFY_PEER | SSL.VERIFY_FAIL_IF_NO_PEER_CERT,
+}
+
+# Short attribute names of certificate subjects -> the names used by
+# ssl.SSLSocket.getpeercert
+_NAME_ATTRIBUTES = {
+    'C': 'countryName',
+    'ST': 'stateOrProvinceName',
+    'L': 'localityName',
+    'O': 'organizationName',
+    'OU': 'organizationalUnitName',
+    'CN': 'commonName',
+}
+
+_PEM_CERTIFICATE = re.compile(
+    b'-----BEGIN CERTIFICATE-----.+?-----END CERTIFICATE-----', re.DOTALL)
+
+
+class SSLContext(object):
+    """Wraps :class:`OpenSSL.SSL.Context` to provide the parts of the
+    interface of :class:`ssl.SSLContext` used by the transports, including
+    ``hyper``.
+
+    Like :class:`ssl.SSLContext`, peers are not verified unless
+    :attr:`verify_mode` is set, using the :mod:`ssl` constants. Hostname
+    checking with :attr:`check_hostname` requires the ``service_identity``
+    package::
+
+        context.load_verify_locations('ca.pem')
+        context.check_hostname = True
+
+    :param method: The ``OpenSSL.SSL`` method constant.
+    """
+    def __init__(self, method):
+        self._ctx = SSL.Context(method)
+        self._verify_mode = ssl.CERT_NONE
+        self._check_hostname = False
+
+    @property
+    def options(self):
+        return self._ctx.set_options(0)
+
+    @options.setter
+    def options(self, value):
+        self._ctx.set_options(value)
+
+    @property
+    def verify_mode(self):
+        """Whether to verify the certificate of the peer: one of
+        :data:`ssl.CERT_NONE`, :data:`ssl.CERT_OPTIONAL` and
+        :data:`ssl.CERT_REQUIRED`.
+        """
+        return self._verify_mode
+
+    @verify_mode.setter
+    def verify_mode(self, value):
+        if value == ssl.CERT_NONE and self._check_hostname:
+            raise ValueError('Cannot set verify_mode to CERT_NONE when '
+                             'check_hostname is enabled.')
+        self._ctx.set_verify(_VERIFY_MODES[value],
+                             lambda conn, cert, errnum, depth, ok: ok)
+        self._verify_mode = value
+
+    @property
+    def check_hostname(self):
+        """Whether to check that the certificate of the peer matches the
+        ``server_hostname`` passed to :meth:`wrap_socket`. Enabling it also
+        sets :attr:`verify_mode` to :data:`ssl.CERT_REQUIRED` if peers are
+        not verified yet.
+        """
+        return self._check_hostname
+
+    @check_hostname.setter
+    def check_hostname(self, value):
+        if value:
+            assert service_identity is not None, \
+                'The service_identity package is required to check hostnames'
+            if self._verify_mode == ssl.CERT_NONE:
+                self.verify_mode = ssl.CERT_REQUIRED
+        self._check_hostname = bool(value)
+
+    def load_verify_locations(self, cafile=None, capath=None, cadata=None):
+        """Load the certificates of the authorities used to verify peers.
+
+        :param cafile: (optional) The path of a file of PEM certificates.
+        :param capath: (optional) The path of a directory of PEM
+            certificates.
+        :param cadata: (optional) PEM certificates as a string.
+        """
+        if cafile is not None or capath is not None:
+            self._ctx.load_verify_locations(cafile, capath)
+        if cadata is not None:
+            store = self._ctx.get_cert_store()
+            for pem in _PEM_CERTIFICATE.findall(_to_bytes(cadata)):
+                store.add_cert(load_certificate(FILETYPE_PEM, pem))
+
+    def set_default_verify_paths(self):
+        self._ctx.set_default_verify_paths()
+
+    def set_npn_protocols(self, protocols):
+        # NPN was removed from recent pyOpenSSL versions
+        if not hasattr(self._ctx, 'set_npn_select_callback'):
+            return
+        protocols = [_to_bytes(p) for p in protocols]
+
+        def select_protocol(conn, offered):
+            for protocol in protocols:
+                if protocol in offered:
+                    return protocol
+            return b''
+        self._ctx.set_npn_select_callback(select_protocol)
+
+    def set_alpn_protocols(self, protocols):
+        self._ctx.set_alpn_protos([_to_bytes(p) for p in protocols])
+
+    def load_cert_chain(self, certfile, keyfile=None, password=None):
+        if password is not None:
+            self._ctx.set_passwd_cb(lambda *args: _to_bytes(password))
+        self._ctx.use_certificate_chain_file(certfile)
+        self._ctx.use_privatekey_file(keyfile or certfile)
+
+    def wrap_socket(self, sock, server_hostname=None):
+        """Open a TLS connection over a connected socket.
 
-__all__ = ('make_ossl_context')
+        :return: A :class:`SSLSocket`.
+        """
+        conn = SSL.Connection(self._ctx, sock)
+        if server_hostname:
+            conn.set_tlsext_host_name(_to_bytes(server_hostname))
+        conn.set_connect_state()
+        ssl_sock = SSLSocket(conn, sock)
+        try:
+            ssl_sock.do_handshake()
+            if self._check_hostname:
+                ssl_sock.match_hostname(server_hostname)
+        except Exception:
+            ssl_sock.close()
+            raise
+        return ssl_sock
+
+
+class SSLSocket(object):
+    """A TLS connection of :class:`OpenSSL.SSL.Connection` with the blocking
+    socket interface, including timeouts, used by :class:`.H2Transport`.
+    """
+    def __init__(self, conn, sock):
+        self._conn = conn
+        self._sock = sock
+
+    def fileno(self):
+        return self._sock.fileno()
+
+    def settimeout(self, timeout):
+        self._sock.settimeout(timeout)
+
+    def gettimeout(self):
+        return self._sock.gettimeout()
+
+    def setsockopt(self, *args):
+        self._sock.setsockopt(*args)
+
+    def pending(self):
+        return self._conn.pending()
+
+    def selected_alpn_protocol(self):
+        protocol = self._conn.get_alpn_proto_negotiated()
+        return protocol.decode('ascii') if protocol else None
+
+    def selected_npn_protocol(self):
+        get_protocol = getattr(self._conn, 'get_next_proto_negotiated', None)
+        protocol = get_protocol() if get_protocol is not None else None
+        return protocol.decode('ascii') if protocol else None
+
+    def getpeercert(self, binary_form=False):
+        """The certificate of the peer, in the format of
+        :meth:`ssl.SSLSocket.getpeercert`, or ``None`` if it sent none.
+        """
+        cert = self._conn.get_peer_certificate()
+        if cert is None:
+            return None
+        if binary_form:
+            return dump_certificate(FILETYPE_ASN1, cert)
+        return _decode_certificate(cert.to_cryptography())
+
+    def match_hostname(self, hostname):
+        """Check that the certificate of the peer is valid for a hostname
+        or an IP address.
+
+        :raises: :class:`ssl.CertificateError` if it is not.
+        """
+        assert hostname, 'A server_hostname is required to check hostnames'
+        if not isinstance(hostname, bytes):
+            hostname = hostname.encode('idna')
+        hostname = hostname.decode('ascii')
+        try:
+            if _is_ip_address(hostname):
+                verify_ip_address(self._conn, hostname)
+            else:
+                verify_hostname(self._conn, hostname)
+        except (service_identity.VerificationError,
+                service_identity.CertificateError) as e:
+            raise ssl.CertificateError(
+                "Certificate does not match '%s': %s" % (hostname, e))
+
+    def do_handshake(self):
+        try:
+            self._call(self._conn.do_handshake)
+        except SSL.Error as e:
+            raise ssl.SSLError(str(e))
+
+    def recv(self, bufsize, flags=None):
+        return self._recv(self._conn.recv, bufsize)
+
+    def recv_into(self, buffer, nbytes=0, flags=None):
+        result = self._recv(self._conn.recv_into, buffer, nbytes or None)
+        return result or 0
+
+    def send(self, data, flags=None):
+        return self._call(self._conn.send, data)
+
+    def sendall(self, data, flags=None):
+        view = memoryview(data)
+        while len(view):
+            sent = self.send(view[:_WRITE_SIZE])
+            view = view[sent:]
+
+    def close(self):
+        try:
+            self._conn.shutdown()
+        except (SSL.Error, socket.error):
+            pass
+        finally:
+            self._sock.close()
+
+    def _recv(self, method, *args):
+        try:
+            return self._call(method, *args)
+        except SSL.ZeroReturnError:
+            return b''
+        except SSL.SysCallError as e:
+            if e.args[0] == -1:
+                # Unexpected EOF
+                return b''
+            raise socket.error(*e.args)
+
+    def _call(self, method, *args):
+        """Call an ``SSL.Connection`` method, waiting for the socket when it
+        needs to be read or written first, up to the socket timeout.
+        """
+        timeout = self._sock.gettimeout()
+        while True:
+            try:
+                return method(*args)
+            except SSL.WantReadError:
+                ready = select.select([self._sock], [], [], timeout)[0]
+            except SSL.WantWriteError:
+                ready = select.select([], [self._sock], [], timeout)[1]
+            if not ready:
+                raise socket.timeout()
 
 
 def make_ossl_context(certstring=None, keystring=None, certfile=None,
@@ -28,7 +307,7 @@ def make_ossl_context(certstring=None, keystring=None, certfile=None,
     :param protocol: The Channel encryption protocol to use when connecting to
         the APNs gateway.
     :param options: Options to set on the context.
-    :return: A :class:`hyper.ssl_compat.SSLContext`. This class wraps
+    :return: A :class:`SSLContext`. This class wraps
         :class:`OpenSSL.SSL.Context` to provide an interface resembling
         :class:`ssl.SSLContext`. Use this when creating a :class:`.Client`.
     """
@@ -37,8 +316,8 @@ def make_ossl_context(certstring=None, keystring=None, certfile=None,
 
     context = SSLContext(method)
     context.options = options
-    context.set_npn_protocols(H2_NPN_PROTOCOLS)
-    context.set_alpn_protocols(H2_NPN_PROTOCOLS)
+    context.set_npn_protocols(ALPN_PROTOCOLS)
+    context.set_alpn_protocols(ALPN_PROTOCOLS)
 
     if certfile and keyfile:
         context.load_cert_chain(
@@ -58,3 +337,44 @@ def make_ossl_context(certstring=None, keystring=None, certfile=None,
         )
 
     return context
+
+
+def _decode_certificate(cert):
+    """Describe a :mod:`cryptography` certificate in the format of
+    :meth:`ssl.SSLSocket.getpeercert`. Only the subject and the subject
+    alternative names are included.
+    """
+    from cryptography import x509
+    result = {'subject': tuple(
+        tuple((_NAME_ATTRIBUTES.get(attribute.rfc4514_attribute_name,
+                                    attribute.rfc4514_attribute_name),
+               attribute.value) for attribute in rdn)
+        for rdn in cert.subject.rdns
+    )}
+    try:
+        names = cert.extensions.get_extension_for_class(
+            x509.SubjectAlternativeName).value
+    except x509.ExtensionNotFound:
+        return result
+    alt_names = [('DNS', name)
+                 for name in names.get_values_for_type(x509.DNSName)]
+    alt_names.extend(('IP Address', str(address))
+                     for address in names.get_values_for_type(x509.IPAddress))
+    result['subjectAltName'] = tuple(alt_names)
+    return result
+
+
+def _is_ip_address(hostname):
+    for family in (socket.AF_INET, socket.AF_INET6):
+        try:
+            socket.inet_pton(family, hostname)
+        except (socket.error, ValueError):
+            continue
+        return True
+    return False
+
+
+def _to_bytes(value):
+    if isinstance(value, bytes):
+        return value
+    return value.encode('utf-8')
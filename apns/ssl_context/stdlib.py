@@ -7,7 +7,7 @@ stdlib.
 
 import ssl
 
-from hyper.tls import H2_NPN_PROTOCOLS
+from ..transport.base import ALPN_PROTOCOLS
 
 assert hasattr(ssl, 'HAS_ALPN'), 'Your version of Python does not support ' \
     'ALPN, or was compiled against a version of OpenSSL that does not '     \
@@ -41,7 +41,7 @@ def make_ssl_context(certfile=None, keyfile=None, password=None,
     context = ssl.SSLContext(protocol)
     context.options = options
     context.load_cert_chain(certfile, keyfile=keyfile, password=password)
-    context.set_alpn_protocols(H2_NPN_PROTOCOLS)
-    context.set_npn_protocols(H2_NPN_PROTOCOLS)
+    context.set_alpn_protocols(ALPN_PROTOCOLS)
+    context.set_npn_protocols(ALPN_PROTOCOLS)
 
     return context
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Throttling of background (``content-available``) notifications."""
+
+import heapq
+import time
+
+__all__ = ('BackgroundThrottler', 'is_background', 'DEFAULT_WINDOW')
+
+#: The default minimum number of seconds between two background
+#: notifications sent to the same device.
+DEFAULT_WINDOW = 30 * 60
+
+
+def is_background(message):
+    """Whether a message is a silent background notification, i.e. it has
+    ``content-available`` set and nothing to display to the user.
+    """
+    return bool(message.content_available) and \
+        message.alert is None and \
+        message.badge is None and \
+        message.sound is None
+
+
+class BackgroundThrottler(object):
+    """Releases at most one background notification per device token per
+    ``window`` seconds.
+
+    APNs heavily throttles silent notifications, so sending more than a few
+    per hour to a device wastes bandwidth. Submitted messages are held until
+    the window for their token has passed since the last release. A message
+    submitted while another one is still held for the same token supersedes
+    it: the held message is replaced by a copy of the new message (see
+    :meth:`.Message.replace`) into which the :attr:`.Message.extra` data of
+    the held message is merged (the newer values win).
+
+    Call :meth:`release` periodically to collect the messages that are ready
+    to be sent::
+
+        throttler.submit(message, token)
+        ...
+        for message, token in throttler.release():
+            client.push(message, token)
+
+    :param window: (optional) Minimum number of seconds between two released
+        messages for the same token. Defaults to :data:`DEFAULT_WINDOW`.
+    :param clock: (optional) A function returning the current UNIX time.
+        Defaults to :func:`time.time`.
+    """
+    def __init__(self, window=DEFAULT_WINDOW, clock=time.time):
+        assert window >= 0, 'Invalid window'
+        self.window = window
+        self.clock = clock
+
+        # Token -> time of the last release, in whole seconds
+        self._last_sent = {}
+        # Token -> held message
+        self._pending = {}
+        self._schedule = []
+
+        #: The total number of held messages replaced by a newer message.
+        self.superseded = 0
+
+    def __len__(self):
+        return len(self._pending)
+
+    def submit(self, message, token):
+        """Hold a background message until it may be sent to ``token``.
+
+        :param message: A :class:`.Message` for which :func:`is_background`
+            is true.
+        :param token: Device token to push the message to.
+        """
+        assert token, 'Token cannot be empty or null'
+        assert is_background(message), 'Not a background message'
+
+        held = self._pending.get(token)
+        if held is not None:
+            if held.extra:
+                extra = dict(held.extra)
+                extra.update(message.extra)
+                message = message.replace(**extra)
+            self._pending[token] = message
+            self.superseded += 1
+            return
+
+        self._pending[token] = message
+        last_sent = self._last_sent.get(token)
+        release_at = self.clock()
+        if last_sent is not None:
+            release_at = max(release_at, last_sent + self.window)
+        heapq.heappush(self._schedule, (release_at, token))
+
+    def release(self):
+        """Remove and return the held messages which may be sent now.
+
+        :return: A list of ``(message, token)`` pairs.
+        """
+        now = self.clock()
+        schedule = self._schedule
+        released = []
+        while schedule and schedule[0][0] <= now:
+            token = heapq.heappop(schedule)[1]
+            released.append((self._pending.pop(token), token))
+            self._last_sent[token] = int(now)
+        return released
+
+    def next_release(self):
+        """The UNIX time at which the next held message may be released, or
+        ``None`` if no messages are held.
+        """
+        if not self._schedule:
+            return None
+        return self._schedule[0][0]
+
+    def compact(self):
+        """Forget the last release time of tokens whose window has passed.
+
+        Those records no longer hold back any message, so dropping them keeps
+        the per-token state proportional to the recently active devices.
+
+        :return: The number of records removed.
+        """
+        horizon = self.clock() - self.window
+        stale = [token for token, sent in self._last_sent.items()
+                 if sent <= horizon]
+        for token in stale:
+            del self._last_sent[token]
+        return len(stale)
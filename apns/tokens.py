@@ -0,0 +1,299 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Compact representations of device tokens.
+
+Device tokens are 32 bytes long, but are usually handled as 64 character hex
+strings. Holding them as raw bytes halves their size, and the containers in
+this module store many tokens in one contiguous buffer to avoid the overhead
+of one Python object per token.
+"""
+
+import binascii
+import re
+from array import array
+from itertools import compress
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+from ._compat import binary_type, text_type
+
+__all__ = ('DeviceToken', 'TokenArray', 'TokenSet', 'TOKEN_SIZE',
+           'validate_tokens', 'filter_tokens')
+
+#: The size of a device token in bytes.
+TOKEN_SIZE = 32
+
+_DEVICE_PATH = '/3/device/'
+
+_HEX_SIZE = TOKEN_SIZE * 2
+_NOT_HEX = re.compile(b'[^0-9a-fA-F]')
+# Translation table swapping the 0 and 1 bytes of a validation mask
+_INVERT = bytes(bytearray([1, 0]) + bytearray(range(2, 256)))
+
+if numpy is not None:
+    _HEX_TABLE = numpy.zeros(256, dtype=bool)
+    _HEX_TABLE[numpy.frombuffer(b'0123456789abcdefABCDEF',
+                                dtype=numpy.uint8)] = True
+
+
+def _to_raw(token):
+    """Convert a token in any accepted form to its 32 raw bytes."""
+    if isinstance(token, memoryview):
+        token = token.tobytes()
+    if isinstance(token, (binary_type, bytearray)) and \
+            len(token) == TOKEN_SIZE:
+        return bytes(token)
+    if isinstance(token, text_type):
+        token = token.encode('ascii', 'replace')
+    try:
+        raw = binascii.unhexlify(token)
+    except (TypeError, ValueError):
+        raw = None
+    if raw is None or len(raw) != TOKEN_SIZE:
+        raise ValueError('Invalid device token: %r' % (token,))
+    return raw
+
+
+class DeviceToken(binary_type):
+    """A device token stored as its 32 raw bytes.
+
+    Create one from a hex string or from raw bytes::
+
+        token = DeviceToken('a1b2...')
+        token.hex()  # 'a1b2...'
+
+    :class:`.Client` accepts a :class:`DeviceToken` wherever a hex token
+    string is accepted. Converting a token with :func:`str` gives its hex form.
+
+    :raises: :class:`ValueError` if the value is not a valid token.
+    """
+    __slots__ = ()
+
+    def __new__(cls, token):
+        if isinstance(token, cls):
+            return token
+        return binary_type.__new__(cls, _to_raw(token))
+
+    def hex(self):
+        """The token as a lowercase hex string."""
+        return binascii.hexlify(self).decode('ascii')
+
+    @property
+    def path(self):
+        """The APNs request path for this token."""
+        return _DEVICE_PATH + binascii.hexlify(self).decode('ascii')
+
+    def __str__(self):
+        return self.hex()
+
+    def __repr__(self):
+        return 'DeviceToken(%r)' % self.hex()
+
+
+class TokenArray(object):
+    """A list of device tokens backed by a single :class:`bytearray`, using
+    32 bytes per token.
+
+    Indexing and iterating produce :class:`DeviceToken` objects.
+    :meth:`views` iterates over the raw tokens without copying them.
+
+    :param tokens: (optional) An iterable of tokens in any form accepted by
+        :class:`DeviceToken`.
+    """
+    def __init__(self, tokens=()):
+        self._buffer = bytearray()
+        self.extend(tokens)
+
+    def __len__(self):
+        return len(self._buffer) // TOKEN_SIZE
+
+    def __getitem__(self, index):
+        count = len(self)
+        if index < 0:
+            index += count
+        if not 0 <= index < count:
+            raise IndexError('token index out of range')
+        start = index * TOKEN_SIZE
+        return DeviceToken(bytes(self._buffer[start:start + TOKEN_SIZE]))
+
+    def __iter__(self):
+        for view in self.views():
+            yield DeviceToken(view)
+
+    def append(self, token):
+        """Add a token to the end of the array."""
+        self._buffer += _to_raw(token)
+
+    def extend(self, tokens):
+        """Add tokens to the end of the array."""
+        if isinstance(tokens, TokenArray):
+            self._buffer += tokens._buffer
+            return
+        for token in tokens:
+            self._buffer += _to_raw(token)
+
+    def views(self):
+        """Iterate over the tokens as :class:`memoryview` slices of the
+        underlying buffer. The array cannot grow while the iteration is in
+        progress.
+        """
+        view = memoryview(self._buffer)
+        for start in range(0, len(view), TOKEN_SIZE):
+            yield view[start:start + TOKEN_SIZE]
+
+    def tobytes(self):
+        """The raw tokens concatenated into a single bytes object."""
+        return bytes(self._buffer)
+
+
+class TokenSet(object):
+    """A set of unique device tokens, in insertion order.
+
+    Tokens are stored in a :class:`TokenArray` and indexed with an open
+    addressing hash table of 4 byte slots, so membership checks and adds take
+    constant time while using a fraction of the memory of a :class:`set` of
+    strings.
+
+    :param tokens: (optional) An iterable of tokens in any form accepted by
+        :class:`DeviceToken`.
+    """
+    _EMPTY = -1
+
+    def __init__(self, tokens=()):
+        self._tokens = TokenArray()
+        self._slots = array('i', [self._EMPTY]) * 8
+        for token in tokens:
+            self.add(token)
+
+    def __len__(self):
+        return len(self._tokens)
+
+    def __iter__(self):
+        return iter(self._tokens)
+
+    def __contains__(self, token):
+        try:
+            raw = _to_raw(token)
+        except ValueError:
+            return False
+        return self._slots[self._find(raw)] != self._EMPTY
+
+    def add(self, token):
+        """Add a token to the set.
+
+        :return: ``True`` if the token was added, ``False`` if it was already
+            in the set.
+        """
+        raw = _to_raw(token)
+        slot = self._find(raw)
+        if self._slots[slot] != self._EMPTY:
+            return False
+        self._slots[slot] = len(self._tokens)
+        self._tokens.append(raw)
+        if len(self._tokens) * 3 > len(self._slots) * 2:
+            self._grow()
+        return True
+
+    def views(self):
+        """Iterate over the tokens as :class:`memoryview` slices without
+        copying them. See :meth:`TokenArray.views`.
+        """
+        return self._tokens.views()
+
+    def tobytes(self):
+        """The raw tokens concatenated into a single bytes object."""
+        return self._tokens.tobytes()
+
+    def _find(self, raw):
+        """Find the slot holding ``raw``, or the empty slot where it belongs.
+        """
+        slots = self._slots
+        buf = self._tokens._buffer
+        mask = len(slots) - 1
+        i = hash(raw) & mask
+        while True:
+            index = slots[i]
+            if index == self._EMPTY:
+                return i
+            start = index * TOKEN_SIZE
+            if buf[start:start + TOKEN_SIZE] == raw:
+                return i
+            i = (i + 1) & mask
+
+    def _grow(self):
+        self._slots = array('i', [self._EMPTY]) * (len(self._slots) * 2)
+        slots = self._slots
+        mask = len(slots) - 1
+        for index, view in enumerate(self._tokens.views()):
+            i = hash(view.tobytes()) & mask
+            while slots[i] != self._EMPTY:
+                i = (i + 1) & mask
+            slots[i] = index
+
+
+def validate_tokens(tokens):
+    """Check the format of many tokens at once.
+
+    Tokens given as hex strings must be 64 hex characters long. Raw tokens
+    (:class:`DeviceToken` objects or other 32 byte binary values) are always
+    valid. The hex tokens are checked together: they are joined into one
+    buffer which is scanned for non hex characters in a single pass, or with
+    a vectorised table lookup if NumPy is installed.
+
+    :param tokens: A sequence of tokens.
+    :return: A :class:`bytearray` with one entry per token, ``1`` if the token
+        is valid and ``0`` if it is not.
+    """
+    mask = bytearray(len(tokens))
+    candidates = []
+    chunks = []
+    for i, token in enumerate(tokens):
+        if isinstance(token, text_type):
+            if len(token) != _HEX_SIZE:
+                continue
+            try:
+                token = token.encode('ascii')
+            except UnicodeError:
+                continue
+        elif not isinstance(token, (binary_type, bytearray)):
+            continue
+        elif len(token) == TOKEN_SIZE:
+            mask[i] = 1
+            continue
+        elif len(token) != _HEX_SIZE:
+            continue
+        candidates.append(i)
+        chunks.append(token)
+
+    if not candidates:
+        return mask
+
+    buf = b''.join(chunks)
+    if numpy is not None:
+        chars = numpy.frombuffer(buf, dtype=numpy.uint8)
+        valid = _HEX_TABLE[chars].reshape(-1, _HEX_SIZE).all(axis=1)
+        for i, ok in zip(candidates, valid.tolist()):
+            mask[i] = ok
+    else:
+        for i in candidates:
+            mask[i] = 1
+        for match in _NOT_HEX.finditer(buf):
+            mask[candidates[match.start() // _HEX_SIZE]] = 0
+    return mask
+
+
+def filter_tokens(tokens):
+    """Split tokens into valid and invalid ones using
+    :func:`validate_tokens`.
+
+    :param tokens: A sequence of tokens.
+    :return: A tuple of a list of valid tokens and a list of invalid tokens.
+    """
+    mask = validate_tokens(tokens)
+    valid = list(compress(tokens, mask))
+    invalid = list(compress(tokens, mask.translate(_INVERT)))
+    return valid, invalid
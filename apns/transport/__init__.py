@@ -0,0 +1,20 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from .base import Transport, Response, ALPN_PROTOCOLS  # noqa
+from .resolver import Resolver, DEFAULT_RESOLVER  # noqa
+try:
+    from .h2_transport import H2Transport  # noqa
+except ImportError:  # pragma: no cover
+    H2Transport = None
+try:
+    from .hyper_transport import HyperTransport  # noqa
+except ImportError:  # pragma: no cover
+    HyperTransport = None
+
+#: The transport used by :class:`.Client` by default: :class:`.H2Transport`,
+#: or :class:`.HyperTransport` if ``h2`` is not installed.
+DEFAULT_TRANSPORT = H2Transport or HyperTransport
+
+__all__ = ('Transport', 'Response', 'H2Transport', 'HyperTransport',
+           'DEFAULT_TRANSPORT', 'Resolver', 'DEFAULT_RESOLVER')
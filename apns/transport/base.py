@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""The interface between :class:`.Client` and an HTTP/2 implementation."""
+
+__all__ = ('Transport', 'Response', 'ALPN_PROTOCOLS', 'CANCEL')
+
+#: The protocols to negotiate with ALPN or NPN when connecting to APNs.
+ALPN_PROTOCOLS = ['h2', 'h2-16', 'h2-15', 'h2-14']
+
+#: HTTP/2 error code used to cancel a request.
+CANCEL = 0x8
+
+
+class Response(object):
+    """The response to a request.
+
+    :param status: The HTTP status code.
+    :param headers: A dictionary mapping lowercase header names to lists of
+        values.
+    :param body: The response body.
+    """
+    __slots__ = ('status', 'headers', 'body')
+
+    def __init__(self, status, headers, body=b''):
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+    def read(self):
+        """The response body."""
+        return self.body
+
+
+class Transport(object):
+    """Base class of the HTTP/2 connections used by :class:`.Client`.
+
+    A transport multiplexes many requests onto a single connection to the
+    gateway. It connects lazily, when the first request is made. Requests are
+    identified by the stream ID returned by :meth:`request`.
+
+    :param host: The hostname of the gateway.
+    :param port: The port of the gateway.
+    :param ssl_context: The SSL context to connect with.
+    """
+    def __init__(self, host, port, ssl_context):
+        self.host = host
+        self.port = port
+        self.ssl_context = ssl_context
+
+    def request(self, method, path, body=None, headers=None):
+        """Start a request.
+
+        :param method: The HTTP method.
+        :param path: The request path.
+        :param body: (optional) The request body.
+        :param headers: (optional) A dictionary of headers, or a sequence of
+            ``(name, value)`` pairs such as :attr:`.Message.header_items`.
+        :return: The stream ID of the request.
+        """
+        raise NotImplementedError()
+
+    def get_response(self, stream_id, timeout=None):
+        """Wait for the response to a request.
+
+        :param timeout: (optional) The maximum number of seconds to wait.
+        :return: A :class:`Response`, or an object with the same interface.
+        :raises: :class:`socket.timeout` if no response was received in time.
+        """
+        raise NotImplementedError()
+
+    def poll(self):
+        """Process the data already received from the gateway, without
+        blocking.
+        """
+
+    def is_complete(self, stream_id):
+        """Whether the response to a request has been received, so
+        :meth:`get_response` will not block.
+        """
+        return False
+
+    def reset(self, stream_id, error_code=CANCEL):
+        """Cancel a request by resetting its stream. Other requests on the
+        connection are not affected.
+        """
+        raise NotImplementedError()
+
+    def close(self):
+        """Close the connection. It is reopened by the next request."""
+        raise NotImplementedError()
@@ -0,0 +1,496 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""A transport built directly on the ``h2`` HTTP/2 state machine."""
+
+import select
+import socket
+import ssl
+import threading
+import time
+
+from h2.config import H2Configuration
+from h2.connection import H2Connection
+from h2.events import ConnectionTerminated, DataReceived, ResponseReceived, \
+    StreamEnded, StreamReset
+from h2.exceptions import ProtocolError
+
+from .base import Transport, Response, CANCEL
+from .resolver import DEFAULT_RESOLVER
+
+__all__ = ('H2Transport', 'DEFAULT_WRITE_BUFFER_SIZE',
+           'DEFAULT_FLUSH_INTERVAL', 'DEFAULT_INITIAL_WINDOW_SIZE',
+           'DEFAULT_CONNECTION_WINDOW_SIZE')
+
+#: The default number of bytes of outgoing frames :class:`H2Transport` buffers
+#: before writing them to the socket.
+DEFAULT_WRITE_BUFFER_SIZE = 64 * 1024
+
+#: The default maximum number of seconds outgoing frames stay in the write
+#: buffer of :class:`H2Transport` (500 microseconds).
+DEFAULT_FLUSH_INTERVAL = 0.0005
+
+#: The default receive window of each stream of :class:`H2Transport`,
+#: advertised in the ``SETTINGS_INITIAL_WINDOW_SIZE`` setting.
+DEFAULT_INITIAL_WINDOW_SIZE = 1024 * 1024
+
+#: The default receive window of the whole connection of
+#: :class:`H2Transport`, enlarged with a ``WINDOW_UPDATE`` frame on connect.
+DEFAULT_CONNECTION_WINDOW_SIZE = 16 * 1024 * 1024
+
+# The initial flow control window of HTTP/2 streams and connections
+_DEFAULT_WINDOW_SIZE = 65535
+
+# The SETTINGS_INITIAL_WINDOW_SIZE setting code
+_INITIAL_WINDOW_SIZE = 0x4
+
+_READ_SIZE = 64 * 1024
+
+# The HTTP/2 stream ID in the IDs returned by H2Transport.request
+_STREAM_ID_MASK = 0xffffffff
+
+# The number of buffers passed to sendmsg at once (the usual IOV_MAX)
+_MAX_IOV = 1024
+
+
+class _Stream(object):
+    __slots__ = ('status', 'headers', 'data', 'complete', 'error_code')
+
+    def __init__(self):
+        self.status = None
+        self.headers = {}
+        self.data = []
+        self.complete = False
+        self.error_code = None
+
+
+class H2Transport(Transport):
+    """A :class:`.Transport` using the ``h2`` protocol state machine over a
+    plain blocking socket.
+
+    Requests do not write to the socket themselves. The frames of each new
+    request are added to a write buffer, which is flushed once it holds
+    ``write_buffer_size`` bytes, ``flush_interval`` seconds after the first
+    frame was buffered, or before waiting for a response. When many requests
+    are started before their responses are read, as :meth:`.Client.push_many`
+    does, their HEADERS and DATA frames are written together in large TLS
+    records with one system call.
+
+    The buffered chunks are written with a single scatter/gather ``sendmsg``
+    call on sockets which support it. TLS sockets do not, so the chunks are
+    joined and written with ``sendall``, which the TLS layer splits into
+    records of the maximum size.
+
+    HTTP/2 flow control limits the data in flight in both directions. The
+    receive windows are advertised to the gateway on connect, so responses
+    never wait for ``WINDOW_UPDATE`` frames. The send windows are set by the
+    gateway; a new request is only started when the connection window has
+    room for its whole body, or no other request is in flight. Otherwise
+    the transport writes its buffer and reads from the gateway until the
+    window is updated, instead of buffering frames which cannot be sent yet.
+
+    :param host: The hostname of the gateway.
+    :param port: The port of the gateway.
+    :param ssl_context: The SSL context to connect with, or ``None`` to
+        connect without TLS (for testing).
+    :param write_buffer_size: (optional) The number of buffered bytes which
+        triggers a write.
+    :param flush_interval: (optional) The maximum number of seconds frames
+        are buffered before they are written by a background thread, or
+        ``None`` to only write when the buffer is full or a response is
+        waited for.
+    :param connect_timeout: (optional) Timeout in seconds for connecting to
+        each address of the gateway. Defaults to the ``connect_timeout`` of
+        the resolver.
+    :param initial_window_size: (optional) The receive window of each stream
+        in bytes.
+    :param connection_window_size: (optional) The receive window of the
+        connection in bytes.
+    :param resolver: (optional) The :class:`.Resolver` choosing the address
+        to connect to. Defaults to :data:`.DEFAULT_RESOLVER`.
+    """
+    def __init__(self, host, port, ssl_context,
+                 write_buffer_size=DEFAULT_WRITE_BUFFER_SIZE,
+                 flush_interval=DEFAULT_FLUSH_INTERVAL,
+                 connect_timeout=None,
+                 initial_window_size=DEFAULT_INITIAL_WINDOW_SIZE,
+                 connection_window_size=DEFAULT_CONNECTION_WINDOW_SIZE,
+                 resolver=None):
+        Transport.__init__(self, host, port, ssl_context)
+        assert 0 < initial_window_size < 2 ** 31, 'Invalid window size'
+        assert 0 < connection_window_size < 2 ** 31, 'Invalid window size'
+        self.write_buffer_size = write_buffer_size
+        self.flush_interval = flush_interval
+        self.connect_timeout = connect_timeout
+        self.initial_window_size = initial_window_size
+        self.connection_window_size = connection_window_size
+        self.resolver = resolver or DEFAULT_RESOLVER
+        #: The address of the open connection
+        self.address = None
+
+        self._authority = _to_bytes(host)
+        self._lock = threading.RLock()
+        self._flush_needed = threading.Condition(self._lock)
+        self._flush_at = None
+        self._flusher = None
+        self._sock = None
+        self._conn = None
+        # Maps the IDs returned by request() to streams. The IDs combine the
+        # HTTP/2 stream ID with the number of the connection, so the streams
+        # of a closed connection never collide with those of the next one.
+        self._streams = {}
+        self._generation = 0
+        self._outbound = []
+        self._outbound_size = 0
+        self._terminated = False
+
+    def connect(self):
+        """Open the connection. This happens automatically on the first
+        request.
+        """
+        with self._lock:
+            if self._sock is not None:
+                return
+            sock, address = self.resolver.connect(self.host, self.port,
+                                                  self.connect_timeout)
+            try:
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                if self.ssl_context is not None:
+                    sock = self.ssl_context.wrap_socket(
+                        sock,
+                        server_hostname=self.host
+                    )
+                sock.settimeout(None)
+            except Exception as e:
+                sock.close()
+                self.resolver.release(address)
+                if isinstance(e, socket.error):
+                    # E.g. a TLS handshake timeout. Other errors, such as a
+                    # rejected certificate, do not depend on the address.
+                    self.resolver.quarantine(address)
+                raise
+            self.address = address
+
+            conn = H2Connection(config=H2Configuration(
+                client_side=True,
+                header_encoding=None,
+            ))
+            conn.initiate_connection()
+            if self.initial_window_size != _DEFAULT_WINDOW_SIZE:
+                conn.update_settings(
+                    {_INITIAL_WINDOW_SIZE: self.initial_window_size}
+                )
+            if self.connection_window_size > _DEFAULT_WINDOW_SIZE:
+                conn.increment_flow_control_window(
+                    self.connection_window_size - _DEFAULT_WINDOW_SIZE
+                )
+            self._sock = sock
+            self._conn = conn
+            self._terminated = False
+            self._write()
+
+    def request(self, method, path, body=None, headers=None):
+        with self._lock:
+            if self._terminated:
+                # The gateway sent GOAWAY, start over on a new connection
+                self.close()
+            self.connect()
+            conn = self._conn
+
+            while conn.open_outbound_streams >= \
+                    conn.remote_settings.max_concurrent_streams:
+                # The buffered requests must reach the gateway before their
+                # responses can free a stream
+                self._write()
+                self._read()
+            if body:
+                self._wait_for_window(len(body))
+
+            raw_id = conn.get_next_available_stream_id()
+            request_headers = [
+                (b':method', _to_bytes(method)),
+                (b':scheme', b'https'),
+                (b':authority', self._authority),
+                (b':path', _to_bytes(path)),
+            ]
+            if isinstance(headers, dict):
+                request_headers.extend(
+                    (_to_bytes(k), _to_bytes(v)) for k, v in headers.items()
+                )
+            elif headers:
+                # Already encoded, e.g. Message.header_items
+                request_headers.extend(headers)
+            conn.send_headers(raw_id, request_headers, end_stream=not body)
+            stream_id = self._generation << 32 | raw_id
+            self._streams[stream_id] = _Stream()
+            if body:
+                self._send_body(raw_id, body)
+            self._buffer()
+            return stream_id
+
+    def get_response(self, stream_id, timeout=None):
+        deadline = None if timeout is None else time.time() + timeout
+        with self._lock:
+            stream = self._streams[stream_id]
+            self._write()
+            while not stream.complete:
+                remaining = None
+                if deadline is not None:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        raise socket.timeout()
+                self._read(remaining)
+            del self._streams[stream_id]
+
+        if stream.error_code is not None:
+            raise socket.error('Stream %d was reset with error code %d' %
+                               (stream_id & _STREAM_ID_MASK,
+                                stream.error_code))
+        return Response(stream.status, stream.headers, b''.join(stream.data))
+
+    def poll(self):
+        with self._lock:
+            if self._sock is None:
+                return
+            self._write()
+            pending = getattr(self._sock, 'pending', None)
+            if (pending is not None and pending()) or \
+                    select.select([self._sock], [], [], 0)[0]:
+                self._read()
+
+    def is_complete(self, stream_id):
+        stream = self._streams.get(stream_id)
+        return stream is not None and stream.complete
+
+    def reset(self, stream_id, error_code=CANCEL):
+        with self._lock:
+            self._streams.pop(stream_id, None)
+            if self._conn is None or stream_id >> 32 != self._generation:
+                # The stream was already closed with its connection
+                return
+            self._conn.reset_stream(stream_id & _STREAM_ID_MASK,
+                                    error_code=error_code)
+            self._buffer()
+            self._write()
+
+    def close(self):
+        with self._lock:
+            sock, conn = self._sock, self._conn
+            self._sock = self._conn = None
+            if self.address is not None:
+                self.resolver.release(self.address)
+                self.address = None
+            # Requests without a response fail; responses which were
+            # already received can still be read
+            for stream in self._streams.values():
+                if not stream.complete:
+                    stream.error_code = CANCEL
+                    stream.complete = True
+            if sock is not None:
+                self._generation += 1
+            self._outbound = []
+            self._outbound_size = 0
+            self._flush_at = None
+            self._flush_needed.notify_all()
+            if sock is None:
+                return
+            try:
+                conn.close_connection()
+                sock.sendall(conn.data_to_send())
+            except Exception:
+                pass
+            finally:
+                sock.close()
+
+    def _send_body(self, stream_id, body):
+        conn = self._conn
+        view = memoryview(body)
+        sent = 0
+        while sent < len(view):
+            window = min(conn.local_flow_control_window(stream_id),
+                         conn.max_outbound_frame_size)
+            if window <= 0:
+                # Wait for the gateway to open the flow control window
+                self._buffer()
+                self._write()
+                self._read()
+                continue
+            if sent == 0 and len(view) <= window:
+                # The whole body fits in one frame, pass it on as is
+                conn.send_data(stream_id, body, end_stream=True)
+                return
+            chunk = view[sent:sent + window]
+            sent += len(chunk)
+            conn.send_data(stream_id, chunk, end_stream=sent >= len(view))
+
+    def _wait_for_window(self, size):
+        """Wait until the connection send window can take ``size`` bytes,
+        as long as other requests are in flight, so a new stream does not
+        buffer DATA frames which cannot be sent yet.
+        """
+        conn = self._conn
+        while conn.outbound_flow_control_window < size and \
+                any(not stream.complete for stream in self._streams.values()):
+            self._write()
+            self._read()
+
+    def _buffer(self):
+        """Move the pending frames of the state machine to the write buffer,
+        and write it out if it is full.
+        """
+        data = self._conn.data_to_send()
+        if data:
+            self._outbound.append(data)
+            self._outbound_size += len(data)
+        if self._outbound_size >= self.write_buffer_size:
+            self._write()
+        elif self._outbound:
+            self._schedule_flush()
+
+    def _schedule_flush(self):
+        if self.flush_interval is None or self._flush_at is not None:
+            return
+        self._flush_at = time.time() + self.flush_interval
+        if self._flusher is None:
+            self._flusher = threading.Thread(target=self._run_flusher)
+            self._flusher.daemon = True
+            self._flusher.start()
+        else:
+            self._flush_needed.notify()
+
+    def _run_flusher(self):
+        """Write out buffered frames when they have waited for
+        ``flush_interval``. Runs in a background thread until the connection
+        is closed.
+        """
+        with self._lock:
+            while self._sock is not None:
+                if self._flush_at is None:
+                    self._flush_needed.wait()
+                    continue
+                remaining = self._flush_at - time.time()
+                if remaining > 0:
+                    self._flush_needed.wait(remaining)
+                    continue
+                try:
+                    self._write()
+                except socket.error:
+                    pass
+            self._flusher = None
+
+    def _write(self):
+        self._flush_at = None
+        if self._conn is None:
+            return
+        data = self._conn.data_to_send()
+        if data:
+            self._outbound.append(data)
+        if not self._outbound:
+            return
+        chunks = self._outbound
+        self._outbound = []
+        self._outbound_size = 0
+        try:
+            if hasattr(self._sock, 'sendmsg') and \
+                    not isinstance(self._sock, ssl.SSLSocket):
+                _sendmsg_all(self._sock, chunks)
+            else:
+                self._sock.sendall(b''.join(chunks))
+        except socket.error:
+            self.close()
+            raise
+
+    def _read(self, timeout=None):
+        """Read from the socket once and process the received frames."""
+        sock = self._sock
+        if sock is None:
+            raise socket.error('Connection is closed')
+        sock.settimeout(timeout)
+        try:
+            data = sock.recv(_READ_SIZE)
+        except socket.timeout:
+            raise
+        except socket.error:
+            self.close()
+            raise
+        finally:
+            if self._sock is not None:
+                sock.settimeout(None)
+        if not data:
+            self.close()
+            raise socket.error('Connection closed by the gateway')
+
+        try:
+            events = self._conn.receive_data(data)
+        except ProtocolError as e:
+            self.close()
+            raise socket.error('HTTP/2 protocol error: %s' % e)
+
+        generation = self._generation << 32
+        for event in events:
+            stream_id = getattr(event, 'stream_id', None)
+            stream = None
+            if stream_id:
+                stream = self._streams.get(generation | stream_id)
+            if isinstance(event, ResponseReceived):
+                if stream is not None:
+                    _set_headers(stream, event.headers)
+            elif isinstance(event, DataReceived):
+                self._conn.acknowledge_received_data(
+                    event.flow_controlled_length, event.stream_id
+                )
+                if stream is not None:
+                    stream.data.append(event.data)
+            elif isinstance(event, StreamEnded):
+                if stream is not None:
+                    stream.complete = True
+            elif isinstance(event, StreamReset):
+                if stream is not None:
+                    stream.error_code = event.error_code
+                    stream.complete = True
+            elif isinstance(event, ConnectionTerminated):
+                self._terminate()
+                break
+        self._write()
+
+    def _terminate(self):
+        """Handle a GOAWAY frame: new requests are sent on a new connection.
+
+        The ``h2`` state machine rejects all frames received after GOAWAY, so
+        the responses to requests in flight, even those the gateway still
+        processes, can not be read. These requests fail.
+        """
+        self._terminated = True
+        for stream in self._streams.values():
+            if not stream.complete:
+                stream.error_code = CANCEL
+                stream.complete = True
+
+
+def _sendmsg_all(sock, chunks):
+    """Write all ``chunks`` with as few ``sendmsg`` calls as possible."""
+    chunks = [memoryview(chunk) for chunk in chunks]
+    start = 0
+    while start < len(chunks):
+        sent = sock.sendmsg(chunks[start:start + _MAX_IOV])
+        while start < len(chunks) and sent >= len(chunks[start]):
+            sent -= len(chunks[start])
+            start += 1
+        if sent:
+            chunks[start] = chunks[start][sent:]
+
+
+def _to_bytes(value):
+    if isinstance(value, bytes):
+        return value
+    return str(value).encode('utf-8')
+
+
+def _set_headers(stream, headers):
+    for name, value in headers:
+        name = name.decode('utf-8')
+        value = value.decode('utf-8')
+        if name == ':status':
+            stream.status = int(value)
+        else:
+            stream.headers.setdefault(name, []).append(value)
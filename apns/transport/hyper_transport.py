@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""A transport using the ``hyper`` HTTP/2 client."""
+
+from hyper import HTTP20Connection
+
+from .base import Transport, CANCEL
+
+__all__ = ('HyperTransport',)
+
+
+class HyperTransport(Transport):
+    """A :class:`.Transport` using :class:`hyper.HTTP20Connection`.
+
+    This was the only transport before :class:`.H2Transport` was added, and
+    remains available as a fallback. It requires the ``hyper`` package.
+    """
+    def __init__(self, host, port, ssl_context):
+        Transport.__init__(self, host, port, ssl_context)
+        # hyper only uses TLS on port 443 by default, but APNs requires it
+        # on the alternate port too
+        self._connection = HTTP20Connection(
+            host,
+            port=port,
+            secure=True,
+            ssl_context=ssl_context
+        )
+
+    def request(self, method, path, body=None, headers=None):
+        if headers is not None and not isinstance(headers, dict):
+            headers = dict(headers)
+        return self._connection.request(method, path, body=body,
+                                        headers=headers)
+
+    def get_response(self, stream_id, timeout=None):
+        if timeout is None or self.is_complete(stream_id):
+            return self._connection.get_response(stream_id)
+
+        # hyper reads from a buffered wrapper of the socket
+        sock = getattr(self._connection._sock, '_sck', None)
+        if sock is None:
+            return self._connection.get_response(stream_id)
+        sock.settimeout(timeout)
+        try:
+            return self._connection.get_response(stream_id)
+        finally:
+            sock.settimeout(None)
+
+    def is_complete(self, stream_id):
+        stream = self._connection.streams.get(stream_id)
+        return getattr(stream, 'response_headers', None) is not None
+
+    def reset(self, stream_id, error_code=CANCEL):
+        self._connection._send_rst_frame(stream_id, error_code)
+
+    def close(self):
+        self._connection.close()
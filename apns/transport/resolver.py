@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Resolving the gateway hostname and spreading connections over its
+addresses.
+"""
+
+import socket
+import threading
+import time
+
+__all__ = ('Resolver', 'DEFAULT_RESOLVER', 'DEFAULT_TTL',
+           'DEFAULT_QUARANTINE_TIME', 'DEFAULT_CONNECT_TIMEOUT')
+
+#: The default number of seconds the addresses of a host are cached.
+DEFAULT_TTL = 60
+
+#: The default number of seconds an address is avoided after a failure.
+DEFAULT_QUARANTINE_TIME = 30
+
+#: The default number of seconds to wait for a connection to one address
+#: before trying the next one.
+DEFAULT_CONNECT_TIMEOUT = 10
+
+
+def _getaddrinfo(host, port):
+    return [
+        (family, sockaddr) for family, _, _, _, sockaddr in
+        socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)
+    ]
+
+
+class Resolver(object):
+    """Resolves hostnames to all of their IPv4 and IPv6 addresses, and
+    chooses the address of each new connection.
+
+    The APNs hostnames resolve to many addresses. Instead of always using the
+    first one, each connection goes to the address with the fewest open
+    connections, taking turns between equally used ones. Addresses which
+    fail to accept a connection within ``connect_timeout`` are quarantined:
+    they are only tried again after ``quarantine_time``, or when all other
+    addresses fail too.
+
+    The addresses are cached for ``ttl`` seconds. The cache is kept when a
+    lookup fails, so a DNS outage does not stop new connections.
+
+    :data:`DEFAULT_RESOLVER` is shared by all transports of the process, so
+    a pool of :class:`.Client` objects uses every address::
+
+        clients = [Client(ssl_context) for _ in range(8)]
+
+    :param ttl: (optional) The number of seconds addresses are cached.
+    :param quarantine_time: (optional) The number of seconds a failing
+        address is avoided.
+    :param connect_timeout: (optional) The default number of seconds to wait
+        for a connection to one address.
+    :param resolve: (optional) A function called with a hostname and a port
+        and returning a list of ``(family, sockaddr)`` pairs, used instead of
+        :func:`socket.getaddrinfo`, e.g. to connect to local test servers.
+    """
+    def __init__(self, ttl=DEFAULT_TTL,
+                 quarantine_time=DEFAULT_QUARANTINE_TIME,
+                 connect_timeout=DEFAULT_CONNECT_TIMEOUT, resolve=None):
+        self.ttl = ttl
+        self.quarantine_time = quarantine_time
+        self.connect_timeout = connect_timeout
+        self._resolve = resolve or _getaddrinfo
+
+        self._lock = threading.Lock()
+        # (host, port) -> (expiration time, addresses)
+        self._cache = {}
+        # (host, port) -> the number of addresses chosen so far
+        self._turns = {}
+        # sockaddr -> end of the quarantine
+        self._quarantined = {}
+        # sockaddr -> the number of open connections
+        self._connections = {}
+
+    def resolve(self, host, port):
+        """All addresses of a host.
+
+        :return: A list of ``(family, sockaddr)`` pairs.
+        :raises: :class:`socket.gaierror` if the host has no addresses and
+            none are cached.
+        """
+        key = (host, port)
+        now = time.time()
+        with self._lock:
+            entry = self._cache.get(key)
+        if entry is not None and entry[0] > now:
+            return entry[1]
+
+        try:
+            addresses = []
+            for address in self._resolve(host, port):
+                if address not in addresses:
+                    addresses.append(address)
+            if not addresses:
+                raise socket.gaierror('No addresses found for %s' % host)
+        except socket.error:
+            if entry is None:
+                raise
+            # Keep using the stale addresses until the lookup succeeds
+            addresses = entry[1]
+        with self._lock:
+            self._cache[key] = (now + self.ttl, addresses)
+        return addresses
+
+    def candidates(self, host, port):
+        """The addresses of a host in the order a new connection should try
+        them: healthy addresses with the fewest connections first, and
+        quarantined addresses last.
+        """
+        addresses = self.resolve(host, port)
+        key = (host, port)
+        now = time.time()
+        with self._lock:
+            turn = self._turns.get(key, 0)
+            self._turns[key] = turn + 1
+            start = turn % len(addresses)
+            rotated = addresses[start:] + addresses[:start]
+
+            def order(address):
+                until = self._quarantined.get(address[1], 0)
+                return (until if until > now else 0,
+                        self._connections.get(address[1], 0))
+
+            # The sort is stable, so equally used addresses take turns
+            return sorted(rotated, key=order)
+
+    def connect(self, host, port, timeout=None):
+        """Open a TCP connection to one of the addresses of a host, trying
+        the next candidate when one fails. Failing addresses are quarantined.
+
+        :param timeout: (optional) The number of seconds to wait for each
+            address. Defaults to ``connect_timeout``.
+        :return: A tuple of the connected socket and its ``sockaddr``, which
+            must be passed to :meth:`release` once the socket is closed.
+        :raises: :class:`socket.error` if no address accepted the connection.
+        """
+        if timeout is None:
+            timeout = self.connect_timeout
+        error = None
+        for family, sockaddr in self.candidates(host, port):
+            sock = socket.socket(family, socket.SOCK_STREAM)
+            sock.settimeout(timeout)
+            try:
+                sock.connect(sockaddr)
+            except socket.error as e:
+                sock.close()
+                self.quarantine(sockaddr)
+                error = e
+                continue
+            with self._lock:
+                self._quarantined.pop(sockaddr, None)
+                self._connections[sockaddr] = \
+                    self._connections.get(sockaddr, 0) + 1
+            return sock, sockaddr
+        raise error
+
+    def release(self, sockaddr):
+        """Record that a connection opened with :meth:`connect` was closed.
+        """
+        with self._lock:
+            count = self._connections.get(sockaddr, 0) - 1
+            if count > 0:
+                self._connections[sockaddr] = count
+            else:
+                self._connections.pop(sockaddr, None)
+
+    def quarantine(self, sockaddr, duration=None):
+        """Avoid an address for new connections, e.g. after it was slow to
+        respond.
+
+        :param duration: (optional) The number of seconds to avoid the
+            address. Defaults to ``quarantine_time``.
+        """
+        if duration is None:
+            duration = self.quarantine_time
+        with self._lock:
+            self._quarantined[sockaddr] = time.time() + duration
+
+    def is_quarantined(self, sockaddr):
+        """Whether an address is currently quarantined."""
+        return self._quarantined.get(sockaddr, 0) > time.time()
+
+    def clear(self):
+        """Forget all cached addresses and quarantines."""
+        with self._lock:
+            self._cache.clear()
+            self._quarantined.clear()
+
+
+#: The :class:`Resolver` used by transports by default.
+DEFAULT_RESOLVER = Resolver()
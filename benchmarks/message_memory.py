@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Measure the memory used per :class:`apns.Message` object.
+
+Run from the repository root::
+
+    python benchmarks/message_memory.py [count]
+
+Requires Python 3.4+ for :mod:`tracemalloc`.
+"""
+
+import gc
+import sys
+import tracemalloc
+
+from apns import Message, Alert
+
+
+def build(count, encode):
+    messages = []
+    for i in range(count):
+        m = Message(topic='com.example.app', badge=i,
+                    alert=Alert('Title', 'Body'), sound='default')
+        if encode:
+            m.encoded
+            m.header_items
+        messages.append(m)
+    return messages
+
+
+def measure(count, encode):
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    messages = build(count, encode)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    # Exclude the list holding the messages
+    used = after - before - sys.getsizeof(messages)
+    del messages
+    return used / float(count)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    count = int(argv[0]) if argv else 100000
+    print('%d messages' % count)
+    print('  new:     %7.1f bytes per message' % measure(count, False))
+    print('  encoded: %7.1f bytes per message' % measure(count, True))
+
+
+if __name__ == '__main__':
+    main()
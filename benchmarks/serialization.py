@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Compare :meth:`apns.Message.to_bytes` with :mod:`pickle` for sending
+messages to another process.
+
+Run from the repository root::
+
+    python benchmarks/serialization.py [count]
+"""
+
+import pickle
+import sys
+import timeit
+import uuid
+from datetime import datetime
+
+from apns import Message, Alert
+
+
+def make_message():
+    m = Message(id=uuid.uuid4(), topic='com.example.app',
+                alert=Alert('Title', 'Body of the notification'),
+                badge=3, sound='default', expiration=datetime(2030, 1, 1),
+                collapse_id='news', article={'id': 1234})
+    # Messages are usually encoded before they are handed over
+    m.encoded
+    return m
+
+
+def report(name, size, dump, load, count):
+    dump_time = min(timeit.repeat(dump, number=count, repeat=3))
+    load_time = min(timeit.repeat(load, number=count, repeat=3))
+    print('%-10s %5d bytes  dump %6.2f us  load %6.2f us' % (
+        name, size, dump_time / count * 1e6, load_time / count * 1e6))
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    count = int(argv[0]) if argv else 20000
+    m = make_message()
+
+    pickled = pickle.dumps(m, pickle.HIGHEST_PROTOCOL)
+    report('pickle', len(pickled),
+           lambda: pickle.dumps(m, pickle.HIGHEST_PROTOCOL),
+           lambda: pickle.loads(pickled).encoded, count)
+
+    data = m.to_bytes()
+    report('to_bytes', len(data), m.to_bytes,
+           lambda: Message.from_bytes(data).encoded, count)
+
+
+if __name__ == '__main__':
+    main()
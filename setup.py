@@ -42,5 +42,7 @@ setuptools.setup(
     install_requires=open('requirements/base.txt').readlines(),
     extras_require={
         'pyopenssl': open('requirements/pyopenssl.txt').readlines(),
+        'numpy': open('requirements/numpy.txt').readlines(),
+        'hyper': open('requirements/hyper.txt').readlines(),
     }
 )
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+import uuid
+
+import pytest
+
+from apns import Alert, AlertCatalog, FrozenMessage, Message, RawMessage, \
+    LOW_PRIORITY
+
+
+@pytest.fixture
+def catalog():
+    c = AlertCatalog(default_locale='en')
+    c.add('en', Alert('Sale', 'Ends tonight'), template='sale')
+    c.add('fr', Alert(u'Soldes', u'Dernière chance'), template='sale')
+    c.add('en', 'Welcome', template='welcome')
+    return c
+
+
+def _decode(message):
+    return json.loads(message.encoded.decode('utf-8'))
+
+
+class TestAlertCatalog(object):
+    def test_same_payload_as_message(self, catalog):
+        base = FrozenMessage(topic='com.example', badge=2, sound='default',
+                             campaign={'id': 7})
+        m = catalog.message(base, 'fr', 'sale')
+        expected = Message(
+            topic='com.example', badge=2, sound='default',
+            campaign={'id': 7},
+            alert=Alert(u'Soldes', u'Dernière chance'),
+        )
+        assert isinstance(m, RawMessage)
+        assert _decode(m) == expected.payload
+
+    @pytest.mark.parametrize('cls', [Message, FrozenMessage])
+    def test_keys_before_aps(self, catalog, cls):
+        # FrozenMessage sorts its keys, so these are encoded before aps
+        base = cls(badge=1, account='a', abc={'x': [1, 2]})
+        m = catalog.message(base, 'en', 'welcome')
+        assert _decode(m) == {
+            'aps': {'alert': 'Welcome', 'badge': 1},
+            'account': 'a',
+            'abc': {'x': [1, 2]},
+        }
+
+    def test_frozen_base_is_encoded_once(self, catalog):
+        base = FrozenMessage(badge=1, account='a')
+        catalog.message(base, 'en', 'welcome')
+        assert catalog._bases.get(base) == (b'"badge":1', b'"account":"a"')
+        assert catalog.message(base, 'fr', 'sale').encoded.startswith(
+            b'{"aps":{"alert":{')
+
+    def test_empty_aps(self, catalog):
+        m = catalog.message(Message(), 'en', 'welcome')
+        assert m.encoded == b'{"aps":{"alert":"Welcome"}}'
+
+    def test_headers_from_base(self, catalog):
+        uid = uuid.uuid4()
+        base = Message(id=uid, topic='com.example', priority=LOW_PRIORITY,
+                       collapse_id='sale')
+        m = catalog.message(base, 'en', 'sale')
+        assert m.headers == base.headers
+
+    def test_locale_fallback(self, catalog):
+        assert catalog.fragment('fr-CA', 'sale') == \
+            catalog.fragment('fr', 'sale')
+        assert catalog.fragment('fr_BE', 'sale') == \
+            catalog.fragment('fr', 'sale')
+        assert catalog.fragment('ja', 'sale') == \
+            catalog.fragment('en', 'sale')
+        with pytest.raises(KeyError):
+            catalog.fragment('en', 'missing')
+
+    def test_add_replaces_fallback(self, catalog):
+        assert catalog.fragment('de', 'sale') == \
+            catalog.fragment('en', 'sale')
+        catalog.add('de', Alert('Ausverkauf', 'Heute'), template='sale')
+        assert b'Ausverkauf' in catalog.fragment('de', 'sale')
+        assert len(catalog) == 4
+        assert ('de', 'sale') in catalog
+
+    def test_no_default_locale(self):
+        c = AlertCatalog()
+        c.add('en', 'Hello')
+        assert c.fragment('en-GB') == b'"Hello"'
+        with pytest.raises(KeyError):
+            c.fragment('fr')
+
+    def test_base_with_alert(self, catalog):
+        with pytest.raises(AssertionError):
+            catalog.message(Message(alert='hello'), 'en', 'sale')
@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import binascii
+import io
+import json
+import os
+import uuid
+
+import pytest
+from mock import Mock, patch
+
+from apns import RawMessage, LOW_PRIORITY
+from apns.cli import main, RateLimiter
+from apns.exceptions import BadDeviceToken, Unregistered
+
+
+def _random_tokens(count):
+    return [binascii.hexlify(os.urandom(32)).decode('ascii')
+            for _ in range(count)]
+
+
+def _push_many(notifications, window):
+    results = []
+    for message, token in notifications:
+        if token.startswith('0'):
+            results.append((token, Unregistered(410, token, 0)))
+        elif token.startswith('1'):
+            results.append((token, BadDeviceToken(400, token)))
+        else:
+            results.append((token, uuid.uuid4()))
+    return results
+
+
+@pytest.fixture
+def clients():
+    created = []
+
+    def make_client(*args, **kwargs):
+        client = Mock()
+        client.kwargs = kwargs
+        client.push_many.side_effect = _push_many
+        created.append(client)
+        return client
+
+    with patch('apns.cli.make_ssl_context'), \
+            patch('apns.cli.Client', side_effect=make_client):
+        yield created
+
+
+@pytest.fixture
+def payload(tmpdir):
+    path = tmpdir.join('payload.json')
+    path.write(json.dumps({'aps': {'alert': 'hello'}, 'extra': 1}))
+    return str(path)
+
+
+class TestRateLimiter(object):
+    def test_unlimited(self):
+        sleep = Mock()
+        limiter = RateLimiter(0, sleep=sleep)
+        for _ in range(100):
+            limiter.acquire()
+        assert not sleep.called
+
+    def test_limits_rate(self):
+        sleep = Mock()
+        limiter = RateLimiter(10, clock=Mock(return_value=0), sleep=sleep)
+        for _ in range(15):
+            limiter.acquire()
+        waits = [args[0] for args, _ in sleep.call_args_list]
+        assert len(waits) == 5
+        assert waits[-1] == pytest.approx(0.5)
+
+
+class TestMain(object):
+    def test_bulk_send(self, tmpdir, clients, payload):
+        tokens = ['0' + t[1:] for t in _random_tokens(3)] + \
+            ['1' + t[1:] for t in _random_tokens(2)] + \
+            ['f' + t[1:] for t in _random_tokens(20)]
+        token_file = tmpdir.join('tokens.txt')
+        token_file.write('\n'.join(tokens + ['bad', tokens[-1]]))
+        failed = tmpdir.join('failed.txt')
+        unregistered = tmpdir.join('unregistered.txt')
+        stderr = io.StringIO()
+
+        code = main([
+            '--cert', 'cert.pem',
+            '--payload', payload,
+            '--tokens', str(token_file),
+            '--connections', '3',
+            '--chunk-size', '4',
+            '--dedupe',
+            '--failed', str(failed),
+            '--unregistered', str(unregistered),
+        ], stderr=stderr)
+
+        assert code == 0
+        assert len(clients) == 3
+        assert all(c.kwargs['sandbox'] is True for c in clients)
+        assert all(c.close.called for c in clients)
+        pushed = sum(c.push_many.call_count for c in clients)
+        assert pushed == 7
+
+        failed_lines = failed.read().splitlines()
+        assert sorted(line.split('\t')[0] for line in failed_lines) == \
+            sorted(tokens[3:5] + ['bad'])
+        assert all(line.endswith('\tBadDeviceToken') for line in failed_lines)
+        unregistered_lines = unregistered.read().splitlines()
+        assert sorted(line.split('\t')[0] for line in unregistered_lines) == \
+            sorted(tokens[:3])
+
+        summary = stderr.getvalue()
+        assert 'sent 25' in summary
+        assert 'failed 2' in summary
+        assert 'unregistered 3' in summary
+        assert 'invalid 1, duplicates 1' in summary
+
+    def test_tokens_from_stdin(self, clients, payload):
+        tokens = ['f' + t[1:] for t in _random_tokens(5)]
+        stdin = io.BytesIO('\n'.join(tokens).encode('ascii'))
+        stderr = io.StringIO()
+
+        main(['--cert', 'cert.pem', '--payload', payload],
+             stdin=stdin, stderr=stderr)
+
+        assert 'sent 5' in stderr.getvalue()
+
+    def test_message_options(self, clients, payload):
+        with patch('apns.cli.BulkSender') as sender_cls:
+            main(['--cert', 'cert.pem', '--payload', payload,
+                  '--topic', 'com.example.app', '--priority', 'low',
+                  '--collapse-id', 'c', '--production'],
+                 stdin=io.BytesIO(), stderr=io.StringIO())
+
+        assert clients[0].kwargs['sandbox'] is False
+        args, _ = sender_cls.call_args
+        message = args[1]
+        assert message.topic == 'com.example.app'
+        assert message.priority == LOW_PRIORITY
+        assert message.collapse_id == 'c'
+        assert isinstance(message, RawMessage)
+        assert message.payload == {'aps': {'alert': 'hello'}, 'extra': 1}
@@ -1,14 +1,16 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import socket
 import uuid
 
 import pytest
-from mock import Mock
+from mock import Mock, patch
 
-from apns import Client, Message, DEFAULT_PORT, ALTERNATE_PORT
+from apns import Client, Message, DeviceToken, DEFAULT_PORT, \
+    ALTERNATE_PORT
 from apns.client import APNS_SANDBOX_HOST, APNS_PRODUCTION_HOST
-from apns.exceptions import BadDeviceToken, Unregistered
+from apns.exceptions import BadDeviceToken, Unregistered, PushTimeout
 
 
 class TestAPNSClient(object):
@@ -66,7 +68,26 @@ class TestAPNSClient(object):
         assert args[0] == 'POST'
         assert args[1] == '/3/device/token'
         assert kwargs['body'] == m.encoded
-        assert kwargs['headers'] == m.headers
+        assert kwargs['headers'] == m.header_items
+
+    def test_push_device_token(self):
+        res = Mock()
+        res.status = 200
+        res.headers = {
+            'apns-id': [str(uuid.uuid4())],
+        }
+
+        con = Mock()
+        con.get_response.return_value = res
+
+        c = Client(None)
+        c._connection = con
+
+        token = DeviceToken('ab' * 32)
+        c.push(Message(alert='testing'), token)
+
+        args, kwargs = con.request.call_args
+        assert args[1] == '/3/device/' + 'ab' * 32
 
     def test_push_not_successful(self):
         res = Mock()
@@ -91,6 +112,181 @@ class TestAPNSClient(object):
             assert e.token == 'token'
             assert e.code == res.status
 
+    def test_push_many(self):
+        ids = [uuid.uuid4() for _ in range(5)]
+        responses = {}
+
+        def request(method, path, body=None, headers=None):
+            stream_id = len(responses) + 1
+            res = Mock()
+            token = path.rsplit('/', 1)[1]
+            if token == 'bad':
+                res.status = 400
+                res.read.return_value = b'{"reason": "BadDeviceToken"}'
+            else:
+                res.status = 200
+                res.headers = {'apns-id': [str(ids[stream_id - 1])]}
+            responses[stream_id] = res
+            return stream_id
+
+        order = []
+
+        def get_response(stream_id):
+            order.append((stream_id, len(responses)))
+            return responses[stream_id]
+
+        con = Mock()
+        con.request.side_effect = request
+        con.get_response.side_effect = get_response
+
+        c = Client(None)
+        c._connection = con
+
+        m = Message(alert='testing')
+        tokens = ['t1', 't2', 'bad', 't4', 't5']
+        results = c.push_many(((m, t) for t in tokens), window=2)
+
+        assert [t for t, _ in results] == tokens
+        assert results[0][1] == ids[0]
+        assert results[4][1] == ids[4]
+        assert isinstance(results[2][1], BadDeviceToken)
+        assert results[2][1].token == 'bad'
+        # Responses are read once the window is full
+        assert order == [(1, 2), (2, 3), (3, 4), (4, 5), (5, 5)]
+
+    def test_push_stream(self):
+        pending = {}
+        complete = set()
+
+        def request(method, path, body=None, headers=None):
+            stream_id = len(pending) + 1
+            token = pending[stream_id] = path.rsplit('/', 1)[1]
+            # The response to t3 arrives before the response to t2
+            if token == 't3':
+                complete.add(stream_id)
+            return stream_id
+
+        def get_response(stream_id):
+            res = Mock()
+            res.status = 200
+            res.headers = {'apns-id': [str(uuid.uuid4())]}
+            return res
+
+        con = Mock()
+        con.request.side_effect = request
+        con.get_response.side_effect = get_response
+        con.is_complete.side_effect = lambda stream_id: stream_id in complete
+
+        c = Client(None)
+        c._connection = con
+
+        pulled = []
+
+        def notifications():
+            for token in ['t1', 't2', 't3', 't4']:
+                pulled.append(token)
+                yield Message(alert='testing'), token
+
+        results = c.push_stream(notifications(), window=2)
+        assert pulled == []
+
+        # No response has arrived: the oldest request is waited for
+        token, result = next(results)
+        assert token == 't1'
+        assert isinstance(result, uuid.UUID)
+        assert pulled == ['t1', 't2', 't3']
+
+        assert [t for t, _ in results] == ['t3', 't2', 't4']
+
+    def test_push_timeout(self):
+        con = Mock()
+        con.is_complete.return_value = False
+        con.request.return_value = 1
+        con.get_response.side_effect = socket.timeout()
+
+        c = Client(None)
+        c._connection = con
+
+        with pytest.raises(PushTimeout) as exc_info:
+            c.push(Message(alert='testing'), 'token', timeout=0.5)
+        assert exc_info.value.token == 'token'
+
+        _, kwargs = con.get_response.call_args
+        assert 0 < kwargs['timeout'] <= 0.5
+        con.reset.assert_called_once_with(1)
+
+    def test_push_timeout_response_already_received(self):
+        res = Mock()
+        res.status = 200
+        res.headers = {'apns-id': [str(uuid.uuid4())]}
+        con = Mock()
+        con.request.return_value = 1
+        con.is_complete.return_value = True
+        con.get_response.return_value = res
+
+        c = Client(None)
+        c._connection = con
+
+        with patch('apns.client.time.time', side_effect=[0, 10]):
+            c.push(Message(alert='testing'), 'token', timeout=1)
+        con.get_response.assert_called_once_with(1, timeout=0)
+        assert not con.reset.called
+
+    def test_push_many_timeout(self):
+        clock = Mock(return_value=0)
+        res = Mock()
+        res.status = 200
+        res.headers = {'apns-id': [str(uuid.uuid4())]}
+
+        def get_response(stream_id, timeout=None):
+            if stream_id == 1:
+                clock.return_value = 1
+                return res
+            clock.return_value = 5
+            raise socket.timeout()
+
+        con = Mock()
+        con.is_complete.return_value = False
+        con.request.side_effect = [1, 2]
+        con.get_response.side_effect = get_response
+
+        c = Client(None)
+        c._connection = con
+
+        m = Message(alert='testing')
+        with patch('apns.client.time.time', clock):
+            results = c.push_many([(m, 't1'), (m, 't2'), (m, 't3')],
+                                  window=1, timeout=2)
+
+        assert [t for t, _ in results] == ['t1', 't2', 't3']
+        assert isinstance(results[0][1], uuid.UUID)
+        assert isinstance(results[1][1], PushTimeout)
+        assert isinstance(results[2][1], PushTimeout)
+        # t3 was never sent
+        assert con.request.call_count == 2
+        con.reset.assert_called_once_with(2)
+
+    def test_push_stream_timeout(self):
+        con = Mock()
+        con.is_complete.return_value = False
+        con.request.side_effect = [1, 2]
+        con.get_response.side_effect = socket.timeout()
+
+        c = Client(None)
+        c._connection = con
+
+        m = Message(alert='testing')
+        results = list(c.push_stream([(m, 't1'), (m, 't2')], timeout=1))
+        assert [t for t, _ in results] == ['t1', 't2']
+        assert all(isinstance(r, PushTimeout) for _, r in results)
+        assert con.reset.call_count == 2
+
+    def test_close(self):
+        c = Client(None)
+        c._connection = Mock()
+        c.close()
+        assert c._connection.close.called
+
     @pytest.mark.parametrize('exc_cls,data', [
         (BadDeviceToken, b'{"reason": "BadDeviceToken"}'),
         (Unregistered, b'{"reason": "Unregistered", "timestamp": 0}'),
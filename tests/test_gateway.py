@@ -0,0 +1,332 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+import socket
+import struct
+import threading
+import time
+import uuid
+
+import pytest
+from mock import Mock, patch
+
+from apns import Client, DeviceToken, Message, RawMessage
+from apns.exceptions import BadDeviceToken, Unregistered
+from apns.gateway import Gateway, main, message_from_json, result_to_json
+from apns.transport import Response
+
+TOKEN = 'ab' * 32
+BAD_TOKEN = 'cd' * 32
+APNS_ID = uuid.UUID('c0ffee00-0000-4000-8000-000000000001')
+
+
+class FakeClient(object):
+    """A client recording the notifications of each stream."""
+
+    def __init__(self):
+        self.streams = []
+        self.error = None
+        self.closed = False
+
+    @property
+    def sent(self):
+        return [n for stream in self.streams for n in stream]
+
+    def push_stream(self, notifications, window):
+        stream = []
+        self.streams.append(stream)
+        for message, token in notifications:
+            stream.append((message, token))
+            if self.error is not None:
+                raise self.error
+            if str(token) == BAD_TOKEN:
+                yield token, BadDeviceToken(400, token)
+            else:
+                yield token, APNS_ID
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def client():
+    return FakeClient()
+
+
+def serve(gateway, path):
+    server = gateway.make_server(path)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+@pytest.fixture
+def server(tmpdir, client):
+    gateway = Gateway([client], window=10, max_pending=5)
+    server = serve(gateway, str(tmpdir.join('gateway.sock')))
+    yield server
+    server.shutdown()
+    server.server_close()
+    gateway.close()
+
+
+def connect(server):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(server.server_address)
+    return sock
+
+
+def read_lines(sock):
+    sock.shutdown(socket.SHUT_WR)
+    data = b''
+    chunk = sock.recv(65536)
+    while chunk:
+        data += chunk
+        chunk = sock.recv(65536)
+    sock.close()
+    return [json.loads(line.decode('utf-8')) for line in data.splitlines()]
+
+
+class TestMessageFromJson(object):
+    def test_fields(self):
+        uid = uuid.uuid4()
+        message, token = message_from_json({
+            'token': TOKEN,
+            'payload': {'aps': {'alert': 'hi'}},
+            'topic': 'com.example',
+            'priority': 5,
+            'collapse_id': 'c',
+            'id': str(uid),
+        })
+        assert token == TOKEN
+        assert isinstance(message, RawMessage)
+        assert message.payload == {'aps': {'alert': 'hi'}}
+        assert message.priority == '5'
+        assert message.topic == 'com.example'
+        assert message.collapse_id == 'c'
+        assert message.id == uid
+
+    def test_encoded_payload(self):
+        message, _ = message_from_json({'token': TOKEN,
+                                        'payload': '{"aps":{}}'})
+        assert message.encoded == b'{"aps":{}}'
+
+    def test_missing_payload(self):
+        with pytest.raises(KeyError):
+            message_from_json({'token': TOKEN})
+
+    @pytest.mark.parametrize('token', ['', 'abc', 42, None, ['ab']])
+    def test_invalid_token(self, token):
+        with pytest.raises(ValueError):
+            message_from_json({'token': token, 'payload': {'aps': {}}})
+
+
+class TestResultToJson(object):
+    def test_success(self):
+        assert result_to_json(DeviceToken(TOKEN), APNS_ID, ref=1) == {
+            'token': TOKEN, 'ref': 1, 'id': str(APNS_ID),
+        }
+
+    def test_unregistered(self):
+        error = Unregistered(410, TOKEN, 1464782400)
+        obj = result_to_json(TOKEN, error)
+        assert obj['error'] == 'Unregistered'
+        assert obj['status'] == 410
+        assert obj['unregistered_since'] == \
+            error.unavailable_since.isoformat()
+
+    def test_invalid_input(self):
+        obj = result_to_json(None, ValueError('bad'))
+        assert obj == {'token': 'None', 'error': 'ValueError'}
+
+
+class TestGateway(object):
+    def test_json_lines(self, server, client):
+        sock = connect(server)
+        lines = [
+            {'token': TOKEN, 'payload': {'aps': {'alert': 'a'}}, 'ref': 1},
+            [{'token': BAD_TOKEN, 'payload': {'aps': {}}, 'ref': 2},
+             {'token': TOKEN, 'payload': {'aps': {}}, 'ref': 3}],
+        ]
+        sock.sendall(b''.join(json.dumps(line).encode() + b'\n'
+                              for line in lines))
+        results = read_lines(sock)
+
+        assert [r['ref'] for r in results] == [1, 2, 3]
+        assert results[0]['id'] == str(APNS_ID)
+        assert results[1]['error'] == 'BadDeviceToken'
+        assert len(client.sent) == 3
+
+    def test_invalid_lines(self, server):
+        sock = connect(server)
+        sock.sendall(b'not json\n\n{"token": "x", "ref": 5}\n')
+        results = read_lines(sock)
+        assert results[0]['error'] == 'ValueError'
+        assert results[1] == {'token': 'x', 'ref': 5, 'error': 'KeyError'}
+
+    def test_invalid_tokens(self, server, client):
+        sock = connect(server)
+        lines = [
+            {'token': '', 'payload': {'aps': {}}, 'ref': 1},
+            {'token': 42, 'payload': {'aps': {}}, 'ref': 2},
+            {'token': TOKEN, 'payload': {'aps': {}}, 'ref': 3},
+        ]
+        sock.sendall(b''.join(json.dumps(line).encode() + b'\n'
+                              for line in lines))
+        results = read_lines(sock)
+        assert [(r['ref'], r.get('error')) for r in results] == \
+            [(1, 'ValueError'), (2, 'ValueError'), (3, None)]
+        assert [str(token) for _, token in client.sent] == [TOKEN]
+
+    def test_send_failure(self, server, client):
+        client.error = RuntimeError('connection lost')
+        sock = connect(server)
+        lines = [{'token': TOKEN, 'payload': {'aps': {}}, 'ref': i}
+                 for i in range(20)]
+        sock.sendall(b''.join(json.dumps(line).encode() + b'\n'
+                              for line in lines))
+        results = read_lines(sock)
+        assert [r['ref'] for r in results] == list(range(20))
+        assert all(r['error'] == 'RuntimeError' for r in results)
+
+    def test_real_client(self, tmpdir):
+        transport = Mock()
+        transport.return_value.get_response.return_value = Response(
+            200, {'apns-id': [str(APNS_ID)]})
+        gateway = Gateway([Client(None, transport=transport)])
+        server = serve(gateway, str(tmpdir.join('gateway.sock')))
+        try:
+            sock = connect(server)
+            sock.sendall(b'{"token": "", "payload": {}, "ref": 1}\n'
+                         b'{"token": "%s", "payload": {}, "ref": 2}\n'
+                         % TOKEN.encode())
+            results = read_lines(sock)
+        finally:
+            server.shutdown()
+            server.server_close()
+            gateway.close()
+        assert results == [
+            {'token': '', 'ref': 1, 'error': 'ValueError'},
+            {'token': TOKEN, 'ref': 2, 'id': str(APNS_ID)},
+        ]
+
+    def test_binary_frames(self, server, client):
+        sock = connect(server)
+        m = Message(alert='testing', topic='com.example')
+        frame = DeviceToken(TOKEN) + m.to_bytes()
+        sock.sendall((struct.pack('!I', len(frame)) + frame) * 2)
+        sock.shutdown(socket.SHUT_WR)
+
+        data = b''
+        chunk = sock.recv(65536)
+        while chunk:
+            data += chunk
+            chunk = sock.recv(65536)
+        results = []
+        while data:
+            size, = struct.unpack('!I', data[:4])
+            results.append(json.loads(data[4:4 + size].decode('utf-8')))
+            data = data[4 + size:]
+        assert results == [{'token': TOKEN, 'id': str(APNS_ID)}] * 2
+
+        message, token = client.sent[0]
+        assert token == DeviceToken(TOKEN)
+        assert bytes(message.encoded) == m.encoded
+        assert message.topic == 'com.example'
+
+    def test_connections_share_a_stream(self, tmpdir):
+        release = threading.Event()
+        client = FakeClient()
+        push_stream = client.push_stream
+
+        def blocking_push_stream(notifications, window):
+            for result in push_stream(notifications, window):
+                release.wait(5)
+                yield result
+
+        client.push_stream = blocking_push_stream
+        gateway = Gateway([client])
+        server = serve(gateway, str(tmpdir.join('gateway.sock')))
+        try:
+            socks = [connect(server), connect(server)]
+            for i, sock in enumerate(socks):
+                sock.sendall(b''.join(
+                    b'{"token": "%s", "payload": {}, "ref": %d}\n'
+                    % (TOKEN.encode(), i * 10 + j) for j in range(2)))
+            # The first notification is in flight, the others wait
+            deadline = time.time() + 5
+            while len(gateway._queue) < 3 and time.time() < deadline:
+                time.sleep(0.01)
+            release.set()
+            results = [read_lines(sock) for sock in socks]
+        finally:
+            server.shutdown()
+            server.server_close()
+            gateway.close()
+        assert [sorted(r['ref'] for r in lines) for lines in results] == \
+            [[0, 1], [10, 11]]
+        assert len(client.streams) == 1
+        assert len(client.streams[0]) == 4
+
+    def test_same_token_in_flight(self):
+        def push_stream(notifications, window):
+            # Answer in reverse order, with an ID telling the messages apart
+            in_flight = list(notifications)
+            for message, token in reversed(in_flight):
+                yield token, uuid.UUID(int=message.priority == '5')
+
+        client = Mock()
+        client.push_stream.side_effect = push_stream
+        gateway = Gateway([client])
+        results = []
+        done = threading.Event()
+
+        def callback(token, result):
+            results.append((token, result))
+            if len(results) == 2:
+                done.set()
+        m = RawMessage(b'{}')
+        # Queue both before the sending thread takes either
+        with gateway._lock:
+            gateway.submit(m.replace(priority='10'), TOKEN, callback)
+            gateway.submit(m.replace(priority='5'), TOKEN, callback)
+        gateway.close()
+        assert done.wait(5)
+        assert sorted(results) == [(TOKEN, uuid.UUID(int=0)),
+                                   (TOKEN, uuid.UUID(int=1))]
+
+    def test_close(self):
+        clients = [FakeClient(), FakeClient()]
+        gateway = Gateway(clients, window=5)
+        gateway.close()
+        assert all(c.closed for c in clients)
+        with pytest.raises(AssertionError):
+            gateway.submit(Message(), TOKEN, Mock())
+
+    def test_main(self, tmpdir):
+        path = str(tmpdir.join('gateway.sock'))
+        client_cls = Mock(side_effect=lambda *args, **kwargs: FakeClient())
+        with patch('apns.gateway.make_ssl_context'), \
+                patch('apns.gateway.Client', client_cls), \
+                patch('apns.gateway.Gateway.make_server') as make_server:
+            make_server.return_value.serve_forever.side_effect = \
+                KeyboardInterrupt()
+            assert main(['--cert', 'cert.pem', '--unix', path,
+                         '--connections', '3', '--production']) == 0
+
+        assert client_cls.call_count == 3
+        assert client_cls.call_args[1]['sandbox'] is False
+        make_server.assert_called_once_with(path)
+        assert make_server.return_value.server_close.called
+
+    def test_main_tcp(self):
+        client_cls = Mock(side_effect=lambda *args, **kwargs: FakeClient())
+        with patch('apns.gateway.make_ssl_context'), \
+                patch('apns.gateway.Client', client_cls), \
+                patch('apns.gateway.Gateway.make_server') as make_server:
+            make_server.return_value.serve_forever.side_effect = \
+                KeyboardInterrupt()
+            main(['--cert', 'cert.pem', '--tcp', ':2195'])
+        make_server.assert_called_once_with(('127.0.0.1', 2195))
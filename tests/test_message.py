@@ -1,14 +1,17 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import copy
 import json
+import pickle
 import uuid
 from datetime import datetime, timedelta
 
 import pytest
 
-from apns import Message, Alert, HIGH_PRIORITY, LOW_PRIORITY, \
-    EXPIRE_IMMEDIATELY
+from apns import Message, FrozenMessage, RawMessage, Alert, \
+    HIGH_PRIORITY, LOW_PRIORITY, EXPIRE_IMMEDIATELY
+from apns.message import _ENCODED_CACHE
 from apns._compat import binary_type
 
 from tests import EPOCH
@@ -42,6 +45,50 @@ class TestMessage(object):
         m = Message(expiration=new_millennium)
         assert m.headers['apns-expiration'] == new_millennium - EPOCH
 
+    def test_headers_encodes_collapse_id(self):
+        m = Message(collapse_id='score')
+        assert m.headers['apns-collapse-id'] == 'score'
+        assert 'apns-collapse-id' not in Message().headers
+
+    def test_header_items(self):
+        uid = uuid.uuid4()
+        m = Message(id=uid, topic='com.example', collapse_id='score')
+        items = dict(m.header_items)
+        assert items[b'apns-id'] == str(uid).encode('ascii')
+        assert items[b'apns-topic'] == b'com.example'
+        assert items[b'apns-collapse-id'] == b'score'
+        assert items[b'apns-priority'] == HIGH_PRIORITY.encode('ascii')
+        assert len(items) == len(m.headers)
+
+    def test_header_items_are_shared(self):
+        a = Message(topic='com.example', priority=LOW_PRIORITY)
+        b = Message(topic='com.example', priority=LOW_PRIORITY)
+        c = Message(topic='com.example')
+        assert a.header_items is b.header_items
+        assert a.header_items != c.header_items
+
+        d = Message(id=uuid.uuid4(), topic='com.example',
+                    priority=LOW_PRIORITY)
+        assert d.header_items[:-1] is not a.header_items
+        assert d.header_items[:-1] == a.header_items
+
+    def test_slots(self):
+        m = Message(alert=Alert('Title', 'Body'), custom='value')
+        assert not hasattr(m, '__dict__')
+        assert not hasattr(m.alert, '__dict__')
+        with pytest.raises(AttributeError):
+            m.unknown = 1
+
+    def test_encoded_is_cached(self):
+        m = Message(alert='testing')
+        assert m.encoded is m.encoded
+        assert m.headers is m.headers
+        assert m.header_items is m.header_items
+
+    def test_set_collapse_id_too_long(self):
+        with pytest.raises(AssertionError):
+            Message(collapse_id='x' * 65)
+
     @pytest.mark.parametrize('val', [
         1,
         True,
@@ -128,3 +175,228 @@ class TestAlert(object):
     def test_omits_empty_keys(self):
         a = Alert('Test', 'Message', title_loc_key=None)
         assert 'title-loc-key' not in a.payload
+
+
+class TestFrozenMessage(object):
+    @pytest.mark.parametrize('duplicate', [
+        lambda m: pickle.loads(pickle.dumps(m, pickle.HIGHEST_PROTOCOL)),
+        copy.copy,
+        copy.deepcopy,
+    ])
+    def test_copy(self, duplicate):
+        m = FrozenMessage(id=uuid.uuid4(), topic='com.example',
+                          alert=Alert('Title', 'Body'), badge=3,
+                          priority=LOW_PRIORITY, collapse_id='news',
+                          custom={'a': [1, 2]})
+        copied = duplicate(m)
+        assert type(copied) is FrozenMessage
+        assert copied == m
+        assert hash(copied) == hash(m)
+        assert copied.encoded == m.encoded
+        assert copied.headers == m.headers
+        with pytest.raises(AttributeError):
+            copied.badge = 4
+
+    def test_same_output_as_message(self):
+        kwargs = dict(topic='com.example', alert=Alert('Title', 'Body'),
+                      badge=3, priority=LOW_PRIORITY, collapse_id='news',
+                      custom={'a': [1, 2]})
+        m = Message(**kwargs)
+        f = FrozenMessage(**kwargs)
+        assert f.payload == m.payload
+        assert json.loads(f.encoded.decode('utf-8')) == m.payload
+        assert f.headers == m.headers
+        assert f.header_items == m.header_items
+
+    def test_immutable(self):
+        f = FrozenMessage(alert='testing')
+        with pytest.raises(AttributeError):
+            f.badge = 1
+        with pytest.raises(AttributeError):
+            f.priority = LOW_PRIORITY
+        with pytest.raises(AttributeError):
+            del f.alert
+
+    def test_payload_is_copied(self):
+        alert = Alert('Title', 'Body')
+        extra = {'items': [1]}
+        f = FrozenMessage(alert=alert, data=extra)
+        encoded = f.encoded
+        alert.body = 'Changed'
+        extra['items'].append(2)
+        f.payload['aps']['alert'] = 'Changed'
+        assert f.payload['data'] == {'items': [1]}
+        assert f.payload['aps']['alert']['body'] == 'Body'
+        assert FrozenMessage(alert=Alert('Title', 'Body'),
+                             data={'items': [1]}).encoded == encoded
+
+    def test_hash_and_equality(self):
+        a = FrozenMessage(alert='testing', extra={'x': 1, 'y': 2})
+        b = FrozenMessage(alert='testing', extra={'y': 2, 'x': 1})
+        c = FrozenMessage(alert='testing', badge=1)
+        assert a == b
+        assert hash(a) == hash(b)
+        assert a != c
+        assert len({a, b, c}) == 2
+        assert a != Message(alert='testing', extra={'x': 1, 'y': 2})
+
+    def test_different_headers_are_not_equal(self):
+        a = FrozenMessage(alert='testing', topic='com.example.a')
+        b = FrozenMessage(alert='testing', topic='com.example.b')
+        assert a != b
+
+    def test_shared_encoding_cache(self):
+        _ENCODED_CACHE.clear()
+        a = FrozenMessage(alert='shared')
+        b = FrozenMessage(alert='shared', id=uuid.uuid4())
+        assert a.encoded is b.encoded
+        assert len(_ENCODED_CACHE) == 1
+
+    @pytest.mark.parametrize('a, b', [
+        (True, 1),
+        (1, 1.0),
+        (False, 0),
+        ({'a': 1}, [['a', 1]]),
+        ({'a': 1}, {'a': True}),
+        ({1: 'x'}, {True: 'x'}),
+    ])
+    def test_equal_python_values_stay_apart(self, a, b):
+        _ENCODED_CACHE.clear()
+        first = FrozenMessage(alert='x', data=a)
+        second = FrozenMessage(alert='x', data=b)
+        assert first != second
+        assert first.encoded == Message(alert='x', data=a).encoded
+        assert second.encoded == Message(alert='x', data=b).encoded
+        assert first.payload['data'] == a
+        assert second.payload['data'] == b
+
+    def test_mixed_key_types(self):
+        m = FrozenMessage(alert='x', data={1: 'a', 'b': 2})
+        assert m.payload['data'] == {1: 'a', 'b': 2}
+
+    def test_encoding_cache_is_bounded(self):
+        _ENCODED_CACHE.clear()
+        for i in range(_ENCODED_CACHE.size + 10):
+            FrozenMessage(badge=i).encoded
+        assert len(_ENCODED_CACHE) == _ENCODED_CACHE.size
+
+    def test_freeze_and_replace(self):
+        m = Message(alert='testing', topic='com.example', custom=1)
+        f = m.freeze()
+        assert isinstance(f, FrozenMessage)
+        assert f.freeze() is f
+        assert f.encoded == m.encoded
+
+        g = f.replace(badge=2, other=3)
+        assert isinstance(g, FrozenMessage)
+        assert g.payload['aps']['badge'] == 2
+        assert g.payload['custom'] == 1
+        assert g.payload['other'] == 3
+        assert g.topic == 'com.example'
+        assert f.payload['aps'].get('badge') is None
+
+
+class TestRawMessage(object):
+    def test_payload_is_not_reencoded(self):
+        data = b'{"aps": {"alert": "hello"}, "id": 1}'
+        m = RawMessage(data, topic='com.example', priority=LOW_PRIORITY)
+        assert m.encoded is data
+        assert m.payload == {'aps': {'alert': 'hello'}, 'id': 1}
+        assert m.aps == {'alert': 'hello'}
+        assert m.headers['apns-topic'] == 'com.example'
+        assert m.headers['apns-priority'] == LOW_PRIORITY
+
+    def test_memoryview_payload(self):
+        buf = bytearray(b'xx{"aps":{}}xx')
+        view = memoryview(buf)[2:-2]
+        m = RawMessage(view)
+        assert m.encoded is view
+        assert m.payload == {'aps': {}}
+
+    def test_text_payload(self):
+        m = RawMessage(u'{"aps":{"alert":"\u00e9"}}')
+        assert m.encoded == u'{"aps":{"alert":"\u00e9"}}'.encode('utf-8')
+
+    def test_size_limit(self):
+        RawMessage(b' ' * 4096)
+        with pytest.raises(AssertionError):
+            RawMessage(b' ' * 4097)
+
+    def test_replace(self):
+        m = RawMessage(b'{}', topic='com.example')
+        r = m.replace(priority=LOW_PRIORITY)
+        assert isinstance(r, RawMessage)
+        assert r.encoded is m.encoded
+        assert r.topic == 'com.example'
+        with pytest.raises(TypeError):
+            m.freeze()
+
+
+class TestSerialization(object):
+    def test_round_trip(self):
+        uid = uuid.uuid4()
+        m = Message(id=uid, topic='com.example', alert='testing',
+                    priority=LOW_PRIORITY, collapse_id=u'caf\u00e9',
+                    expiration=datetime(2030, 1, 1), custom=[1, 2])
+        r = Message.from_bytes(m.to_bytes())
+        assert isinstance(r, RawMessage)
+        assert bytes(r.encoded) == m.encoded
+        assert r.id == uid
+        assert r.topic == 'com.example'
+        assert r.priority == LOW_PRIORITY
+        assert r.collapse_id == u'caf\u00e9'
+        assert r.expiration == m.expiration
+        assert r.header_items == m.header_items
+
+    def test_minimal_message(self):
+        m = Message()
+        data = m.to_bytes()
+        assert len(data) == 10 + len(m.encoded)
+        r = Message.from_bytes(data)
+        assert r.id is None
+        assert r.topic is None
+        assert r.collapse_id is None
+        assert r.expiration is None
+        assert r.headers == m.headers
+
+    def test_payload_is_not_copied(self):
+        buf = bytearray(Message(alert='testing').to_bytes())
+        r = Message.from_bytes(buf)
+        assert isinstance(r.encoded, memoryview)
+        buf[-5:-4] = b'X'
+        assert r.payload == {'aps': {'alert': 'testiXg'}}
+
+    def test_raw_message_round_trip(self):
+        r = Message.from_bytes(RawMessage(b'{"aps":{}}').to_bytes())
+        assert Message.from_bytes(r.to_bytes()).payload == {'aps': {}}
+
+    @pytest.mark.parametrize('data', [
+        b'',
+        b'\x01\x00',
+        b'\x02' + b'\x00' * 9,
+        Message().to_bytes()[:-1],
+        Message().to_bytes() + b' ',
+    ])
+    def test_invalid_data(self, data):
+        with pytest.raises(ValueError):
+            Message.from_bytes(data)
+
+    def test_alert_round_trip(self):
+        a = Alert(u'T\u00eftle', 'Body', loc_key='KEY', loc_args=['a', 'b'])
+        r = Alert.from_bytes(a.to_bytes())
+        assert isinstance(r, Alert)
+        assert r.payload == a.payload
+
+    @pytest.mark.parametrize('data', [
+        b'',
+        b'\x09{}',
+        b'\x01',
+        b'\x01{',
+        b'\x01\xff',
+        b'\x01"text"',
+        b'\x01[]',
+        b'\x01{"unknown": 1}',
+    ])
+    def test_alert_invalid_data(self, data):
+        with pytest.raises(ValueError):
+            Alert.from_bytes(data)
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import binascii
+
+import pytest
+
+from apns import DeviceToken, Message, TokenArray
+from apns.partition import HashRing
+
+NODES = ['sender-1', 'sender-2', 'sender-3']
+
+
+def _tokens(count):
+    return [binascii.hexlify(os.urandom(32)).decode('ascii')
+            for _ in range(count)]
+
+
+@pytest.fixture(scope='module')
+def tokens():
+    return _tokens(3000)
+
+
+class TestHashRing(object):
+    def test_stable_assignment(self, tokens):
+        a = HashRing(NODES)
+        b = HashRing(reversed(NODES))
+        assert [a.node_for(t) for t in tokens] == \
+            [b.node_for(t) for t in tokens]
+
+    def test_hex_and_raw_tokens(self, tokens):
+        ring = HashRing(NODES)
+        for token in tokens[:50]:
+            assert ring.node_for(token) == ring.node_for(DeviceToken(token))
+            assert ring.node_for(token.upper()) == ring.node_for(token)
+
+    def test_balance(self, tokens):
+        ring = HashRing(NODES)
+        counts = dict((node, len(group))
+                      for node, group in ring.split(tokens).items())
+        assert sorted(counts) == NODES
+        for count in counts.values():
+            assert 600 < count < 1400
+
+    def test_weight(self, tokens):
+        ring = HashRing()
+        ring.add('small')
+        ring.add('big', weight=3)
+        groups = ring.split(tokens)
+        assert len(groups['big']) > 2 * len(groups['small'])
+
+    def test_minimal_reshuffling(self, tokens):
+        ring = HashRing(NODES)
+        before = dict((t, ring.node_for(t)) for t in tokens)
+        ring.add('sender-4')
+        moved = [t for t in tokens if ring.node_for(t) != before[t]]
+        # Only tokens moving to the new node change
+        assert all(ring.node_for(t) == 'sender-4' for t in moved)
+        assert len(moved) < len(tokens) / 2
+
+        ring.remove('sender-4')
+        assert all(ring.node_for(t) == before[t] for t in tokens)
+
+    def test_remove_node(self, tokens):
+        ring = HashRing(NODES)
+        before = dict((t, ring.node_for(t)) for t in tokens)
+        ring.remove('sender-2')
+        assert 'sender-2' not in ring
+        assert len(ring) == 2
+        for t in tokens:
+            if before[t] != 'sender-2':
+                assert ring.node_for(t) == before[t]
+        with pytest.raises(KeyError):
+            ring.remove('sender-2')
+
+    def test_split_keeps_order(self, tokens):
+        ring = HashRing(NODES)
+        groups = ring.split(tokens)
+        assert sum(len(g) for g in groups.values()) == len(tokens)
+        for node, group in groups.items():
+            assert group == [t for t in tokens if ring.node_for(t) == node]
+
+    def test_split_token_array(self, tokens):
+        ring = HashRing(NODES)
+        groups = ring.split(TokenArray(tokens))
+        expected = ring.split(tokens)
+        for node, group in groups.items():
+            assert isinstance(group, TokenArray)
+            assert [t.hex() for t in group] == expected[node]
+
+    def test_split_notifications(self, tokens):
+        ring = HashRing(NODES)
+        m = Message(alert='testing')
+        groups = ring.split_notifications((m, t) for t in tokens[:100])
+        for node, pairs in groups.items():
+            assert all(ring.node_for(t) == node for _, t in pairs)
+        assert sum(len(p) for p in groups.values()) == 100
+
+    def test_empty_ring(self):
+        ring = HashRing()
+        with pytest.raises(AssertionError):
+            ring.node_for('ab' * 32)
+
+    def test_invalid_token(self):
+        with pytest.raises(ValueError):
+            HashRing(NODES).node_for('nope')
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import binascii
+import io
+import os
+
+import pytest
+
+from apns.reader import TokenReader
+
+
+def _random_tokens(count):
+    return [binascii.hexlify(os.urandom(32)).decode('ascii')
+            for _ in range(count)]
+
+
+@pytest.fixture
+def tokens():
+    return _random_tokens(25)
+
+
+def _write(tmpdir, data):
+    path = tmpdir.join('tokens.txt')
+    path.write_binary(data)
+    return str(path)
+
+
+class TestTokenReader(object):
+    def test_chunks(self, tmpdir, tokens):
+        path = _write(tmpdir, '\n'.join(tokens).encode('ascii'))
+        chunks = list(TokenReader(path, chunk_size=10))
+        assert [len(c) for c in chunks] == [10, 10, 5]
+        assert sum(chunks, []) == tokens
+
+    def test_skips_blank_lines_and_whitespace(self, tmpdir, tokens):
+        data = '\r\n\n  '.join(tokens[:3]) + '\n\n'
+        path = _write(tmpdir, data.encode('ascii'))
+        assert list(TokenReader(path)) == [tokens[:3]]
+
+    def test_empty_file(self, tmpdir):
+        path = _write(tmpdir, b'')
+        assert list(TokenReader(path)) == []
+
+    def test_csv_column(self, tmpdir, tokens):
+        rows = ['user,token'] + ['%d,"%s"' % (i, t)
+                                 for i, t in enumerate(tokens)]
+        path = _write(tmpdir, '\n'.join(rows).encode('ascii'))
+        reader = TokenReader(path, delimiter=',', column=1, validate=True)
+        assert sum(list(reader), []) == tokens
+        assert reader.invalid == 1
+
+    def test_validate(self, tmpdir, tokens):
+        lines = tokens[:2] + ['bad'] + tokens[2:4]
+        path = _write(tmpdir, '\n'.join(lines).encode('ascii'))
+        reader = TokenReader(path, validate=True)
+        assert sum(list(reader), []) == tokens[:4]
+        assert reader.invalid == 1
+
+    def test_on_invalid(self, tmpdir, tokens):
+        lines = ['bad'] + tokens[:3] + ['worse', 'ab' * 31]
+        path = _write(tmpdir, '\n'.join(lines).encode('ascii'))
+        invalid = []
+        reader = TokenReader(path, chunk_size=4, validate=True,
+                             on_invalid=invalid.append)
+        assert sum(list(reader), []) == tokens[:3]
+        assert invalid == [['bad'], ['worse', 'ab' * 31]]
+
+    def test_dedupe(self, tmpdir, tokens):
+        lines = tokens + tokens[:5] + ['bad']
+        path = _write(tmpdir, '\n'.join(lines).encode('ascii'))
+        reader = TokenReader(path, chunk_size=7, dedupe=True)
+        assert sum(list(reader), []) == tokens
+        assert reader.duplicates == 5
+        assert reader.invalid == 1
+
+    def test_stream(self, tokens):
+        stream = io.BytesIO('\n'.join(tokens).encode('ascii'))
+        assert sum(list(TokenReader(stream, chunk_size=3)), []) == tokens
+
+    def test_text_stream(self, tokens):
+        data = '\n'.join(tokens)
+        stream = io.TextIOWrapper(io.BytesIO(data.encode('ascii')))
+        assert sum(list(TokenReader(stream)), []) == tokens
+        assert sum(list(TokenReader(io.StringIO(data))), []) == tokens
+
+    def test_text_pipe(self, tokens):
+        read_fd, write_fd = os.pipe()
+        with os.fdopen(write_fd, 'w') as f:
+            f.write('\n'.join(tokens))
+        with os.fdopen(read_fd, 'r') as f:
+            assert sum(list(TokenReader(f)), []) == tokens
+
+    def test_open_file(self, tmpdir, tokens):
+        path = _write(tmpdir, '\n'.join(tokens).encode('ascii'))
+        with open(path, 'rb') as f:
+            assert sum(list(TokenReader(f)), []) == tokens
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import socket
+
+import pytest
+from mock import Mock
+
+from apns.transport import Resolver
+
+HOST = 'api.push.apple.com'
+
+
+def _listener():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(('127.0.0.1', 0))
+    sock.listen(8)
+    return sock
+
+
+def _closed_address():
+    sock = _listener()
+    address = sock.getsockname()
+    sock.close()
+    return (socket.AF_INET, address)
+
+
+@pytest.fixture
+def listeners():
+    socks = [_listener() for _ in range(3)]
+    yield socks
+    for sock in socks:
+        sock.close()
+
+
+def _addresses(socks):
+    return [(socket.AF_INET, sock.getsockname()) for sock in socks]
+
+
+class TestResolver(object):
+    def test_getaddrinfo(self):
+        resolver = Resolver()
+        assert resolver.resolve('127.0.0.1', 443) == \
+            [(socket.AF_INET, ('127.0.0.1', 443))]
+
+    def test_cache(self):
+        resolve = Mock(return_value=[(socket.AF_INET, ('10.0.0.1', 443))])
+        resolver = Resolver(resolve=resolve)
+        resolver.resolve(HOST, 443)
+        resolver.resolve(HOST, 443)
+        resolve.assert_called_once_with(HOST, 443)
+
+        resolver = Resolver(ttl=0, resolve=resolve)
+        resolver.resolve(HOST, 443)
+        resolver.resolve(HOST, 443)
+        assert resolve.call_count == 3
+
+    def test_duplicates(self):
+        address = (socket.AF_INET, ('10.0.0.1', 443))
+        resolver = Resolver(resolve=lambda host, port: [address, address])
+        assert resolver.resolve(HOST, 443) == [address]
+
+    def test_stale_cache_on_failure(self):
+        addresses = [(socket.AF_INET, ('10.0.0.1', 443))]
+        resolve = Mock(return_value=addresses)
+        resolver = Resolver(ttl=0, resolve=resolve)
+        resolver.resolve(HOST, 443)
+        resolve.side_effect = socket.gaierror('DNS is down')
+        assert resolver.resolve(HOST, 443) == addresses
+
+    def test_no_addresses(self):
+        resolver = Resolver(resolve=lambda host, port: [])
+        with pytest.raises(socket.gaierror):
+            resolver.resolve(HOST, 443)
+
+    def test_spreads_connections(self, listeners):
+        resolver = Resolver(resolve=lambda h, p: _addresses(listeners))
+        connections = [resolver.connect(HOST, 443) for _ in range(6)]
+        used = [address for _, address in connections]
+        assert sorted(used) == sorted(
+            [sock.getsockname() for sock in listeners] * 2
+        )
+
+        # Closed connections make room on their address
+        sock, address = connections[0]
+        sock.close()
+        resolver.release(address)
+        assert resolver.connect(HOST, 443)[1] == address
+        for sock, _ in connections[1:]:
+            sock.close()
+
+    def test_quarantines_failing_address(self, listeners):
+        closed = _closed_address()
+        addresses = [closed] + _addresses(listeners[:1])
+        resolver = Resolver(resolve=lambda h, p: addresses)
+        sock, address = resolver.connect(HOST, 443)
+        sock.close()
+        assert address == listeners[0].getsockname()
+        assert resolver.is_quarantined(closed[1])
+        # The quarantined address is tried last
+        assert resolver.candidates(HOST, 443)[-1] == closed
+
+    def test_quarantine_expires(self):
+        resolver = Resolver(quarantine_time=0)
+        resolver.quarantine(('10.0.0.1', 443))
+        assert not resolver.is_quarantined(('10.0.0.1', 443))
+        resolver.quarantine(('10.0.0.1', 443), duration=60)
+        assert resolver.is_quarantined(('10.0.0.1', 443))
+        resolver.clear()
+        assert not resolver.is_quarantined(('10.0.0.1', 443))
+
+    def test_all_addresses_fail(self):
+        addresses = [_closed_address(), _closed_address()]
+        resolver = Resolver(resolve=lambda h, p: addresses)
+        with pytest.raises(socket.error):
+            resolver.connect(HOST, 443)
+        assert all(resolver.is_quarantined(a) for _, a in addresses)
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import multiprocessing
+import os
+import uuid
+
+import pytest
+from mock import Mock
+
+from apns import DeviceToken, Message, RawMessage
+from apns._compat import queue
+from apns.ring import RingBuffer
+
+
+def _token(i):
+    return '%064x' % i
+
+
+def _produce(ring, start, count):
+    for i in range(start, start + count):
+        ring.put(Message(alert='testing', badge=i), _token(i))
+
+
+class TestRingBuffer(object):
+    def test_put_and_get(self):
+        ring = RingBuffer(slots=4)
+        uid = uuid.uuid4()
+        m = Message(id=uid, topic='com.example', alert='testing')
+        ring.put(m, _token(1))
+
+        [(message, token)] = ring.get_many()
+        assert isinstance(message, RawMessage)
+        assert token == DeviceToken(_token(1))
+        assert message.id == uid
+        assert message.topic == 'com.example'
+        assert bytes(message.encoded) == m.encoded
+
+    def test_get_many_limits_count(self):
+        ring = RingBuffer(slots=8)
+        for i in range(5):
+            ring.put(Message(badge=i), _token(i))
+        assert len(ring.get_many(3)) == 3
+        assert len(ring.get_many(3)) == 2
+
+    def test_empty_timeout(self):
+        ring = RingBuffer(slots=2)
+        assert ring.get_many(timeout=0.01) == []
+
+    def test_wraparound(self):
+        ring = RingBuffer(slots=3)
+        badges = []
+        for i in range(10):
+            ring.put(Message(badge=i), _token(i))
+            ring.put(Message(badge=i + 100), _token(i))
+            for message, _ in ring.get_many(2):
+                badges.append(message.payload['aps']['badge'])
+        assert badges == [b for i in range(10) for b in (i, i + 100)]
+
+    def test_overflow(self):
+        ring = RingBuffer(slots=2)
+        ring.put(Message(badge=1), _token(1))
+        ring.put(Message(badge=2), _token(2))
+        with pytest.raises(queue.Full):
+            ring.put(Message(badge=3), _token(3), block=False)
+        with pytest.raises(queue.Full):
+            ring.put(Message(badge=3), _token(3), timeout=0.01)
+
+        ring.get_many(1)
+        ring.put(Message(badge=3), _token(3), block=False)
+        badges = [m.payload['aps']['badge'] for m, _ in ring.get_many()]
+        assert badges == [2, 3]
+
+    def test_message_too_large(self):
+        ring = RingBuffer(slots=2, slot_size=64)
+        with pytest.raises(AssertionError):
+            ring.put(Message(alert='x' * 100), _token(1))
+
+    def test_invalid_token(self):
+        ring = RingBuffer(slots=2)
+        with pytest.raises(ValueError):
+            ring.put(Message(), 'not a token')
+
+    def test_drain(self):
+        ring = RingBuffer(slots=4)
+        ring.put(Message(badge=1), _token(1))
+        client = Mock()
+        results = ring.drain(client, count=10)
+        assert results is client.push_many.return_value
+        notifications = client.push_many.call_args[0][0]
+        assert [t for _, t in notifications] == [DeviceToken(_token(1))]
+        assert ring.drain(client, timeout=0.01) == []
+
+    @pytest.mark.skipif(not hasattr(os, 'fork'), reason='requires fork')
+    def test_multiple_producers(self):
+        ring = RingBuffer(slots=16)
+        producers = [
+            multiprocessing.Process(target=_produce,
+                                    args=(ring, i * 100, 50))
+            for i in range(4)
+        ]
+        for p in producers:
+            p.start()
+
+        badges = []
+        while len(badges) < 200:
+            batch = ring.get_many(10, timeout=10)
+            assert batch
+            for message, token in batch:
+                badge = message.payload['aps']['badge']
+                assert token == DeviceToken(_token(badge))
+                badges.append(badge)
+        for p in producers:
+            p.join()
+
+        assert sorted(badges) == [i * 100 + j for i in range(4)
+                                  for j in range(50)]
+        # Each producer's messages stay in order
+        for i in range(4):
+            own = [b for b in badges if i * 100 <= b < i * 100 + 50]
+            assert own == sorted(own)
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import pytest
+from mock import Mock, patch
+
+from apns import Message
+from apns.router import Router
+
+CERTIFICATES = {
+    'com.example.a': {'certfile': 'a.pem', 'keyfile': 'a.key'},
+    'com.example.b': {'certfile': 'b.pem', 'keyfile': 'b.key'},
+    'com.example.c': {'certfile': 'c.pem', 'keyfile': 'c.key'},
+}
+
+
+@pytest.fixture
+def client_cls():
+    with patch('apns.router.Client') as cls:
+        cls.side_effect = lambda *args, **kwargs: Mock()
+        yield cls
+
+
+class TestRouter(object):
+    def test_lazy_client_creation(self, client_cls):
+        factory = Mock()
+        r = Router(CERTIFICATES, ssl_context_factory=factory)
+        assert len(r) == 0
+        assert not factory.called
+
+        client = r.client_for('com.example.a')
+        factory.assert_called_once_with(certfile='a.pem', keyfile='a.key')
+        assert r.client_for('com.example.a') is client
+        assert factory.call_count == 1
+        assert len(r) == 1
+
+    def test_evicts_least_recently_used(self, client_cls):
+        r = Router(CERTIFICATES, max_connections=2, ssl_context_factory=Mock())
+        a = r.client_for('com.example.a')
+        b = r.client_for('com.example.b')
+        r.client_for('com.example.a')
+        r.client_for('com.example.c')
+
+        assert len(r) == 2
+        assert b.close.called
+        assert not a.close.called
+        assert r.client_for('com.example.a') is a
+
+    def test_unknown_topic(self, client_cls):
+        r = Router(CERTIFICATES, ssl_context_factory=Mock())
+        with pytest.raises(KeyError):
+            r.client_for('com.example.unknown')
+
+    def test_push_routes_by_topic(self, client_cls):
+        r = Router(CERTIFICATES, ssl_context_factory=Mock())
+        m = Message(topic='com.example.b')
+        r.push(m, 'token')
+        r.client_for('com.example.b').push.assert_called_once_with(m, 'token')
+
+    def test_push_requires_topic(self, client_cls):
+        r = Router(CERTIFICATES, ssl_context_factory=Mock())
+        with pytest.raises(AssertionError):
+            r.push(Message(), 'token')
+
+    def test_close(self, client_cls):
+        r = Router(CERTIFICATES, ssl_context_factory=Mock())
+        a = r.client_for('com.example.a')
+        b = r.client_for('com.example.b')
+        r.close()
+        assert a.close.called and b.close.called
+        assert len(r) == 0
+
+    def test_does_not_evict_client_in_use(self, client_cls):
+        r = Router(CERTIFICATES, max_connections=2, ssl_context_factory=Mock())
+        a = r.acquire('com.example.a')
+        b = r.client_for('com.example.b')
+        r.client_for('com.example.c')
+
+        # b is idle, so it is evicted instead of the older a
+        assert b.close.called
+        assert not a.close.called
+        assert r.client_for('com.example.a') is a
+        r.release(a)
+
+    def test_close_deferred_until_release(self, client_cls):
+        r = Router(CERTIFICATES, max_connections=1, ssl_context_factory=Mock())
+        a = r.acquire('com.example.a')
+        assert r.acquire('com.example.a') is a
+        r.client_for('com.example.b')
+        assert len(r) == 1
+        assert not a.close.called
+
+        r.release(a)
+        assert not a.close.called
+        r.release(a)
+        assert a.close.called
+        assert r.client_for('com.example.a') is not a
+
+    def test_push_releases_client(self, client_cls):
+        r = Router(CERTIFICATES, max_connections=1, ssl_context_factory=Mock())
+        r.push(Message(topic='com.example.a'), 'token')
+        a = r.client_for('com.example.a')
+        a.push.side_effect = RuntimeError()
+        with pytest.raises(RuntimeError):
+            r.push(Message(topic='com.example.a'), 'token')
+        r.client_for('com.example.b')
+        assert a.close.called
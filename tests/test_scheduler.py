@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import pytest
+from mock import Mock
+
+from apns import Message, SendQueue, HIGH_PRIORITY, LOW_PRIORITY, \
+    EXPIRE_IMMEDIATELY
+
+
+def _fill(queue, priority, count, prefix):
+    for i in range(count):
+        queue.put(Message(priority=priority), '%s%d' % (prefix, i))
+
+
+class TestSendQueue(object):
+    def test_empty_get(self):
+        q = SendQueue()
+        assert len(q) == 0
+        assert not q
+        with pytest.raises(IndexError):
+            q.get()
+
+    def test_fifo_within_priority(self):
+        q = SendQueue()
+        _fill(q, LOW_PRIORITY, 3, 'low')
+        assert [token for _, token in q] == ['low0', 'low1', 'low2']
+        assert len(q) == 0
+
+    def test_high_priority_jumps_ahead(self):
+        q = SendQueue()
+        _fill(q, LOW_PRIORITY, 100, 'low')
+        q.put(Message(priority=HIGH_PRIORITY), 'alert')
+        tokens = [q.get()[1] for _ in range(2)]
+        assert 'alert' in tokens
+
+    def test_weighted_share(self):
+        q = SendQueue(weights={HIGH_PRIORITY: 3, LOW_PRIORITY: 1})
+        _fill(q, HIGH_PRIORITY, 300, 'high')
+        _fill(q, LOW_PRIORITY, 300, 'low')
+        first = [q.get()[1] for _ in range(40)]
+        lows = [t for t in first if t.startswith('low')]
+        assert len(lows) == 10
+        assert q.pending(HIGH_PRIORITY) == 270
+        assert q.pending(LOW_PRIORITY) == 290
+
+    def test_drains_remaining_priority(self):
+        q = SendQueue()
+        _fill(q, HIGH_PRIORITY, 1, 'high')
+        _fill(q, LOW_PRIORITY, 5, 'low')
+        assert len(list(q)) == 6
+
+    def test_idle_priority_does_not_accumulate_credit(self):
+        q = SendQueue(weights={HIGH_PRIORITY: 1, LOW_PRIORITY: 1})
+        _fill(q, HIGH_PRIORITY, 10, 'high')
+        for _ in range(10):
+            q.get()
+        _fill(q, HIGH_PRIORITY, 2, 'high')
+        _fill(q, LOW_PRIORITY, 2, 'low')
+        tokens = [token for _, token in q]
+        assert tokens[0].startswith('high')
+        assert tokens[1].startswith('low')
+
+    def test_put_checks_token(self):
+        q = SendQueue()
+        with pytest.raises(AssertionError):
+            q.put(Message(), '')
+
+    def test_put_unknown_priority(self):
+        q = SendQueue(weights={HIGH_PRIORITY: 1})
+        with pytest.raises(AssertionError):
+            q.put(Message(priority=LOW_PRIORITY), 'token')
+
+    def test_prune_expired(self):
+        clock = Mock(return_value=1000)
+        q = SendQueue(clock=clock)
+        q.put(Message(priority=LOW_PRIORITY, expiration=1500), 'soon')
+        q.put(Message(priority=LOW_PRIORITY, expiration=3000), 'later')
+        q.put(Message(priority=HIGH_PRIORITY, expiration=1200), 'sooner')
+        q.put(Message(priority=HIGH_PRIORITY), 'never')
+        assert q.prune() == 0
+
+        clock.return_value = 2000
+        assert q.prune() == 2
+        assert q.expired == 2
+        assert len(q) == 2
+        assert q.pending(HIGH_PRIORITY) == 1
+        assert sorted(token for _, token in q) == ['later', 'never']
+
+    def test_get_prunes(self):
+        clock = Mock(return_value=1000)
+        q = SendQueue(clock=clock)
+        q.put(Message(expiration=1500), 'expired')
+        q.put(Message(expiration=3000), 'valid')
+        clock.return_value = 2000
+        assert q.get()[1] == 'valid'
+        assert q.expired == 1
+        with pytest.raises(IndexError):
+            q.get()
+
+    def test_stale_after(self):
+        clock = Mock(return_value=1000)
+        q = SendQueue(stale_after=30, clock=clock)
+        q.put(Message(expiration=EXPIRE_IMMEDIATELY), 'stale')
+        clock.return_value = 1020
+        q.put(Message(expiration=EXPIRE_IMMEDIATELY), 'fresh')
+        clock.return_value = 1040
+        assert [token for _, token in q] == ['fresh']
+        assert q.expired == 1
+
+    def test_sent_messages_are_not_pruned(self):
+        clock = Mock(return_value=1000)
+        q = SendQueue(clock=clock)
+        q.put(Message(expiration=1500), 'sent')
+        q.get()
+        clock.return_value = 2000
+        assert q.prune() == 0
+        assert q.expired == 0
+
+    def test_coalesce_collapse_id(self):
+        q = SendQueue()
+        q.put(Message(badge=1), 'other')
+        for badge in (3, 4, 5):
+            q.put(Message(badge=badge, collapse_id='badge'), 'token')
+        q.put(Message(badge=1), 'last')
+
+        assert len(q) == 3
+        assert q.coalesced == 2
+        sent = [(m.badge, token) for m, token in q]
+        assert sent == [(1, 'other'), (5, 'token'), (1, 'last')]
+
+    def test_coalesce_is_per_token_and_collapse_id(self):
+        q = SendQueue()
+        q.put(Message(collapse_id='a'), 'token')
+        q.put(Message(collapse_id='b'), 'token')
+        q.put(Message(collapse_id='a'), 'other')
+        q.put(Message(), 'token')
+        q.put(Message(), 'token')
+        assert len(q) == 5
+        assert q.coalesced == 0
+
+    def test_coalesce_after_send(self):
+        q = SendQueue()
+        q.put(Message(badge=1, collapse_id='badge'), 'token')
+        q.get()
+        q.put(Message(badge=2, collapse_id='badge'), 'token')
+        assert len(q) == 1
+        assert q.coalesced == 0
+
+    def test_coalesce_changes_priority(self):
+        q = SendQueue()
+        q.put(Message(priority=LOW_PRIORITY, collapse_id='c'), 'token')
+        q.put(Message(priority=HIGH_PRIORITY, collapse_id='c'), 'token')
+        assert q.pending(LOW_PRIORITY) == 0
+        assert q.pending(HIGH_PRIORITY) == 1
+        assert [m.priority for m, _ in q] == [HIGH_PRIORITY]
+
+    def test_coalesce_updates_expiration(self):
+        clock = Mock(return_value=1000)
+        q = SendQueue(clock=clock)
+        q.put(Message(expiration=1500, collapse_id='c'), 'token')
+        q.put(Message(expiration=3000, collapse_id='c'), 'token')
+        clock.return_value = 2000
+        assert q.prune() == 0
+        assert len(q) == 1
+
+    def test_sent_messages_are_released(self):
+        clock = Mock(return_value=1000)
+        q = SendQueue(clock=clock)
+        for i in range(1000):
+            q.put(Message(expiration=1000 + 86400), 'token%d' % i)
+        assert len(q._deadlines) == 1000
+        for _ in range(990):
+            q.get()
+        assert len(q._deadlines) <= 2 * len(q)
+        held = [item for item in q._deadlines if item[2].message is not None]
+        assert len(held) == len(q)
+        list(q)
+        assert q._deadlines == []
+
+    def test_coalescing_does_not_grow_heap(self):
+        clock = Mock(return_value=1000)
+        q = SendQueue(clock=clock)
+        for i in range(1000):
+            q.put(Message(expiration=2000 + i, collapse_id='c'), 'token')
+        assert len(q) == 1
+        assert len(q._deadlines) <= 2
+        clock.return_value = 2500
+        assert q.prune() == 0
+        clock.return_value = 3000
+        assert q.prune() == 1
+
+    def test_replaced_priority_is_released(self):
+        q = SendQueue()
+        q.put(Message(priority=LOW_PRIORITY, collapse_id='c'), 'token')
+        old = q._queues[LOW_PRIORITY][0]
+        q.put(Message(priority=HIGH_PRIORITY, collapse_id='c'), 'token')
+        assert old.dead and old.message is None
@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import threading
+import uuid
+
+import pytest
+from mock import Mock
+
+from apns import Message
+from apns._compat import queue
+from apns.sender import Sender
+
+
+class BlockingClient(object):
+    """A client whose sends block until released."""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.streams = []
+
+    def push_stream(self, notifications, window):
+        sent = []
+        self.streams.append(sent)
+        for _, token in notifications:
+            self.release.wait(5)
+            sent.append(token)
+            yield token, uuid.UUID(int=0)
+
+
+class TestSender(object):
+    def test_sends_submitted_messages(self):
+        client = BlockingClient()
+        client.release.set()
+        callback = Mock()
+        sender = Sender(client, callback=callback)
+        for i in range(10):
+            sender.submit(Message(alert='test'), 'token%d' % i)
+        sender.close()
+
+        sent = [token for stream in client.streams for token in stream]
+        assert sent == ['token%d' % i for i in range(10)]
+        assert callback.call_count == 10
+        assert len(sender) == 0
+        assert sender.queued_bytes == 0
+
+    def test_blocks_when_message_limit_reached(self):
+        client = BlockingClient()
+        sender = Sender(client, max_messages=2, window=1)
+        m = Message(alert='test')
+        # One message is taken by the blocked sending thread
+        for token in ['a', 'b', 'c']:
+            sender.submit(m, token, timeout=1)
+        with pytest.raises(queue.Full):
+            sender.submit(m, 'd', timeout=0.05)
+        client.release.set()
+        sender.submit(m, 'd', timeout=1)
+        sender.close()
+
+    def test_blocks_when_byte_limit_reached(self):
+        client = BlockingClient()
+        m = Message(alert='test')
+        size = len(m.encoded)
+        sender = Sender(client, max_bytes=size * 2, window=1)
+        for token in ['a', 'b', 'c']:
+            sender.submit(m, token, timeout=1)
+        assert sender.queued_bytes == size * 2
+        with pytest.raises(queue.Full):
+            sender.submit(m, 'd', timeout=0.05)
+        client.release.set()
+        sender.close()
+
+    def test_oversized_message_accepted_when_empty(self):
+        client = BlockingClient()
+        client.release.set()
+        sender = Sender(client, max_bytes=1)
+        sender.submit(Message(alert='test'), 'token', timeout=1)
+        sender.close()
+        assert client.streams == [['token']]
+
+    def test_send_failure_reported_to_callback(self):
+        error = Exception('connection lost')
+
+        def push_stream(notifications, window):
+            for _ in notifications:
+                raise error
+            yield
+
+        client = Mock()
+        client.push_stream.side_effect = push_stream
+        callback = Mock()
+        sender = Sender(client, callback=callback)
+        sender.submit(Message(alert='test'), 'token')
+        sender.close()
+        callback.assert_called_once_with('token', error)
+
+    def test_queued_messages_share_a_stream(self):
+        client = BlockingClient()
+        sender = Sender(client, window=3)
+        tokens = ['token%d' % i for i in range(10)]
+        for token in tokens:
+            sender.submit(Message(alert='test'), token)
+        client.release.set()
+        sender.close()
+        assert client.streams == [tokens]
+
+    def test_failure_reports_pending_messages(self):
+        error = Exception('connection lost')
+
+        def push_stream(notifications, window):
+            for _, token in notifications:
+                if token == 'c':
+                    raise error
+                yield token, uuid.UUID(int=0)
+
+        client = Mock()
+        client.push_stream.side_effect = push_stream
+        callback = Mock()
+        sender = Sender(client, callback=callback)
+        m = Message(alert='test')
+        for token in ['a', 'b', 'c', 'd']:
+            sender.submit(m, token)
+        sender.close()
+        results = dict(call[0] for call in callback.call_args_list)
+        assert results['c'] is error
+        assert results['a'] == uuid.UUID(int=0)
+        assert results['d'] == uuid.UUID(int=0)
+
+    def test_submit_after_close(self):
+        sender = Sender(Mock())
+        sender.close()
+        with pytest.raises(AssertionError):
+            sender.submit(Message(alert='test'), 'token')
+
+    def test_submit_async(self):
+        asyncio = pytest.importorskip('asyncio')
+        client = BlockingClient()
+        sender = Sender(client, max_messages=1, window=1)
+        m = Message(alert='test')
+
+        loop = asyncio.new_event_loop()
+        try:
+            for token in ['a', 'b', 'c']:
+                future = sender.submit_async(m, token, loop=loop)
+                loop.call_later(0.01, client.release.set)
+                loop.run_until_complete(future)
+        finally:
+            loop.close()
+        sender.close()
+        sent = [token for stream in client.streams for token in stream]
+        assert sent == ['a', 'b', 'c']
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import pytest
+from mock import Mock
+
+from apns import Message, FrozenMessage, LOW_PRIORITY
+from apns.throttle import BackgroundThrottler, is_background
+
+
+def _silent(**extra):
+    return Message(content_available=True, priority=LOW_PRIORITY, **extra)
+
+
+class TestIsBackground(object):
+    def test_silent(self):
+        assert is_background(_silent())
+
+    @pytest.mark.parametrize('kwargs', [
+        {},
+        {'content_available': True, 'alert': 'hello'},
+        {'content_available': True, 'badge': 1},
+        {'content_available': True, 'sound': 'default'},
+    ])
+    def test_not_silent(self, kwargs):
+        assert not is_background(Message(**kwargs))
+
+
+class TestBackgroundThrottler(object):
+    def test_first_message_released_immediately(self):
+        t = BackgroundThrottler(window=60, clock=Mock(return_value=1000))
+        m = _silent()
+        t.submit(m, 'token')
+        assert t.release() == [(m, 'token')]
+        assert len(t) == 0
+
+    def test_one_per_window(self):
+        clock = Mock(return_value=1000)
+        t = BackgroundThrottler(window=60, clock=clock)
+        t.submit(_silent(), 'token')
+        t.release()
+
+        clock.return_value = 1010
+        t.submit(_silent(), 'token')
+        assert t.release() == []
+        assert t.next_release() == 1060
+
+        clock.return_value = 1060
+        assert len(t.release()) == 1
+
+    def test_superseded_messages_merge_extra(self):
+        clock = Mock(return_value=1000)
+        t = BackgroundThrottler(window=60, clock=clock)
+        t.submit(_silent(), 'token')
+        t.release()
+
+        t.submit(_silent(mail=1, feed=1), 'token')
+        t.submit(_silent(mail=2), 'token')
+        last = _silent(chat=1)
+        t.submit(last, 'token')
+        assert len(t) == 1
+        assert t.superseded == 2
+
+        clock.return_value = 1060
+        [(message, token)] = t.release()
+        assert token == 'token'
+        assert message.extra == {'mail': 2, 'feed': 1, 'chat': 1}
+        assert last.extra == {'chat': 1}
+
+    def test_merge_frozen_messages(self):
+        t = BackgroundThrottler(window=60, clock=Mock(return_value=1000))
+        t.submit(_silent(feed=1).freeze(), 'token')
+        t.submit(_silent(mail=1).freeze(), 'token')
+        [(message, _)] = t.release()
+        assert isinstance(message, FrozenMessage)
+        assert message.payload['feed'] == 1
+        assert message.payload['mail'] == 1
+
+    def test_tokens_are_independent(self):
+        t = BackgroundThrottler(window=60, clock=Mock(return_value=1000))
+        t.submit(_silent(), 'a')
+        t.submit(_silent(), 'b')
+        assert sorted(token for _, token in t.release()) == ['a', 'b']
+
+    def test_rejects_visible_messages(self):
+        t = BackgroundThrottler()
+        with pytest.raises(AssertionError):
+            t.submit(Message(alert='hello'), 'token')
+
+    def test_compact(self):
+        clock = Mock(return_value=1000)
+        t = BackgroundThrottler(window=60, clock=clock)
+        t.submit(_silent(), 'a')
+        t.release()
+        clock.return_value = 1030
+        t.submit(_silent(), 'b')
+        t.release()
+
+        clock.return_value = 1070
+        assert t.compact() == 1
+        t.submit(_silent(), 'a')
+        assert len(t.release()) == 1
+
+    def test_next_release_empty(self):
+        assert BackgroundThrottler().next_release() is None
@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import binascii
+import os
+
+import pytest
+from mock import patch
+
+from apns import DeviceToken, TokenArray, TokenSet, validate_tokens, \
+    filter_tokens
+
+HEX = 'a1' * 32
+RAW = binascii.unhexlify(HEX)
+
+
+def _random_tokens(count):
+    return [binascii.hexlify(os.urandom(32)).decode('ascii')
+            for _ in range(count)]
+
+
+class TestDeviceToken(object):
+    @pytest.mark.parametrize('value', [
+        HEX,
+        HEX.upper(),
+        HEX.encode('ascii'),
+        RAW,
+        bytearray(RAW),
+        memoryview(RAW),
+    ])
+    def test_create(self, value):
+        token = DeviceToken(value)
+        assert token == RAW
+        assert len(token) == 32
+        assert token.hex() == HEX
+        assert str(token) == HEX
+
+    def test_create_from_token(self):
+        token = DeviceToken(HEX)
+        assert DeviceToken(token) is token
+
+    @pytest.mark.parametrize('value', [
+        '',
+        None,
+        'a1' * 31,
+        'zz' * 32,
+        b'\x00' * 31,
+    ])
+    def test_invalid(self, value):
+        with pytest.raises(ValueError):
+            DeviceToken(value)
+
+    def test_path(self):
+        assert DeviceToken(RAW).path == '/3/device/' + HEX
+
+    def test_hashable(self):
+        assert len(set([DeviceToken(HEX), DeviceToken(RAW)])) == 1
+
+
+class TestTokenArray(object):
+    def test_append_and_index(self):
+        hexes = _random_tokens(5)
+        arr = TokenArray(hexes)
+        assert len(arr) == 5
+        assert arr[0].hex() == hexes[0]
+        assert arr[-1].hex() == hexes[-1]
+        with pytest.raises(IndexError):
+            arr[5]
+
+    def test_iteration(self):
+        hexes = _random_tokens(5)
+        arr = TokenArray(hexes)
+        assert [t.hex() for t in arr] == hexes
+        assert [v.tobytes() for v in arr.views()] == \
+            [binascii.unhexlify(h) for h in hexes]
+
+    def test_extend_from_array(self):
+        arr = TokenArray(_random_tokens(3))
+        other = TokenArray(arr)
+        other.extend(arr)
+        assert len(other) == 6
+        assert other.tobytes() == arr.tobytes() * 2
+
+    def test_invalid_token(self):
+        arr = TokenArray()
+        with pytest.raises(ValueError):
+            arr.append('abc')
+        assert len(arr) == 0
+
+
+class TestTokenSet(object):
+    def test_dedup(self):
+        hexes = _random_tokens(1000)
+        s = TokenSet(hexes + hexes[:100])
+        assert len(s) == 1000
+        assert [t.hex() for t in s] == hexes
+
+    def test_add(self):
+        s = TokenSet()
+        assert s.add(HEX)
+        assert not s.add(RAW)
+        assert not s.add(DeviceToken(HEX))
+        assert len(s) == 1
+
+    def test_contains(self):
+        hexes = _random_tokens(100)
+        s = TokenSet(hexes)
+        for h in hexes:
+            assert h in s
+            assert DeviceToken(h) in s
+        assert HEX not in s
+        assert 'not a token' not in s
+
+
+@pytest.fixture(params=['default', 'no-numpy'])
+def validator(request):
+    if request.param == 'no-numpy':
+        with patch('apns.tokens.numpy', None):
+            yield validate_tokens
+    else:
+        yield validate_tokens
+
+
+class TestValidateTokens(object):
+    def test_mask(self, validator):
+        tokens = [
+            HEX,
+            HEX.upper(),
+            HEX.encode('ascii'),
+            DeviceToken(HEX),
+            RAW,
+            '',
+            None,
+            'a1' * 31,
+            'a1' * 31 + 'zz',
+            'zz' + 'a1' * 31,
+            u'\u00e9' * 64,
+            12345,
+        ]
+        mask = validator(tokens)
+        assert list(mask) == [1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0, 0]
+
+    def test_many(self, validator):
+        tokens = _random_tokens(1000)
+        tokens[10] = tokens[10][:-1] + 'g'
+        tokens[500] = tokens[500][:-2]
+        mask = validator(tokens)
+        assert mask.count(0) == 2
+        assert mask[10] == 0 and mask[500] == 0
+
+    def test_empty(self, validator):
+        assert validator([]) == bytearray()
+
+    def test_filter_tokens(self):
+        good, bad = filter_tokens([HEX, 'bad', RAW, None])
+        assert good == [HEX, RAW]
+        assert bad == ['bad', None]
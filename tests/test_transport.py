@@ -0,0 +1,557 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import datetime
+import json
+import socket
+import ssl
+import threading
+import time
+
+import pytest
+from mock import Mock
+
+from apns import Client, Message
+from apns.transport import Transport, Response, H2Transport, Resolver, \
+    DEFAULT_TRANSPORT
+from apns.transport.h2_transport import _sendmsg_all
+
+h2 = pytest.importorskip('h2')
+from h2.config import H2Configuration  # noqa
+from h2.connection import H2Connection  # noqa
+from h2.events import DataReceived, RequestReceived, StreamEnded  # noqa
+from hyperframe.frame import GoAwayFrame  # noqa
+
+APNS_ID = 'c0ffee00-0000-4000-8000-000000000001'
+
+
+class FakeGateway(object):
+    """A minimal HTTP/2 server answering requests with ``handler``, which is
+    called with the path and body of each request and returns a status and
+    a body, or ``None`` to never respond. ``settings`` are sent to the client
+    on connect. The connection uses TLS if an ``ssl_context`` is given.
+
+    A request to the ``goaway`` token is answered with a GOAWAY frame naming
+    it as the last processed stream. Up to ``connections`` connections are
+    served one after the other.
+    """
+    def __init__(self, handler, settings=None, ssl_context=None,
+                 connections=1):
+        self.handler = handler
+        self.settings = settings
+        self.ssl_context = ssl_context
+        self.connections = connections
+        self.requests = []
+        self.resets = []
+        self.conn = None
+        self._listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._listener.bind(('127.0.0.1', 0))
+        self._listener.listen(1)
+        self.port = self._listener.getsockname()[1]
+        self._thread = threading.Thread(target=self._serve)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _serve(self):
+        for _ in range(self.connections):
+            sock, _ = self._listener.accept()
+            try:
+                if self.ssl_context is not None:
+                    sock = self.ssl_context.wrap_socket(sock,
+                                                        server_side=True)
+                self._handle(sock)
+            except ssl.SSLError:
+                # The client rejected the certificate
+                pass
+            finally:
+                sock.close()
+
+    def _handle(self, sock):
+        conn = H2Connection(config=H2Configuration(client_side=False,
+                                                   header_encoding=None))
+        self.conn = conn
+        conn.initiate_connection()
+        if self.settings:
+            conn.update_settings(self.settings)
+        sock.sendall(conn.data_to_send())
+        paths = {}
+        bodies = {}
+        self._goaway = b''
+        while True:
+            data = sock.recv(65536)
+            if not data:
+                break
+            for event in conn.receive_data(data):
+                if isinstance(event, RequestReceived):
+                    headers = dict(event.headers)
+                    paths[event.stream_id] = headers[b':path'].decode()
+                    bodies[event.stream_id] = b''
+                elif isinstance(event, DataReceived):
+                    bodies[event.stream_id] += event.data
+                    conn.acknowledge_received_data(
+                        event.flow_controlled_length, event.stream_id)
+                elif isinstance(event, StreamEnded):
+                    self._respond(conn, event.stream_id,
+                                  paths[event.stream_id],
+                                  bodies.pop(event.stream_id))
+                elif type(event).__name__ == 'StreamReset':
+                    self.resets.append(event.stream_id)
+            sock.sendall(conn.data_to_send() + self._goaway)
+            self._goaway = b''
+
+    def _respond(self, conn, stream_id, path, body):
+        self.requests.append((path, body))
+        if path.endswith('/goaway'):
+            frame = GoAwayFrame(0)
+            frame.last_stream_id = stream_id
+            self._goaway = frame.serialize()
+            return
+        response = self.handler(path, body)
+        if response is None:
+            return
+        status, data = response
+        conn.send_headers(stream_id, [
+            (':status', str(status)),
+            ('apns-id', APNS_ID),
+        ], end_stream=not data)
+        if data:
+            conn.send_data(stream_id, data, end_stream=True)
+
+    def close(self):
+        self._listener.close()
+
+
+def handler(path, body):
+    token = path.rsplit('/', 1)[1]
+    if token == 'bad':
+        return 400, b'{"reason": "BadDeviceToken"}'
+    if token == 'slow':
+        return None
+    return 200, b''
+
+
+@pytest.fixture
+def gateway():
+    gateway = FakeGateway(handler)
+    yield gateway
+    gateway.close()
+
+
+@pytest.fixture
+def certificate(tmpdir):
+    """A self-signed certificate and its key, as PEM file paths."""
+    x509 = pytest.importorskip('cryptography.x509')
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+    from cryptography.x509.oid import NameOID
+
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, u'localhost')])
+    now = datetime.datetime.utcnow()
+    cert = x509.CertificateBuilder().subject_name(name).issuer_name(name) \
+        .public_key(key.public_key()).serial_number(1) \
+        .not_valid_before(now - datetime.timedelta(days=1)) \
+        .not_valid_after(now + datetime.timedelta(days=1)) \
+        .add_extension(x509.SubjectAlternativeName(
+            [x509.DNSName(u'localhost')]), critical=False) \
+        .sign(key, hashes.SHA256())
+
+    certfile = tmpdir.join('cert.pem')
+    certfile.write_binary(cert.public_bytes(serialization.Encoding.PEM))
+    keyfile = tmpdir.join('key.pem')
+    keyfile.write_binary(key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.TraditionalOpenSSL,
+        serialization.NoEncryption(),
+    ))
+    return str(certfile), str(keyfile)
+
+
+@pytest.fixture
+def tls_gateway(certificate):
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(*certificate)
+    context.set_alpn_protocols(['h2'])
+    gateway = FakeGateway(handler, ssl_context=context)
+    yield gateway
+    gateway.close()
+
+
+@pytest.fixture
+def transport(gateway):
+    transport = H2Transport('127.0.0.1', gateway.port, None)
+    yield transport
+    transport.close()
+
+
+class TestTransport(object):
+    def test_response(self):
+        res = Response(200, {'apns-id': [APNS_ID]}, b'body')
+        assert res.read() == b'body'
+
+    def test_default_transport(self):
+        assert DEFAULT_TRANSPORT is H2Transport
+
+    def test_client_uses_transport(self):
+        transport_cls = Mock()
+        c = Client(None, sandbox=False, transport=transport_cls)
+        transport_cls.assert_called_once_with(c.host, c.port, None)
+        assert c._connection is transport_cls.return_value
+
+    def test_client_transport_options(self):
+        transport_cls = Mock()
+        c = Client(None, transport=transport_cls,
+                   transport_options={'initial_window_size': 1000})
+        transport_cls.assert_called_once_with(c.host, c.port, None,
+                                              initial_window_size=1000)
+
+    def test_base_is_abstract(self):
+        t = Transport('localhost', 443, None)
+        with pytest.raises(NotImplementedError):
+            t.request('POST', '/')
+        assert not t.is_complete(1)
+
+
+class TestH2Transport(object):
+    def test_lazy_connect(self):
+        t = H2Transport('localhost', 1, None)
+        assert t._sock is None
+        t.close()
+
+    def test_request(self, gateway, transport):
+        body = json.dumps({'aps': {'alert': 'testing'}}).encode()
+        stream_id = transport.request('POST', '/3/device/abcd', body=body,
+                                      headers={'apns-topic': 'com.example'})
+        response = transport.get_response(stream_id)
+        assert response.status == 200
+        assert response.headers['apns-id'] == [APNS_ID]
+        assert gateway.requests == [('/3/device/abcd', body)]
+
+    def test_memoryview_body(self, gateway, transport):
+        buf = bytearray(b'--{"aps":{}}--')
+        stream_id = transport.request('POST', '/3/device/ok',
+                                      body=memoryview(buf)[2:-2])
+        assert transport.get_response(stream_id).status == 200
+        assert gateway.requests == [('/3/device/ok', b'{"aps":{}}')]
+
+    def test_large_body(self, gateway, transport):
+        body = b'x' * 40000
+        stream_id = transport.request('POST', '/3/device/ok', body=body)
+        assert transport.get_response(stream_id).status == 200
+        assert gateway.requests == [('/3/device/ok', body)]
+
+    def test_window_sizes(self, gateway):
+        transport = H2Transport('127.0.0.1', gateway.port, None,
+                                initial_window_size=200000,
+                                connection_window_size=1000000)
+        stream_id = transport.request('POST', '/3/device/ok', body=b'{}')
+        assert transport.get_response(stream_id).status == 200
+        # The gateway may send this much before waiting for WINDOW_UPDATE
+        assert gateway.conn.remote_settings.initial_window_size == 200000
+        assert gateway.conn.outbound_flow_control_window == 1000000
+        transport.close()
+
+    def test_waits_for_connection_window(self):
+        t = H2Transport('localhost', 443, None, flush_interval=None)
+        t._sock = Mock(spec=['sendall', 'settimeout', 'close'])
+        t._conn = conn = Mock()
+        conn.data_to_send.return_value = b''
+        conn.open_outbound_streams = 1
+        conn.remote_settings.max_concurrent_streams = 100
+        conn.outbound_flow_control_window = 10
+        conn.local_flow_control_window.return_value = 10000
+        conn.max_outbound_frame_size = 16384
+        conn.get_next_available_stream_id.side_effect = [3, 5]
+        t._streams[1] = Mock(complete=False)
+
+        def read(timeout=None):
+            # A WINDOW_UPDATE frame arrives
+            conn.outbound_flow_control_window = 5000
+            assert not conn.send_headers.called
+        t._read = Mock(side_effect=read)
+
+        t.request('POST', '/3/device/ok', body=b'x' * 1000)
+        assert t._read.call_count == 1
+        assert conn.send_headers.called
+
+        # Without requests in flight, the request is sent without waiting
+        t._streams.clear()
+        conn.outbound_flow_control_window = 10
+        t.request('POST', '/3/device/ok', body=b'x' * 1000)
+        assert t._read.call_count == 1
+
+    def test_large_bodies_in_flight(self, gateway):
+        transport = H2Transport('127.0.0.1', gateway.port, None,
+                                flush_interval=None)
+        body = b'x' * 40000
+        stream_ids = [transport.request('POST', '/3/device/ok', body=body)
+                      for _ in range(5)]
+        for stream_id in stream_ids:
+            assert transport.get_response(stream_id).status == 200
+        assert gateway.requests == [('/3/device/ok', body)] * 5
+        transport.close()
+
+    def test_error_body(self, gateway, transport):
+        stream_id = transport.request('POST', '/3/device/bad', body=b'{}')
+        response = transport.get_response(stream_id)
+        assert response.status == 400
+        assert json.loads(response.read().decode()) == \
+            {'reason': 'BadDeviceToken'}
+
+    def test_many_streams(self, gateway):
+        transport = H2Transport('127.0.0.1', gateway.port, None,
+                                flush_interval=None)
+        stream_ids = [
+            transport.request('POST', '/3/device/t%d' % i, body=b'{}')
+            for i in range(20)
+        ]
+        assert len(set(stream_ids)) == 20
+        # Nothing is written until a response is waited for
+        assert gateway.requests == []
+        for stream_id in reversed(stream_ids):
+            assert transport.get_response(stream_id).status == 200
+        assert len(gateway.requests) == 20
+        transport.close()
+
+    @pytest.mark.parametrize('flush_interval', [None, 0.0005])
+    def test_max_concurrent_streams(self, flush_interval):
+        # SETTINGS_MAX_CONCURRENT_STREAMS
+        gateway = FakeGateway(handler, settings={0x3: 2})
+        transport = H2Transport('127.0.0.1', gateway.port, None,
+                                flush_interval=flush_interval)
+        # Receive the settings of the gateway
+        transport.get_response(
+            transport.request('POST', '/3/device/ok', body=b'{}'))
+
+        stream_ids = []
+
+        def send():
+            for i in range(5):
+                stream_ids.append(transport.request(
+                    'POST', '/3/device/t%d' % i, body=b'{}'))
+
+        thread = threading.Thread(target=send)
+        thread.daemon = True
+        thread.start()
+        thread.join(5)
+        assert not thread.is_alive(), 'request() blocked'
+        for stream_id in stream_ids:
+            assert transport.get_response(stream_id, timeout=5).status == 200
+        assert len(gateway.requests) == 6
+        transport.close()
+        gateway.close()
+
+    def test_flush_interval(self, gateway):
+        transport = H2Transport('127.0.0.1', gateway.port, None,
+                                flush_interval=0.001)
+        stream_id = transport.request('POST', '/3/device/ok', body=b'{}')
+        # The request is written by the flusher without waiting for the
+        # response
+        for _ in range(500):
+            if gateway.requests:
+                break
+            time.sleep(0.01)
+        assert gateway.requests == [('/3/device/ok', b'{}')]
+        assert transport.get_response(stream_id).status == 200
+
+        flusher = transport._flusher
+        transport.close()
+        flusher.join(1)
+        assert not flusher.is_alive()
+
+    def test_buffer_size_triggers_write(self):
+        t = H2Transport('localhost', 443, None, write_buffer_size=100,
+                        flush_interval=None)
+        t._sock = sock = Mock(spec=['sendmsg', 'settimeout', 'close'])
+        sock.sendmsg.side_effect = lambda chunks: sum(len(c) for c in chunks)
+        t._conn = conn = Mock()
+        conn.data_to_send.side_effect = [b'a' * 60, b'b' * 60, b'']
+        t._buffer()
+        assert not sock.sendmsg.called
+        t._buffer()
+        chunks = sock.sendmsg.call_args[0][0]
+        assert [c.tobytes() for c in chunks] == [b'a' * 60, b'b' * 60]
+
+    def test_partial_sendmsg(self):
+        written = []
+
+        def sendmsg(chunks):
+            # Accept at most 5 bytes per call
+            data = b''.join(c.tobytes() for c in chunks)[:5]
+            written.append(data)
+            return len(data)
+
+        sock = Mock()
+        sock.sendmsg.side_effect = sendmsg
+        _sendmsg_all(sock, [b'abc', b'defgh', b'ij'])
+        assert written == [b'abcde', b'fghij']
+
+    def test_sendall_without_sendmsg(self):
+        t = H2Transport('localhost', 443, None, flush_interval=None)
+        t._sock = sock = Mock(spec=['sendall', 'settimeout', 'close'])
+        t._conn = conn = Mock()
+        t._outbound = [b'abc']
+        conn.data_to_send.return_value = b'def'
+        t._write()
+        sock.sendall.assert_called_once_with(b'abcdef')
+
+    def test_timeout_and_reset(self, gateway, transport):
+        stream_id = transport.request('POST', '/3/device/slow', body=b'{}')
+        with pytest.raises(socket.timeout):
+            transport.get_response(stream_id, timeout=0.05)
+        assert not transport.is_complete(stream_id)
+        transport.reset(stream_id)
+
+        # The connection is still usable
+        stream_id = transport.request('POST', '/3/device/ok', body=b'{}')
+        assert transport.get_response(stream_id, timeout=5).status == 200
+        assert gateway.resets == [1]
+
+    def test_goaway(self):
+        gateway = FakeGateway(handler, connections=2)
+        transport = H2Transport('127.0.0.1', gateway.port, None,
+                                flush_interval=None)
+        done_id = transport.request('POST', '/3/device/ok', body=b'{}')
+        assert transport.get_response(done_id).status == 200
+        old_id = transport.request('POST', '/3/device/goaway', body=b'{}')
+        transport._write()
+        while not transport._terminated:
+            transport._read()
+        # Requests in flight fail instead of waiting forever
+        assert transport.is_complete(old_id)
+
+        # The new connection starts over at stream 1, with a different ID
+        new_id = transport.request('POST', '/3/device/ok', body=b'{}')
+        assert new_id not in (done_id, old_id)
+        assert new_id & 0xffffffff == done_id
+        assert transport.get_response(new_id, timeout=5).status == 200
+        with pytest.raises(socket.error):
+            transport.get_response(old_id)
+        transport.close()
+        gateway.close()
+
+    def test_close_fails_pending_streams(self, gateway, transport):
+        done_id = transport.request('POST', '/3/device/ok', body=b'{}')
+        pending_id = transport.request('POST', '/3/device/slow', body=b'{}')
+        transport._write()
+        while not transport.is_complete(done_id):
+            transport._read()
+        transport.close()
+        assert transport.get_response(done_id).status == 200
+        with pytest.raises(socket.error):
+            transport.get_response(pending_id)
+
+    def test_poll(self, gateway, transport):
+        stream_id = transport.request('POST', '/3/device/ok', body=b'{}')
+        transport.get_response(
+            transport.request('POST', '/3/device/ok', body=b'{}'))
+        transport.poll()
+        assert transport.is_complete(stream_id)
+
+    def test_ossl_context(self, tls_gateway, certificate):
+        openssl = pytest.importorskip('apns.ssl_context.openssl')
+        certfile, keyfile = certificate
+        context = openssl.make_ossl_context(certfile=certfile,
+                                            keyfile=keyfile)
+        transport = H2Transport('127.0.0.1', tls_gateway.port, context)
+        transport.connect()
+        assert isinstance(transport._sock, openssl.SSLSocket)
+        assert transport._sock.selected_alpn_protocol() == 'h2'
+        assert not transport.resolver.is_quarantined(transport.address)
+
+        stream_id = transport.request('POST', '/3/device/ok', body=b'{}')
+        assert transport.get_response(stream_id, timeout=5).status == 200
+        stream_id = transport.request('POST', '/3/device/slow', body=b'{}')
+        with pytest.raises(socket.timeout):
+            transport.get_response(stream_id, timeout=0.05)
+        transport.poll()
+        transport.close()
+
+    @pytest.mark.parametrize('host, verify, error', [
+        ('localhost', True, None),
+        ('example.com', True, ssl.CertificateError),
+        ('localhost', False, ssl.SSLError),
+    ])
+    def test_ossl_verification(self, tls_gateway, certificate, host, verify,
+                               error):
+        openssl = pytest.importorskip('apns.ssl_context.openssl')
+        pytest.importorskip('service_identity')
+        certfile, keyfile = certificate
+        context = openssl.make_ossl_context(certfile=certfile,
+                                            keyfile=keyfile)
+        if verify:
+            context.load_verify_locations(cafile=certfile)
+        context.check_hostname = True
+        assert context.verify_mode == ssl.CERT_REQUIRED
+        resolver = Resolver(resolve=lambda host, port: [
+            (socket.AF_INET, ('127.0.0.1', tls_gateway.port))
+        ])
+        transport = H2Transport(host, tls_gateway.port, context,
+                                resolver=resolver)
+        if error is not None:
+            with pytest.raises(error):
+                transport.connect()
+            return
+        transport.connect()
+        cert = transport._sock.getpeercert()
+        assert cert['subject'] == ((('commonName', 'localhost'),),)
+        assert cert['subjectAltName'] == (('DNS', 'localhost'),)
+        stream_id = transport.request('POST', '/3/device/ok', body=b'{}')
+        assert transport.get_response(stream_id, timeout=5).status == 200
+        transport.close()
+
+    def test_resolver(self, gateway):
+        resolver = Resolver(resolve=lambda host, port: [
+            (socket.AF_INET, ('127.0.0.1', gateway.port))
+        ])
+        transport = H2Transport('api.push.apple.com', 443, None,
+                                resolver=resolver)
+        stream_id = transport.request('POST', '/3/device/ok', body=b'{}')
+        assert transport.get_response(stream_id).status == 200
+        assert transport.address == ('127.0.0.1', gateway.port)
+        assert resolver._connections == {transport.address: 1}
+        transport.close()
+        assert transport.address is None
+        assert resolver._connections == {}
+
+    def test_client(self, gateway):
+        c = Client(None, transport=H2Transport)
+        c._connection = H2Transport('127.0.0.1', gateway.port, None)
+        m = Message(alert='testing')
+        results = c.push_many([(m, 'ok'), (m, 'bad'), (m, 'ok')])
+        assert [str(r) for _, r in results[::2]] == [APNS_ID, APNS_ID]
+        assert results[1][1].token == 'bad'
+        c.close()
+
+
+class TestHyperTransport(object):
+    def test_delegates_to_hyper(self, monkeypatch):
+        hyper_transport = pytest.importorskip('apns.transport.hyper_transport')
+        con = Mock()
+        con.streams = {1: Mock(response_headers={})}
+        monkeypatch.setattr(hyper_transport, 'HTTP20Connection',
+                            Mock(return_value=con))
+        t = hyper_transport.HyperTransport('localhost', 443, None)
+
+        assert t.request('POST', '/', body=b'{}') is con.request.return_value
+        assert t.is_complete(1)
+        assert not t.is_complete(2)
+        t.get_response(1, timeout=1)
+        con.get_response.assert_called_once_with(1)
+        t.reset(1)
+        con._send_rst_frame.assert_called_once_with(1, 0x8)
+
+    def test_ossl_context(self, tls_gateway, certificate):
+        hyper_transport = pytest.importorskip('apns.transport.hyper_transport')
+        openssl = pytest.importorskip('apns.ssl_context.openssl')
+        certfile, keyfile = certificate
+        context = openssl.make_ossl_context(certfile=certfile,
+                                            keyfile=keyfile)
+        t = hyper_transport.HyperTransport('127.0.0.1', tls_gateway.port,
+                                           context)
+        stream_id = t.request('POST', '/3/device/ok', body=b'{}')
+        response = t.get_response(stream_id, timeout=5)
+        assert response.status == 200
+        stream_id = t.request('POST', '/3/device/bad', body=b'{}')
+        assert t.get_response(stream_id).status == 400
+        t.close()